@@ -22,8 +22,10 @@ from pp.src.PP_Controller import PP_Controller
 from ftg.ftg import FTG
 from single_track_mpc import Single_track_MPC_Controller
 from kinematic_mpc import Kinematic_MPC_Controller
-from pbl_config import (CarConfig, KMPCConfig, PacejkaTireConfig, STMPCConfig,
-                        load_car_config_ros, load_KMPC_config_ros,
+from wpnt_conversion.wpnt_array import wpnt_columns, wpnts_from_buffer
+from pbl_config import (CarConfig, FTGConfig, FTGConfigDyn, KMPCConfig,
+                        PacejkaTireConfig, STMPCConfig, load_car_config_ros,
+                        load_FTG_config_ros, load_KMPC_config_ros,
                         load_pacejka_tire_config_ros, load_STMPC_config_ros,
                         load_trailing_config_ros, TrailingConfig)
 #TODO kmpc
@@ -134,7 +136,8 @@ class Controller_manager:
 
 
         # FTG
-        self.ftg_controller = FTG()
+        self.ftg_config: FTGConfig = load_FTG_config_ros(self.racecar_version)
+        self.ftg_controller = FTG(self.ftg_config)
         #  initialize MAP controller
         self.map_controller = MAP_Controller(
             self.t_clip_min, 
@@ -220,7 +223,8 @@ class Controller_manager:
         elif self.ctrl_algo == "KMPC":
             self.kmpc_config: KMPCConfig = load_KMPC_config_ros(self.racecar_version)
             # dyn reconfigure client
-            self.kmpc_controller = Kinematic_MPC_Controller(self.racecar_version, self.kmpc_config, self.car_config, self.trailing_config)
+            self.kmpc_controller = Kinematic_MPC_Controller(self.racecar_version, self.kmpc_config, self.car_config,
+                                                            self.trailing_config, controller_frequency=self.loop_rate)
             self.mpc_dyn_rec_client = Client("/mpc_param_tuner", config_callback=self.kmpc_config_cb)
             self.compute_time = 0  # init mpc compute time
 
@@ -243,13 +247,14 @@ class Controller_manager:
         # Subscribers
         rospy.Subscriber('/car_state/odom', Odometry, self.odom_cb) # car speed
         rospy.Subscriber('/car_state/pose', PoseStamped, self.car_state_cb) # car position (x, y, theta)
-        rospy.Subscriber('/local_waypoints', WpntArray, self.local_waypoint_cb) # waypoints (x, y, v, norm trackbound, s, kappa)
+        rospy.Subscriber('/local_waypoints', rospy.AnyMsg, self.local_waypoint_cb) # serialized WpntArray, waypoints (x, y, v, norm trackbound, s, kappa)
         rospy.Subscriber('/vesc/sensors/imu/raw', Imu, self.imu_cb) # acceleration subscriber for steer change
         rospy.Subscriber('/car_state/odom_frenet', Odometry, self.car_state_frenet_cb) # car frenet coordinates
         rospy.Subscriber("/l1_param_tuner/parameter_updates", Config, self.l1_params_cb) #l1 param tuning/updating
         rospy.Subscriber("/perception/obstacles", ObstacleArray, self.obstacle_cb)
         rospy.Subscriber("/state_machine", String, self.state_cb)
         rospy.Subscriber("/scan", LaserScan, self.scan_cb)
+        rospy.Subscriber("/ftg_param_tuner/parameter_updates", Config, self.ftg_config_cb) # ftg param tuning/updating
 
         self.converter = FrenetConverter(self.waypoints[:, 0], self.waypoints[:, 1])
         rospy.loginfo(f"[{self.name}] initialized FrenetConverter object")
@@ -257,7 +262,8 @@ class Controller_manager:
     def init_mapping(self):
         rospy.logwarn(f"[{self.name}] Initializing for mapping")
         # Use FTG for mapping
-        self.ftg_controller = FTG(mapping=False)
+        self.ftg_config: FTGConfig = load_FTG_config_ros(rospy.get_param('/racecar_version', 'DEFAULT'))
+        self.ftg_controller = FTG(self.ftg_config, mapping=False)
         
         # Publisher
         self.publish_topic = '/vesc/high_level/ackermann_cmd_mux/input/nav_1'
@@ -266,6 +272,7 @@ class Controller_manager:
         # Subscribers
         rospy.Subscriber('/car_state/odom', Odometry, self.odom_mapping_cb) # car speed
         rospy.Subscriber("/scan", LaserScan, self.scan_cb)
+        rospy.Subscriber("/ftg_param_tuner/parameter_updates", Config, self.ftg_config_cb) # ftg param tuning/updating
         
         
         rospy.loginfo(f"[{self.name}] initialized for mapping")
@@ -377,21 +384,9 @@ class Controller_manager:
         self.position_in_map_frenet = np.array([s,d,vs,vd])
         self.alpha = data.pose.pose.orientation.z
 
-    def local_waypoint_cb(self, data: WpntArray):
-        self.waypoint_list_in_map = []
-        for waypoint in data.wpnts:
-            waypoint_in_map = [waypoint.x_m, waypoint.y_m]
-            speed = waypoint.vx_mps
-
-            self.waypoint_list_in_map.append([waypoint_in_map[0],
-                                              waypoint_in_map[1],
-                                              speed,
-                                              waypoint.d_m,
-                                              waypoint.s_m,
-                                              waypoint.kappa_radpm,
-                                              waypoint.psi_rad,
-                                              waypoint.ax_mps2])
-        self.waypoint_array_in_map = np.array(self.waypoint_list_in_map)
+    def local_waypoint_cb(self, data: rospy.AnyMsg):
+        # decode the serialized WpntArray directly into the columns x, y, v, d, s, kappa, psi, ax
+        self.waypoint_array_in_map = wpnt_columns(wpnts_from_buffer(data._buff))
         self.waypoint_safety_counter = 0
 
     def imu_cb(self, data):
@@ -409,6 +404,17 @@ class Controller_manager:
 
         self.stmpc_controller.stmpc_config = self.stmpc_config
 
+    def ftg_config_cb(self, params: Config):
+        """
+        Here the ftg parameters are updated if changed with rqt (dyn reconfigure)
+        Values from .yaml file are set in ftg_online_params_server
+        """
+        for param in params.ints + params.doubles:
+            if param.name in FTGConfigDyn.model_fields:
+                setattr(self.ftg_config, param.name, param.value)
+
+        self.ftg_controller.ftg_config = self.ftg_config
+
     def kmpc_config_cb(self, params: Config):
         """
         Here the mpc parameters are updated if changed with rqt (dyn reconfigure)
@@ -601,7 +607,9 @@ class Controller_manager:
             self.track_length,
             0) # TODO currently compute time not used
         speed, acceleration, jerk, steering_angle, states, status= d
-        if status != 0: #Solver failed
+        if status != 0 and self.stmpc_controller.fallback_active:
+            rospy.logwarn_throttle(0.5, f"[{self.name}] Solver failed with {status = }, following the last solution")
+        elif status != 0: #Solver failed
             rospy.logerr(f"[{self.name}] Solver failed with {status = }, stopping")
             return 0, 0, 0, 0
 
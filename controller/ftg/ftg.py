@@ -2,44 +2,35 @@
 import math
 import numpy as np
 import rospy
+from geometry_msgs.msg import Point
+from pbl_config import FTGConfig
 from visualization_msgs.msg import Marker, MarkerArray
 
 
 class FTG:
-    DEBUG = rospy.get_param('/state_machine/debug')
-    #Lidar processing params
-    PREPROCESS_CONV_SIZE = 3
-    SAFETY_RADIUS = rospy.get_param('/state_machine/safety_radius')
-    MAX_LIDAR_DIST = rospy.get_param('/state_machine/max_lidar_dist')
-
-    # Speed params
-    MAX_SPEED = rospy.get_param('/state_machine/max_speed', 1.5)
-    scale = 0.6  # .575 is  max
-    CORNERS_SPEED = 0.3 * MAX_SPEED * scale
-    MILD_CORNERS_SPEED = 0.45 * MAX_SPEED * scale
-    STRAIGHTS_SPEED = 0.8 * MAX_SPEED * scale
-    ULTRASTRAIGHTS_SPEED = MAX_SPEED * scale
-    
     #Steering params
     STRAIGHTS_STEERING_ANGLE = np.pi / 18  # 10 degrees
     MILD_CURVE_ANGLE = np.pi / 6  # 30 degrees
     ULTRASTRAIGHTS_ANGLE = np.pi / 60  # 3 deg
 
-    def __init__(self, mapping=False) -> None:
+    def __init__(self, ftg_config: FTGConfig, mapping=False) -> None:
         """
         Initialize the FTG controller.
 
         Parameters:
+            ftg_config (FTGConfig): Tuning parameters, kept by reference such that dynamic reconfigure updates
+                apply from the next scan on.
             mapping (bool): Flag indicating whether FTG is used for mapping or not.
         """
+        self.ftg_config = ftg_config
         self.mapping = mapping
         
         self.radians_per_elem = None # used when calculating the angles of the LiDAR data
-        self.range_offset = rospy.get_param('/state_machine/range_offset')
-        self.track_width = rospy.get_param('/state_machine/track_width', 2.0)
 
         self.velocity = 0
         self.scan = None
+        self.last_debug_time = -np.inf
+        self.debug_markers_due = False
 
         self.best_pnt = rospy.Publisher('/best_points/marker', Marker, queue_size=10)
         self.scan_pub = rospy.Publisher('/scan_proc/markers', MarkerArray, queue_size=10)
@@ -63,11 +54,13 @@ class FTG:
         # we won't use the LiDAR data from directly behind us
         # full angle is -135 135
         # every point in the array is
-        proc_ranges = np.array(ranges[self.range_offset:-self.range_offset])
+        range_offset = self.ftg_config.range_offset
+        conv_size = self.ftg_config.preprocess_conv_size
+        proc_ranges = np.array(ranges[range_offset:-range_offset])
         # sets each value to the mean over a given window to smoothen the signal
-        proc_ranges = np.convolve(proc_ranges, np.ones(self.PREPROCESS_CONV_SIZE)/self.PREPROCESS_CONV_SIZE, 'valid') 
+        proc_ranges = np.convolve(proc_ranges, np.ones(conv_size)/conv_size, 'valid') 
         # clip the ranges between 0 and your maximum lidar distance
-        proc_ranges = np.clip(proc_ranges, 0, self.MAX_LIDAR_DIST)
+        proc_ranges = np.clip(proc_ranges, 0, self.ftg_config.max_lidar_dist)
         # reverse lidar because it is right to left
         return proc_ranges[::-1]
 
@@ -102,37 +95,20 @@ class FTG:
         
         #Find the largest gap
         gap_left, gap_right = self._find_largest_gap(ranges=proc_ranges, radius=radius)
-        gap_left += self.range_offset - 180
-        gap_right += self.range_offset - 180
+        gap_left += self.ftg_config.range_offset - 180
+        gap_right += self.ftg_config.range_offset - 180
         gap_middle = int((gap_right + gap_left) / 2)
         #Calculate cartesian point of the best point position from the lidar measurements in laser frame
         best_y = np.cos(gap_middle * self.radians_per_elem) * radius
         best_x = np.sin(gap_middle * self.radians_per_elem) * radius
         
-        if self.DEBUG:
-            #Delete old gaps from RVIZ
-            self._delete_gap_markers()
-
-            #Visualise the gap
-            gap_markers = MarkerArray()
-            for i in range(gap_left, gap_right):
-                mrk = Marker()
-                mrk.header.frame_id = 'laser'
-                mrk.header.stamp = rospy.Time.now()
-                mrk.type = mrk.SPHERE
-                mrk.scale.x = 0.05
-                mrk.scale.y = 0.05
-                mrk.scale.z = 0.05
-                mrk.color.a = 1.0
-                mrk.color.r = 1.0
-                mrk.color.g = 1.0
-                mrk.id = i - gap_left
-                #Calculate cartesian point of the gap  marker position from the lidar measurements in laser frame
-                mrk.pose.position.y = math.cos(i * self.radians_per_elem) * radius
-                mrk.pose.position.x = math.sin(i * self.radians_per_elem) * radius
-                mrk.pose.orientation.w = 1
-                gap_markers.markers.append(mrk)
-            self.best_gap.publish(gap_markers)
+        if self.debug_markers_due:
+            #Visualise the gap, the cartesian points of the gap in laser frame are a single sphere list
+            gap_angles = np.arange(gap_left, gap_right) * self.radians_per_elem
+            gap_mrk = self._sphere_list_marker(np.sin(gap_angles) * radius, np.cos(gap_angles) * radius, scale=0.05)
+            gap_mrk.color.r = 1.0
+            gap_mrk.color.g = 1.0
+            self.best_gap.publish(MarkerArray(markers=[gap_mrk]))
 
             # visualize best point aka middle of the gap
             best_mrk = Marker()
@@ -168,27 +144,16 @@ class FTG:
         proc_ranges = self._preprocess_lidar(ranges)
         
         proc_ranges = self._safety_border(proc_ranges)
-        
-        if self.DEBUG:
-            scan_markers = MarkerArray()
-            for i, scan in enumerate(proc_ranges):
-                mrk = Marker()
-                mrk.header.frame_id = 'laser'
-                mrk.header.stamp = rospy.Time.now()
-                mrk.type = mrk.SPHERE
-                mrk.scale.x = 0.05
-                mrk.scale.y = 0.05
-                mrk.scale.z = 0.05
-                mrk.color.a = 1.0
-                mrk.color.r = 1.0
-                mrk.color.b = 1.0
-
-                mrk.id = i
-                mrk.pose.position.x = math.sin(i* self.radians_per_elem) * scan
-                mrk.pose.position.y = math.cos(i* self.radians_per_elem) * scan
-                mrk.pose.orientation.w = 1
-                scan_markers.markers.append(mrk)
-            self.scan_pub.publish(scan_markers)
+
+        # the markers of this scan are only built and published if the debug rate is due
+        self.debug_markers_due = self._debug_markers_due()
+        if self.debug_markers_due:
+            scan_angles = np.arange(len(proc_ranges)) * self.radians_per_elem
+            scan_mrk = self._sphere_list_marker(np.sin(scan_angles) * proc_ranges, np.cos(scan_angles) * proc_ranges,
+                                                scale=0.05)
+            scan_mrk.color.r = 1.0
+            scan_mrk.color.b = 1.0
+            self.scan_pub.publish(MarkerArray(markers=[scan_mrk]))
 
         #Get best point to target aka middle of the largest gap
         best_x, best_y = self._get_best_range_point(proc_ranges)
@@ -197,16 +162,17 @@ class FTG:
         steering_angle = self._get_steer_angle(point_x=best_x, point_y=best_y)
 
         if self.mapping:
-            speed = 1.5
+            speed = self.ftg_config.mapping_speed
         else:
+            max_speed = self.ftg_config.max_speed * self.ftg_config.speed_scale
             if abs(steering_angle) > self.MILD_CURVE_ANGLE:
-                speed = self.CORNERS_SPEED
+                speed = 0.3 * max_speed
             elif abs(steering_angle) > self.STRAIGHTS_STEERING_ANGLE:
-                speed = self.MILD_CORNERS_SPEED
+                speed = 0.45 * max_speed
             elif abs(steering_angle) > self.ULTRASTRAIGHTS_ANGLE:
-                speed = self.STRAIGHTS_SPEED
+                speed = 0.8 * max_speed
             else:
-                speed = self.ULTRASTRAIGHTS_SPEED
+                speed = max_speed
 
         return speed, steering_angle
 
@@ -224,24 +190,18 @@ class FTG:
 
         """
         #Binarise the ranges in zeros for values under the radius threshold and ones for above and equal
-        bin_ranges = np.where(ranges >= radius, 1, 0)
-        
-        #Get largest gap from binary ranges
-        bin_diffs = np.abs(np.diff(bin_ranges))
-        bin_diffs[0] = 1
-        bin_diffs[-1] = 1
-
-        diff_idxs = bin_diffs.nonzero()[0]
-        #Check that binarised ranges are positive
-        high_gaps = []
-        for i in range(len(diff_idxs)-1):
-            low = diff_idxs[i]
-            high = diff_idxs[i+1]
-            high_gaps.append(np.mean(bin_ranges[low:high]) > 0.5)
-
-        gap_left = diff_idxs[np.argmax(high_gaps * np.diff(diff_idxs))]
-        gap_width = np.max(high_gaps * np.diff(diff_idxs))
-        gap_right = gap_left + gap_width        
+        bin_ranges = (ranges >= radius).astype(np.int8)
+
+        #Runs of ones start where the padded binary ranges rise and end where they fall
+        bin_diffs = np.diff(np.concatenate(([0], bin_ranges, [0])))
+        gap_starts = np.flatnonzero(bin_diffs == 1)
+        gap_ends = np.flatnonzero(bin_diffs == -1)
+        if gap_starts.size == 0:
+            return 0, 0
+
+        largest = np.argmax(gap_ends - gap_starts)
+        gap_left = int(gap_starts[largest])
+        gap_right = int(gap_ends[largest])
 
         return gap_left, gap_right
 
@@ -253,7 +213,7 @@ class FTG:
             float: The calculated radius.
         """
         # Empirically determined that this radius choosing makes sense
-        return min(5., self.track_width / 2 + 2 * (self.velocity / self.MAX_SPEED))
+        return min(5., self.ftg_config.track_width / 2 + 2 * (self.velocity / self.ftg_config.max_speed))
 
     def set_vel(self, velocity) -> None:
         """
@@ -268,43 +228,76 @@ class FTG:
         """
         Add a safety bubble if there is a big increase in the range between two points.
 
+        The closer range of such an edge is spread over the farther side of the edge, as a min-filter whose angular
+        radius depends on the range of the edge: at least safety_radius beams, more for close edges such that the
+        bubble covers safety_bubble meters laterally.
+
         Parameters:
-            ranges (list): List of range values.
+            ranges (numpy.ndarray): Array of range values.
 
         Returns:
             np.ndarray: Array of filtered range values.
         """
-        filtered = list(ranges)
+        ranges = np.asarray(ranges, dtype=float)
         ranges_len = len(ranges)
-        i = 0
-        while i < ranges_len - 1:
-            if ranges[i + 1] - ranges[i] > 0.5:
-                for j in range(self.SAFETY_RADIUS):
-                    if i + j < ranges_len:
-                        filtered[i + j] = ranges[i]
-                i += self.SAFETY_RADIUS - 2
-            i += 1
-        # in other direction
-        i = ranges_len - 1
-        while i > 0:
-            if ranges[i - 1] - ranges[i] > 0.5:
-                for j in range(self.SAFETY_RADIUS):
-                    if i - j >= 0:
-                        filtered[i - j] = ranges[i]
-                i = i - self.SAFETY_RADIUS + 2
-            i -= 1
-        return np.array(filtered)
-
-    def _delete_gap_markers(self) -> None:
+        jumps = np.diff(ranges)
+        # edges where the range increases to the left and to the right, the bubble is spread in that direction
+        rising = np.flatnonzero(jumps > 0.5)
+        falling = np.flatnonzero(-jumps > 0.5) + 1
+        edges = np.concatenate((rising, falling))
+        if edges.size == 0:
+            return ranges.copy()
+        directions = np.concatenate((np.ones(rising.size, dtype=int), -np.ones(falling.size, dtype=int)))
+
+        # per edge angular radius in beams
+        angular_radius = np.arctan2(self.ftg_config.safety_bubble, np.maximum(ranges[edges], 1e-3)) / self.radians_per_elem
+        widths = np.clip(np.ceil(angular_radius).astype(int), self.ftg_config.safety_radius, ranges_len)
+
+        # beam indices covered by each bubble, flattened
+        offsets = np.arange(widths.sum()) - np.repeat(np.cumsum(widths) - widths, widths)
+        idxs = np.repeat(edges, widths) + np.repeat(directions, widths) * offsets
+        valid = (idxs >= 0) & (idxs < ranges_len)
+
+        filtered = ranges.copy()
+        np.minimum.at(filtered, idxs[valid], np.repeat(ranges[edges], widths)[valid])
+        return filtered
+
+    def _debug_markers_due(self) -> bool:
         """
-        Delete marker for rviz when not needed
+        Check whether the debug markers are published for this scan, at most at debug_rate.
+
+        Returns:
+            bool: True if debug is set and the last markers are older than 1 / debug_rate.
+        """
+        if not self.ftg_config.debug:
+            return False
+        now = rospy.get_time()
+        if now - self.last_debug_time < 1 / self.ftg_config.debug_rate:
+            return False
+        self.last_debug_time = now
+        return True
+
+    def _sphere_list_marker(self, xs, ys, scale) -> Marker:
+        """
+        Create a single sphere list marker in laser frame for the given points.
+
+        Parameters:
+            xs (numpy.ndarray): x-coordinates of the points.
+            ys (numpy.ndarray): y-coordinates of the points.
+            scale (float): Diameter of the spheres.
+
+        Returns:
+            Marker: The sphere list marker, the color is left to the caller apart from its alpha.
         """
-        del_mrk_array = MarkerArray()
-        for i in range(1):
-            del_mrk = Marker()
-            del_mrk.header.frame_id = 'laser'
-            del_mrk.header.stamp = rospy.Time.now()
-            del_mrk.action = del_mrk.DELETEALL
-            del_mrk.id = i
-            del_mrk_array.markers.append(del_mrk)
-        self.best_gap.publish(del_mrk_array)
+        mrk = Marker()
+        mrk.header.frame_id = 'laser'
+        mrk.header.stamp = rospy.Time.now()
+        mrk.type = mrk.SPHERE_LIST
+        mrk.scale.x = scale
+        mrk.scale.y = scale
+        mrk.scale.z = scale
+        mrk.color.a = 1.0
+        mrk.id = 0
+        mrk.pose.orientation.w = 1
+        mrk.points = [Point(x=x, y=y) for x, y in zip(xs.tolist(), ys.tolist())]
+        return mrk
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Checks the projections of `spline_track` against the former scalar search on the raceline of every shipped map.
+
+Points are sampled around the raceline and projected with `find_theta` (warm started close to the true theta) and
+`find_theta_slow`. The new projection must be as close to the point as the one of the former search (within 1 mm)
+and the batched derivatives must equal the scalar ones.
+
+Usage:
+    python3 check_spline_track.py
+    python3 check_spline_track.py --maps JFR_racingv5 test_map --n_points 500
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+import numpy as np
+import rospkg
+
+from spline_track.splinify import SplineTrack
+
+
+def legacy_find_theta(line, coord: np.ndarray, theta_est, eps: float = 0.01):
+    """
+    Former `EnhancedSpline.find_theta`: scalar walk forward and backward from `theta_est` until the distance increases.
+    """
+    max_dist = line.track_length/20
+
+    def dist_at(theta):
+        return np.linalg.norm(coord - np.array(line.get_coordinate(theta)).reshape(2))
+
+    min_dist = dist_at(theta_est)
+    min_theta = theta_est
+    for direction in (1, -1):
+        theta_i = theta_est
+        while True:
+            theta_i += direction * eps
+            dist = dist_at(theta_i)
+            if dist <= min_dist:
+                min_dist = dist
+                min_theta = theta_i
+            else:
+                break
+            if direction * (theta_i - theta_est) >= max_dist:
+                break
+    return min_theta
+
+
+def legacy_find_theta_slow(line, coord: np.ndarray, eps: float = 0.1):
+    """
+    Former `EnhancedSpline.find_theta_slow`: scalar scan of the whole line.
+    """
+    min_dist = np.linalg.norm(coord - np.array(line.get_coordinate(0)))
+    min_theta = 0
+    theta_i = 0
+    while theta_i <= line.track_length:
+        theta_i += eps
+        dist = np.linalg.norm(coord - np.array(line.get_coordinate(theta_i)))
+        if dist <= min_dist:
+            min_dist = dist
+            min_theta = theta_i
+    return min_theta
+
+
+def load_track(maps_dir: str, map_name: str) -> SplineTrack:
+    """
+    Splinifies the raceline of a map like the MPC controllers do.
+    """
+    with open(os.path.join(maps_dir, map_name, "global_waypoints.json")) as f:
+        wpnts = json.load(f)["global_traj_wpnts_iqp"]["wpnts"]
+    waypoints = np.array([[w["x_m"], w["y_m"]] for w in wpnts])
+    boundaries = np.zeros_like(waypoints)
+    return SplineTrack(coords_direct=np.array([boundaries[:-1], waypoints[:-1], boundaries[:-1]]))
+
+
+def check_map(track: SplineTrack, n_points: int, n_slow: int, rng: np.random.Generator) -> bool:
+    line = track.refline
+    length = track.track_length
+    s = rng.uniform(0, length, n_points)
+    der = line.get_derivative(s)
+    normal = np.array([-der[1], der[0]]) / np.linalg.norm(der, axis=0)
+    points = (line.get_coordinate(s) + rng.uniform(-0.5, 0.5, n_points) * normal).T
+    theta_est = s + rng.uniform(-0.3, 0.3, n_points)
+
+    def dist(theta, point):
+        return np.linalg.norm(point - line.get_coordinate(theta))
+
+    theta_new = line.find_theta(points, theta_est)
+    theta_old = np.array([legacy_find_theta(line, p, t) for p, t in zip(points, theta_est)])
+    dist_excess = max(dist(tn, p) - dist(to, p) for tn, to, p in zip(theta_new, theta_old, points))
+    theta_diff = np.max(np.abs(theta_new - theta_old))
+
+    slow_new = line.find_theta_slow(points[:n_slow])
+    slow_old = np.array([legacy_find_theta_slow(line, p) for p in points[:n_slow]])
+    slow_excess = max(dist(tn, p) - dist(to, p) for tn, to, p in zip(slow_new, slow_old, points))
+
+    der_scalar = np.array([line.get_derivative(theta) for theta in s]).T
+    der_equal = np.array_equal(der, der_scalar)
+
+    t_old = min(timeit.repeat(lambda: legacy_find_theta(line, points[0], theta_est[0]), number=20, repeat=3)) / 20
+    t_new = min(timeit.repeat(lambda: line.find_theta(points[0], theta_est[0]), number=20, repeat=3)) / 20
+
+    ok = dist_excess <= 1e-3 and slow_excess <= 1e-3 and der_equal
+    print(f"  find_theta: max |theta new - old| {theta_diff:.4f} m, max distance excess {dist_excess:.2e} m, "
+          f"{1e6 * t_old:.0f} us -> {1e6 * t_new:.0f} us per point")
+    print(f"  find_theta_slow: max distance excess {slow_excess:.2e} m, batched derivative equal: {der_equal}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the spline track projections on the shipped maps.")
+    parser.add_argument("--maps_dir", type=str, default=None, help="Maps directory, default stack_master/maps")
+    parser.add_argument("--maps", type=str, nargs="*", default=None, help="Maps to check, default all")
+    parser.add_argument("--n_points", type=int, default=200, help="Points projected per map")
+    parser.add_argument("--n_slow", type=int, default=10, help="Points projected without estimate per map")
+    args = parser.parse_args()
+
+    maps_dir = args.maps_dir or os.path.join(rospkg.RosPack().get_path("stack_master"), "maps")
+    map_names = args.maps or sorted(
+        name for name in os.listdir(maps_dir) if os.path.isfile(os.path.join(maps_dir, name, "global_waypoints.json"))
+    )
+    rng = np.random.default_rng(0)
+    failed = []
+    for map_name in map_names:
+        print(map_name)
+        if not check_map(load_track(maps_dir, map_name), args.n_points, args.n_slow, rng):
+            failed.append(map_name)
+    if failed:
+        print(f"FAILED: {failed}")
+        sys.exit(1)
+    print("all maps passed")
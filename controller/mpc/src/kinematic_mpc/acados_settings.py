@@ -33,14 +33,25 @@
 
 # author: Daniel Kloeser
 
+import os
+
 import numpy as np
-from acados_template import AcadosModel, AcadosOcp, AcadosOcpSolver
+from acados_template import AcadosModel, AcadosOcp
 
 from pbl_config import KMPCConfig, CarConfig
 from kinematic_mpc.bicycle_model import bicycle_model
+from mpc_utils.solver_cache import cached_solver, solver_key, source_bytes
+
+# config fields which are parameters or bounds set at runtime, they do not change the generated solver
+RUNTIME_FIELDS = {
+    "t_delay", "propagate_delay", "steps_delay", "track_safety_margin", "overtake_d", "warm_start", "fallback_cycles",
+    "qac", "qddelta", "qadv", "qn", "qalpha", "qv",
+    "delta_min", "delta_max", "v_min", "v_max", "a_min", "a_max", "ddelta_min", "ddelta_max", "alat_max",
+}
 
 
-def acados_settings(s0, kapparef, vx_ref, d_left, d_right, kmpc_config: KMPCConfig, car_config: CarConfig):
+def acados_settings(s0, kapparef, vx_ref, d_left, d_right, kmpc_config: KMPCConfig, car_config: CarConfig,
+                    cache_dir: str = None):
     # create render arguments
     ocp = AcadosOcp()
 
@@ -196,8 +207,8 @@ def acados_settings(s0, kapparef, vx_ref, d_left, d_right, kmpc_config: KMPCConf
     ocp.solver_options.tf = kmpc_config.N / kmpc_config.MPC_freq
 
     # ocp.solver_options.qp_solver = 'FULL_CONDENSING_QPOASES'
-    ocp.solver_options.qp_solver = "PARTIAL_CONDENSING_HPIPM"
-    ocp.solver_options.nlp_solver_type = "SQP_RTI"  # SQP_RTI
+    ocp.solver_options.qp_solver = kmpc_config.qp_solver
+    ocp.solver_options.nlp_solver_type = kmpc_config.nlp_solver_type
     ocp.solver_options.hessian_approx = "GAUSS_NEWTON"
     ocp.solver_options.integrator_type = "DISCRETE"  # use discrete time model by ourselves
     # continuous time integrator
@@ -207,8 +218,9 @@ def acados_settings(s0, kapparef, vx_ref, d_left, d_right, kmpc_config: KMPCConf
     ocp.solver_options.print_level = 0
     ocp.solver_options.nlp_solver_tol_comp = 1e-1
 
-    # create solver
-    acados_solver = AcadosOcpSolver(ocp, json_file="acados_ocp.json")
+    # create solver, reused from the cache if it was built for the same model
+    acados_solver = cached_solver(ocp, get_solver_key(s0, kapparef, d_left, d_right, kmpc_config, car_config),
+                                  cache_dir)
 
     return constraint, model, acados_solver, params
 
@@ -227,5 +239,24 @@ def get_parameters(cfg: KMPCConfig) -> np.ndarray:
         cfg.track_safety_margin,
         cfg.overtake_d,
     ]).astype(float)
+    if cfg.track_params:
+        # curvature and track bounds, set per stage from the raceline
+        params = np.append(params, [0.0, cfg.track_max_width, cfg.track_max_width])
 
     return params
+
+
+def get_solver_key(s0, kapparef, d_left, d_right, cfg: KMPCConfig, car_config: CarConfig) -> str:
+    """Hash of the model sources, configs and, unless they are stage parameters, the raceline
+
+    The raceline speed is not part of the key, the generated model does not use it.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    parts = [
+        source_bytes(os.path.join(here, "acados_settings.py"), os.path.join(here, "bicycle_model.py")),
+        cfg.model_dump(exclude=RUNTIME_FIELDS),
+        car_config,
+    ]
+    if not cfg.track_params:
+        parts += [s0, kapparef, d_left, d_right]
+    return solver_key(*parts)
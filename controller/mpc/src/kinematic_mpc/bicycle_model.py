@@ -141,10 +141,21 @@ def bicycle_model(
     # calculate the index
     s_mod = fmod(s, pathlength)
 
+    if kmpc_config.track_params:
+        # curvature and track bounds along the horizon are stage parameters, the generated solver is track independent
+        kappa = MX.sym('kappa')
+        left_bound = MX.sym('left_bound')
+        right_bound = MX.sym('right_bound')
+        p = vertcat(p, kappa, left_bound, right_bound)
+    else:
+        kappa = kapparef_s(s_mod)
+        left_bound = left_bound_s(s_mod)
+        right_bound = right_bound_s(s_mod)
+
     # kinematic model
-    sdota = (v * cos(alpha)) / (1 - kapparef_s(s_mod) * n)
-    ndot = v * sin(alpha)  # (v * cos(alpha + beta))**2 * (0.5 * kapparef_s(s_mod))
-    alphadot = v / (lr + lf) * cs.tan(delta) - kapparef_s(s_mod) * sdota
+    sdota = (v * cos(alpha)) / (1 - kappa * n)
+    ndot = v * sin(alpha)  # (v * cos(alpha + beta))**2 * (0.5 * kappa)
+    alphadot = v / (lr + lf) * cs.tan(delta) - kappa * sdota
     # continuous dynamics
     f_expl = vertcat(
         sdota,
@@ -155,6 +166,15 @@ def bicycle_model(
     )
     f_expl_func = Function('f_expl_func', [s, n, alpha, v, delta, der_v, derDelta, p], [f_expl])
 
+    # fixed step RK4 of the continuous dynamics with constant input and parameters, x_next = f_rk4(x, u, p, dt)
+    dt = MX.sym("dt")
+    f_cont = Function("f_cont", [x, u, p], [f_expl])
+    k1 = f_cont(x, u, p)
+    k2 = f_cont(x + 0.5 * dt * k1, u, p)
+    k3 = f_cont(x + 0.5 * dt * k2, u, p)
+    k4 = f_cont(x + dt * k3, u, p)
+    f_rk4 = Function("f_rk4", [x, u, p, dt], [x + dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4)])
+
     # external discretized dynamics for the reverse behavior
     # runge kutta simulation
     control_period = 1 / freq
@@ -194,8 +214,8 @@ def bicycle_model(
 
     # constraint on lateral erros
     # distance to border
-    n_right_bound = n + right_bound_s(s_mod) - bound_inflation
-    n_left_bound = n - left_bound_s(s_mod) + bound_inflation
+    n_right_bound = n + right_bound - bound_inflation
+    n_left_bound = n - left_bound + bound_inflation
 
     # nonlinear constraints
     constraint.alat = Function("a_lat", [x, u], [a_lat])
@@ -245,6 +265,7 @@ def bicycle_model(
     model.params = params
     model.kappa = kapparef_s
     model.f_expl_func = f_expl_func
+    model.f_rk4 = f_rk4
     model.left_bound_s = left_bound_s
     model.right_bound_s = right_bound_s
     return model, constraint, params
@@ -1,31 +1,42 @@
 #! /usr/bin/env python3
-from typing import Tuple
+import threading
 import numpy as np
 import rospy
-from scipy.integrate import solve_ivp
 from frenet_converter.frenet_converter import FrenetConverter
 from f110_msgs.msg import WpntArray
-from kinematic_mpc.utils.splinify import SplineTrack
+from spline_track.splinify import SplineTrack
+from mpc_utils.mpc_base import MPCControllerBase
 from pbl_config import KMPCConfig, CarConfig, TrailingConfig
 from kinematic_mpc.acados_settings import acados_settings
 
 
-class Kinematic_MPC_Controller:
-    def __init__(self, racecar_version: str, kmpc_config: KMPCConfig, car_config: CarConfig, trailing_config: TrailingConfig) -> None:
+class Kinematic_MPC_Controller(MPCControllerBase):
+    def __init__(self, racecar_version: str, kmpc_config: KMPCConfig, car_config: CarConfig, trailing_config: TrailingConfig,
+                 controller_frequency: float, raceline: WpntArray = None) -> None:
         """
         Initialise MPC object.
 
-        Input:  conf_file   : String containing the path to the param_config.yaml file
+        Input:  controller_frequency    : rate in Hz at which main_loop is called by the controller manager
+                raceline                : global waypoints, if None they are received from /global_waypoints
         """
         # Init the parameters
         self.racecar_version = racecar_version
         self.kmpc_config: KMPCConfig = kmpc_config
         self.car_config: CarConfig = car_config
         self.trailing_config: TrailingConfig = trailing_config
+        self.controller_frequency = controller_frequency
         self.mpc_init_params()
 
         # Init the solver
-        self.mpc_initialize_solver()
+        self.mpc_initialize_solver(raceline)
+
+    @property
+    def mpc_config(self) -> KMPCConfig:
+        return self.kmpc_config
+
+    def reset_progress(self) -> None:
+        self.nr_laps = 0
+        self.fre_s = 0
 
     def mpc_init_params(self) -> None:
         # MPC Params
@@ -38,6 +49,11 @@ class Kinematic_MPC_Controller:
         buf_size = 2
         self.steering_angle_buf = np.zeros(buf_size)
 
+        # held by main_loop and the raceline update, such that a solve never mixes two racelines
+        self.track_lock = threading.Lock()
+        # set if the raceline changed the s coordinates, the solver is then warm started from the current state
+        self.reset_warm_start = False
+
         # Initial state
         self.mpc_sd = np.zeros((self.kmpc_config.N + 1, 2))
         self.u0 = np.zeros(2)
@@ -56,13 +72,28 @@ class Kinematic_MPC_Controller:
         self.gap_actual = None
         self.v_diff = None
         self.i_gap = 0
-
-    def mpc_initialize_solver(self) -> None:
+        # per stage parameters (N+1, n_p) and the config they were built from
+        self.stage_params = None
+        self.stage_config_key = None
+        # last successful solution (states (N+1, n_x), inputs (N, n_u)) for the shifted warm start
+        self.x_solution = None
+        self.u_solution = None
+        self.t_solution = None  # time in seconds of the solve that produced the last successful solution
+        # True while the shifted last solution is followed because the solver failed
+        self.fallback_active = False
+        # solver statistics
+        self.n_solves = 0
+        self.n_failed_solves = 0
+        self.solve_time_sum = 0.0
+
+    def mpc_initialize_solver(self, raceline: WpntArray = None) -> None:
         """Initialises the controller. Global waypoints are stored in a SplineTrack. All necessary parameters are stored. """
 
-        rospy.loginfo(f"[MPC Controller] Waiting for global waypoints")
-        raceline = rospy.wait_for_message("/global_waypoints", WpntArray)
-        rospy.loginfo(f"[MPC Controller] Global waypoints obtained")
+        online = raceline is None
+        if online:
+            rospy.loginfo(f"[MPC Controller] Waiting for global waypoints")
+            raceline = rospy.wait_for_message("/global_waypoints", WpntArray)
+            rospy.loginfo(f"[MPC Controller] Global waypoints obtained")
 
         x, y = self._transform_waypoints_to_cartesian(raceline.wpnts)
         self.fren_conv = FrenetConverter(x, y)
@@ -77,11 +108,16 @@ class Kinematic_MPC_Controller:
         kapparef = [x.kappa_radpm for x in raceline.wpnts]
         vx_ref = [x.vx_mps for x in raceline.wpnts]
         self.s_ref = np.array([x.s_m for x in raceline.wpnts])
+        # raceline samples for the per stage curvature and track bounds
+        self.track_samples = np.column_stack((kapparef, d_left, d_right))
         self.constraint, self.model, self.acados_solver, self.model_params = acados_settings(
             self.s_ref, kapparef, vx_ref, d_left, d_right, self.kmpc_config, self.car_config)
 
         self.kappa = kapparef
 
+        if self.kmpc_config.track_params and online:
+            # the solver does not depend on the track, raceline updates only replace the samples
+            rospy.Subscriber("/global_waypoints", WpntArray, self.global_waypoints_cb)
 
     def apply_warm_start(self, pose_frenet: np.ndarray):
         """Applies a warm start to the MPC solver.
@@ -105,7 +141,31 @@ class Kinematic_MPC_Controller:
             position_in_map_frenet,
             acc_now,
             track_length,
-            compute_time):
+            compute_time,
+            stamp: float = None):
+        """
+        Runs one MPC iteration while holding the track lock, such that a raceline update never lands in a solve.
+
+        Input:  stamp       : time of the control cycle in seconds, the ROS time if None
+        """
+        if stamp is None:
+            stamp = rospy.get_time()
+        with self.track_lock:
+            return self._main_loop(state, position_in_map, waypoint_array_in_map, speed_now, opponent,
+                                   position_in_map_frenet, acc_now, track_length, compute_time, stamp)
+
+    def _main_loop(
+            self,
+            state,
+            position_in_map,
+            waypoint_array_in_map,
+            speed_now,
+            opponent,
+            position_in_map_frenet,
+            acc_now,
+            track_length,
+            compute_time,
+            stamp):
         # Updating parameters from manager
         self.state = state
         self.position_in_map = position_in_map
@@ -138,64 +198,76 @@ class Kinematic_MPC_Controller:
         x0 = np.array([self.fre_s, self.fre_d, self.fre_alpha, self.speed,
                       self.steering_angle_buf[-1]], dtype=np.float64)
 
-        # time delat compensation
-        self.t_delay = self.conp_time
-        propagated_x = self.propagate_time_delay(x0, self.u0)
-        propagated_x = x0
+        # time delay compensation, if enabled the state is propagated over the delay with the last applied input
+        self.t_delay = self.kmpc_config.t_delay + self.conp_time
+        if self.kmpc_config.propagate_delay and self.t_delay > 0:
+            propagated_x = self.propagate_time_delay(x0, self.u0)
+        else:
+            propagated_x = x0
+        if self.reset_warm_start:
+            self.apply_warm_start(pose_frenet=[self.fre_s, self.fre_d, self.fre_alpha])
+            self.reset_warm_start = False
+
         # set the initial state for the mpc
         self.acados_solver.set(0, "lbx", propagated_x)
         self.acados_solver.set(0, "ubx", propagated_x)
 
         # dynamically change the target speed, weight parameters and constraints
-        for i in range(self.kmpc_config.N + 1):
-            # head to head racing
+        self.update_stage_config()
+        if (self.state == "TRAILING" and (self.opponent is not None)):  # Trailing controller
             # for the trailing, MPC just needs to change the reference speed (get from the trailing controller)
-            if (self.state == "TRAILING" and (self.opponent is not None)):  # Trailing controller
-                target_v_speed = self.trailing_controller(self.waypoint_array_in_map[0, 2])
-            else:
-                idx = np.abs(self.waypoint_array_in_map[:,4]  - self.mpc_sd[i,0]%self.spline.track_length).argmin()
-                target_v_speed=self.waypoint_array_in_map[idx,2]
-                self.overtake_d = 0
-                # head to head overtaking
-                if (self.state == "OVERTAKE" and (self.opponent is not None)):
-                    self.overtake_d = self.waypoint_array_in_map[idx, 3]
-
-            online_parameters = np.array([target_v_speed,
-                                          self.kmpc_config.qadv,
-                                          self.kmpc_config.qv,
-                                          self.kmpc_config.qn,
-                                          self.kmpc_config.qalpha,
-                                          self.kmpc_config.qac,
-                                          self.kmpc_config.qddelta,
-                                          self.kmpc_config.alat_max,
-                                          self.kmpc_config.track_safety_margin,
-                                          self.overtake_d],
-                                         dtype=np.float64)
-
-            self.acados_solver.set(i, "p", online_parameters)
+            self.stage_params[:, 0] = self.trailing_controller(self.waypoint_array_in_map[0, 2])
+            self.stage_params[:, 9] = self.overtake_d
+        else:
+            # head to head racing
+            target_v_speed, wpnt_d = self.stage_reference(self.mpc_sd[:, 0] % self.spline.track_length)
+            self.stage_params[:, 0] = target_v_speed
+            # head to head overtaking
+            self.stage_params[:, 9] = wpnt_d if (self.state == "OVERTAKE" and (self.opponent is not None)) else 0
+            self.overtake_d = self.stage_params[-1, 9]
 
-            if i < self.kmpc_config.N:
-                self.acados_solver.set(i, "lbu", np.array([self.kmpc_config.a_min, self.kmpc_config.ddelta_min]))
-                self.acados_solver.set(i, "ubu", np.array([self.kmpc_config.a_max, self.kmpc_config.ddelta_max]))
-                # do not change i+1 to i since mpc needs the initial state
-                self.acados_solver.set(i + 1, "lbx", np.array([self.kmpc_config.v_min, self.kmpc_config.delta_min]))
-                self.acados_solver.set(i + 1, "ubx", np.array([self.kmpc_config.v_max, self.kmpc_config.delta_max]))
+        if self.kmpc_config.track_params:
+            self.stage_params[:, -3:] = self.track_parameters(self.mpc_sd[:, 0])
+
+        for i in range(self.kmpc_config.N + 1):
+            self.acados_solver.set(i, "p", self.stage_params[i])
+
+        # Update Warm Start
+        if self.x_solution is not None:
+            elapsed = stamp - self.t_solution
+        if self.kmpc_config.warm_start == "shift" and self.x_solution is not None:
+            self.update_warm_start(elapsed)
 
         # Solve OCP
         status = self.acados_solver.solve()
+        self.n_solves += 1
+        self.solve_time_sum += float(np.squeeze(self.acados_solver.get_stats("time_tot")))
+        self.fallback_active = False
         if status != 0:
-            # if the solver fails, apply warm start again
-            # the initial warm start is a bit rough, but it does the job
-            print("Solver failed, applying warm start")
-            self.apply_warm_start(pose_frenet=[self.fre_s, self.fre_d, self.fre_alpha])
+            self.n_failed_solves += 1
+            if (self.x_solution is not None
+                    and round(elapsed * self.controller_frequency) <= self.kmpc_config.fallback_cycles
+                    and self.update_warm_start(elapsed)):
+                # if the solver fails, follow the shifted last feasible solution, also the initial guess of the next solve
+                self.fallback_active = True
+            else:
+                # if the solver fails for too long, apply warm start again
+                # the initial warm start is a bit rough, but it does the job
+                print("Solver failed, applying warm start")
+                self.x_solution = None
+                self.apply_warm_start(pose_frenet=[self.fre_s, self.fre_d, self.fre_alpha])
+        x_traj, u_traj = self.get_trajectory()
+        if status == 0:
+            self.x_solution, self.u_solution = x_traj, u_traj
+            self.t_solution = stamp
 
         # get solution
         # time delay step for the prediction
         # todo make this a parameter in the yaml file
         # TODO: remove hardcoding!!!
         time_delay_step = 3
-        self.u0 = self.acados_solver.get(0, "u")
-        self.pred_x = self.acados_solver.get(time_delay_step, "x")
+        self.u0 = u_traj[0]
+        self.pred_x = x_traj[time_delay_step]
         self.steering_angle = self.pred_x[4]
         self.speed = self.pred_x[3]
         self.acceleration = 0 * self.u0[0]
@@ -207,21 +279,58 @@ class Kinematic_MPC_Controller:
 
         ##### visualization #####
         # Creating waypoint array with predicted positions
-        self.mpc_sd = np.array([
-            self.acados_solver.get(j, "x")[:2] for j in range(self.kmpc_config.N + 1)
-        ])
-        if status == 0:
-            states = []
-            for node in range(self.kmpc_config.N + 1):
-                result = self.acados_solver.get(node, "x").tolist()
-                for item in result:
-                    states.append(item)
-            self.states = states
+        self.mpc_sd = x_traj[:, :2]
+        if status == 0 or self.fallback_active:
+            self.states = x_traj.ravel().tolist()
         return self.speed, self.acceleration, self.jerk, self.steering_angle, self.states
 
     #############
     # Utilities #
     #############
+    def _stage_config_key(self) -> tuple:
+        cfg = self.kmpc_config
+        return (cfg.N, cfg.track_params, cfg.track_max_width, cfg.qadv, cfg.qv, cfg.qn, cfg.qalpha, cfg.qac,
+                cfg.qddelta, cfg.alat_max, cfg.track_safety_margin, cfg.a_min, cfg.a_max, cfg.ddelta_min,
+                cfg.ddelta_max, cfg.v_min, cfg.v_max, cfg.delta_min, cfg.delta_max)
+
+    def update_stage_config(self) -> None:
+        """
+        Rebuilds the per stage parameters and sets the constant bounds of the stages, if the config changed since the
+        last call. The reference speed and the overtaking d (columns 0 and 9) are overwritten every solve.
+        """
+        key = self._stage_config_key()
+        if key == self.stage_config_key:
+            return
+        self.stage_config_key = key
+        cfg = self.kmpc_config
+
+        stage_params = np.array([0.0,
+                                 cfg.qadv,
+                                 cfg.qv,
+                                 cfg.qn,
+                                 cfg.qalpha,
+                                 cfg.qac,
+                                 cfg.qddelta,
+                                 cfg.alat_max,
+                                 cfg.track_safety_margin,
+                                 0.0],
+                                dtype=np.float64)
+        if cfg.track_params:
+            # curvature and track bounds, overwritten every solve
+            stage_params = np.append(stage_params, [0.0, cfg.track_max_width, cfg.track_max_width])
+        self.stage_params = np.tile(stage_params, (cfg.N + 1, 1))
+
+        lbu = np.array([cfg.a_min, cfg.ddelta_min])
+        ubu = np.array([cfg.a_max, cfg.ddelta_max])
+        lbx = np.array([cfg.v_min, cfg.delta_min])
+        ubx = np.array([cfg.v_max, cfg.delta_max])
+        for i in range(cfg.N):
+            self.acados_solver.set(i, "lbu", lbu)
+            self.acados_solver.set(i, "ubu", ubu)
+            # do not change i+1 to i since mpc needs the initial state
+            self.acados_solver.set(i + 1, "lbx", lbx)
+            self.acados_solver.set(i + 1, "ubx", ubx)
+
     def get_warm_start(self, pose_frenet: np.ndarray, const_v: float, const_steer_vel: float) -> np.array:
         """
         Returns a warm start trajectory for the MPC. This is done by propagating the current state with a constant velocity and steering angle.
@@ -231,49 +340,16 @@ class Kinematic_MPC_Controller:
 
         Returns: np.array    : Warm start trajectory
         """
-        warm_start = np.zeros((self.kmpc_config.N + 1, 7))
-        warm_start[0] = np.array([pose_frenet[0], pose_frenet[1], pose_frenet[2],
-                                 1, const_steer_vel, 0, 0])
+        warm_start = np.zeros((self.kmpc_config.N + 1, self.model.n_x + self.model.n_u))
+        warm_start[0, :self.model.n_x] = [pose_frenet[0], pose_frenet[1], pose_frenet[2], const_v, const_steer_vel]
         for i in range(1, self.kmpc_config.N + 1):
-            der_state = self._dynamics_of_car(0, warm_start[i - 1])
-            warm_start[i] = warm_start[i-1] + np.array(der_state) / self.kmpc_config.MPC_freq  # ugly euler integration
+            warm_start[i, :self.model.n_x] = self.integrate(
+                warm_start[i - 1, :self.model.n_x], warm_start[i - 1, self.model.n_x:], self.t_MPC)
         return warm_start
 
-    def _transform_waypoints_to_coords(self, data: WpntArray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-        """Helper function to store the received waypoints into the right format such that they can be used for initialisation of SplineTrack.
-
-        Input: data: WpntArray: Holds the data received from the globalwaypoints.
-
-        Returns: Tuple: Stores the waypoints as follows: Left boundaries, reference path, right boundaries
-        """
-        waypoints = np.zeros((len(data), 2))
-        d_left = np.zeros(len(data))
-        d_right = np.zeros(len(data))
-        boundaries = np.zeros((len(data), 2))
-        for idx, wpnt in enumerate(data):
-            waypoints[idx] = [wpnt.x_m, wpnt.y_m]
-            d_left[idx] = wpnt.d_left              # Fix for boundaries due to frenet cartesian conversion
-            d_right[idx] = wpnt.d_right              # Fix for boundaries due to frenet cartesian conversion
-        res_coords = np.array([boundaries[:-1], waypoints[:-1], boundaries[:-1]])
-        return d_left, res_coords, d_right
-
-    def _transform_waypoints_to_cartesian(self, data: WpntArray) -> Tuple[np.ndarray, np.ndarray]:
-        """Helper function to store the received waypoints into the right format such that they can be used for initialisation of SplineTrack.
-
-        Input: data: WpntArray: Holds the data received from the globalwaypoints.
-
-        Returns: Tuple: Stores the waypoints as follows: Left boundaries, reference path, right boundaries
-        """
-        x = np.zeros(len(data))
-        y = np.zeros(len(data))
-        for idx, wpnt in enumerate(data):
-            x[idx] = wpnt.x_m
-            y[idx] = wpnt.y_m
-        return np.array(x), np.array(y)
-
     def propagate_time_delay(self, states: np.array, inputs: np.array) -> np.array:
         """
-        RK45 forward propagation. Calls the function _dynamics_of_car which contains the dynamics of the car.
+        RK4 forward propagation over `t_delay` with the inputs held constant.
 
         Input:  np.array    : Holds the current state which needs to be propagated.
                 inputs      : Holds the current inputs from the MPC.
@@ -281,21 +357,7 @@ class Kinematic_MPC_Controller:
         Returns: np.array   : Propagated state without input.
 
         """
-
-        # Initial condition on the ODE
-        x0 = np.concatenate((states, inputs), axis=0)
-        # forward propagation
-        solution = solve_ivp(
-            self._dynamics_of_car,
-            t_span=[
-                0,
-                self.t_delay],
-            y0=x0,
-            method='RK45',
-            atol=1e-8,
-            rtol=1e-8)
-
-        solution = [x[-1] for x in solution.y]
+        solution = self.integrate(states, inputs, self.t_delay)
 
         # Constraint on max. steering angle
         if abs(solution[4]) > self.model.delta_max:
@@ -309,28 +371,7 @@ class Kinematic_MPC_Controller:
         if abs(solution[3]) < self.constraint.v_min:
             solution[3] = self.constraint.v_min
 
-        # Only get the state as solution of where the car will be in t_delay seconds
-        # not including the input
-        return np.array(solution)[:-2]
-
-    def _dynamics_of_car(self, t, x0) -> list:
-        '''
-        Used for forward propagation. This function takes the dynamics from the acados model.
-        '''
-
-        s = x0[0]
-        n = x0[1]
-        alpha = x0[2]
-        v = x0[3]
-        delta = x0[4]
-        derv = x0[5]
-        derDelta = x0[6]
-
-        xdot = self.model.f_expl_func(s, n, alpha, v, delta, derv, derDelta, self.model_params.p)
-
-        xdot = [float(xdot[0]), float(xdot[1]), float(xdot[2]), float(xdot[3]), float(xdot[4]), derv, derDelta]
-
-        return xdot
+        return solution
 
     def trailing_controller(self, global_speed):
         self.gap = (self.opponent[0] - self.position_in_map_frenet[0]) % self.track_length  # gap to opponent
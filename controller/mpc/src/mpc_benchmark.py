@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Offline solve time and regression benchmark of the STMPC and KMPC.
+
+The controller is built from the configs of a racecar_version and the raceline of a map's `global_waypoints.json`,
+without a running ROS master. Its `main_loop` is then ticked at the controller rate, either closed loop against the
+RK4 integrated `bicycle_model` dynamics of the controller itself, or open loop on recorded states. The summary holds
+the solve time percentiles, the acados status histogram, the SQP iterations and the lap times, and can be written as
+json to compare tuning and solver option changes. The Python overhead of `main_loop` is reported as the loop time
+minus the solver time `time_tot` of every tick.
+
+Usage:
+    python3 mpc_benchmark.py --ctrl STMPC --racecar_version NUC2 --map f --laps 2 --json stmpc_base.json
+    python3 mpc_benchmark.py --ctrl STMPC --racecar_version NUC2 --map f --set N=30 qp_solver=FULL_CONDENSING_HPIPM
+    python3 mpc_benchmark.py --ctrl KMPC --racecar_version NUC2 --map f --states recorded_states.npy
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from typing import Dict, List
+
+import numpy as np
+import rospkg
+import yaml
+from f110_msgs.msg import Wpnt, WpntArray
+from pbl_config import (load_car_config_ros, load_KMPC_config_ros, load_pacejka_tire_config_ros,
+                        load_STMPC_config_ros, load_trailing_config_ros)
+
+from kinematic_mpc.kinematic_mpc import Kinematic_MPC_Controller
+from single_track_mpc.single_track_mpc import Single_track_MPC_Controller
+
+# columns of the local waypoint array of the controller manager
+WPNT_FIELDS = ("x_m", "y_m", "vx_mps", "d_m", "s_m", "kappa_radpm", "psi_rad", "ax_mps2")
+
+
+def load_raceline(map_name: str) -> WpntArray:
+    """
+    Loads the raceline which is published on /global_waypoints from `global_waypoints.json` of the map.
+    """
+    path = os.path.join(rospkg.RosPack().get_path("stack_master"), "maps", map_name, "global_waypoints.json")
+    with open(path) as f:
+        wpnts = json.load(f)["global_traj_wpnts_iqp"]["wpnts"]
+    return WpntArray(wpnts=[Wpnt(**wpnt) for wpnt in wpnts])
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    values = np.asarray(values)
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"mean": float(values.mean()), "p50": float(p50), "p90": float(p90), "p99": float(p99),
+            "max": float(values.max())}
+
+
+class MPCBenchmark:
+    """
+    Runs an offline STMPC or KMPC and records the solver statistics of every tick.
+
+    Usage:
+        bench = MPCBenchmark("STMPC", "NUC2", load_raceline("f"))
+        bench.run_closed_loop(laps=2)
+        print(bench.format_summary())
+    """
+
+    def __init__(self, ctrl: str, racecar_version: str, raceline: WpntArray, overrides: Dict = None,
+                 floor: str = "dubi", loop_rate: float = 40, n_local_wpnts: int = 80):
+        """
+        Args:
+            ctrl (str): STMPC or KMPC
+            racecar_version (str): version in `stack_master/config` providing the configs
+            raceline (WpntArray): global waypoints
+            overrides (Dict): MPC config fields overriding the ones of the yaml, e.g. {"N": 30}
+            floor (str): pacejka floor of the STMPC tire config
+            loop_rate (float): rate of the controller manager in Hz
+            n_local_wpnts (int): number of waypoints in front of the car passed as local waypoints
+        """
+        self.ctrl = ctrl
+        self.racecar_version = racecar_version
+        self.overrides = dict(overrides or {})
+        self.loop_rate = loop_rate
+        self.n_local_wpnts = n_local_wpnts
+
+        self.wpnts = np.array([[getattr(w, field) for field in WPNT_FIELDS] for w in raceline.wpnts])
+        self.d_left = np.array([w.d_left for w in raceline.wpnts])
+        self.d_right = np.array([w.d_right for w in raceline.wpnts])
+        self.track_length = raceline.wpnts[-1].s_m
+
+        car_config = load_car_config_ros(racecar_version)
+        trailing_config = load_trailing_config_ros(racecar_version)
+        if ctrl == "STMPC":
+            cfg = load_STMPC_config_ros(racecar_version)
+            self.config = type(cfg)(**{**cfg.model_dump(), **self.overrides})
+            self.controller = Single_track_MPC_Controller(
+                pose_frenet=np.zeros(3), racecar_version=racecar_version, stmpc_config=self.config,
+                car_config=car_config, tire_config=load_pacejka_tire_config_ros(racecar_version, floor),
+                trailing_config=trailing_config, controller_frequency=loop_rate, using_gokart=False,
+                raceline=raceline)
+        elif ctrl == "KMPC":
+            cfg = load_KMPC_config_ros(racecar_version)
+            self.config = type(cfg)(**{**cfg.model_dump(), **self.overrides})
+            self.controller = Kinematic_MPC_Controller(racecar_version, self.config, car_config, trailing_config,
+                                                       controller_frequency=loop_rate, raceline=raceline)
+        else:
+            raise ValueError(f"Unknown controller {ctrl}, expected STMPC or KMPC")
+
+        self.solve_times: List[float] = []
+        self.loop_times: List[float] = []
+        self.statuses: List[int] = []
+        self.sqp_iters: List[int] = []
+        self.lap_times: List[float] = []
+        self.off_track_ticks = 0
+        self.fallback_ticks = 0
+
+    def local_waypoints(self, s: float) -> np.ndarray:
+        """
+        Waypoints in front of the car at `s`, as the local waypoints of the controller manager.
+        """
+        idx = np.searchsorted(self.wpnts[:, 4], s % self.track_length)
+        # the last waypoint closes the loop and duplicates the first one
+        return self.wpnts[(idx + np.arange(self.n_local_wpnts)) % (self.wpnts.shape[0] - 1)]
+
+    def tick(self, x: np.ndarray, stamp: float):
+        """
+        Runs `main_loop` once for the model state `x` (frenet s, n, alpha, ...) at the time `stamp` in seconds and
+        records the solver statistics.
+        """
+        ctrl = self.controller
+        s = x[0] % self.track_length
+        n, alpha = x[1], x[2]
+        # heading at the car center, such that `main_loop` recovers alpha
+        center_s = s + ctrl.car_config.lr * np.cos(alpha)
+        deriv = ctrl.spline.get_derivative(center_s)
+        xy = np.asarray(ctrl.fren_conv.get_cartesian(s, n)).ravel()
+        position_in_map = np.array([[xy[0], xy[1], alpha + np.arctan2(deriv[1], deriv[0])]])
+        position_in_map_frenet = np.array([s, n, alpha])
+
+        start = time.perf_counter()
+        if self.ctrl == "STMPC":
+            ctrl.main_loop("GB_TRACK", position_in_map, self.local_waypoints(s), x[3], None, position_in_map_frenet,
+                           np.array([x[4], x[6], x[7], 0.0]), self.track_length, 0, stamp=stamp)
+        else:
+            ctrl.main_loop("GB_TRACK", position_in_map, self.local_waypoints(s), x[3], None, position_in_map_frenet,
+                           np.zeros(1), self.track_length, 0.0, stamp=stamp)
+        self.loop_times.append(time.perf_counter() - start)
+
+        self.statuses.append(int(ctrl.acados_solver.get_status()))
+        self.solve_times.append(float(np.squeeze(ctrl.acados_solver.get_stats("time_tot"))))
+        self.sqp_iters.append(int(np.squeeze(ctrl.acados_solver.get_stats("sqp_iter"))))
+        self.fallback_ticks += int(ctrl.fallback_active)
+
+        if n > np.interp(s, self.wpnts[:, 4], self.d_left) or -n > np.interp(s, self.wpnts[:, 4], self.d_right):
+            self.off_track_ticks += 1
+
+    def run_closed_loop(self, laps: int = 1, max_duration: float = 120.0, v_start: float = 1.0):
+        """
+        Drives from the start of the raceline with the first MPC input applied to the model dynamics for one control
+        period, until `laps` laps or `max_duration` seconds are driven.
+        """
+        ctrl = self.controller
+        x = np.zeros(ctrl.model.n_x)
+        x[3] = v_start
+        dt = 1.0 / self.loop_rate
+        lap_start = 0.0
+        for k in range(int(max_duration * self.loop_rate)):
+            self.tick(x, k * dt)
+            x = ctrl.integrate(x, ctrl.u0, dt)
+            t = (k + 1) * dt
+            if x[0] >= (len(self.lap_times) + 1) * self.track_length:
+                self.lap_times.append(t - lap_start)
+                lap_start = t
+                if len(self.lap_times) >= laps:
+                    break
+
+    def run_states(self, states: np.ndarray):
+        """
+        Ticks open loop on recorded model states of shape (T, n_x), sampled at the controller rate.
+        """
+        for k, x in enumerate(states):
+            self.tick(x, k / self.loop_rate)
+
+    def summary(self) -> Dict:
+        statuses = Counter(self.statuses)
+        return {
+            "ctrl": self.ctrl,
+            "racecar_version": self.racecar_version,
+            "overrides": self.overrides,
+            "config": self.config.model_dump(),
+            "ticks": len(self.statuses),
+            "solve_time_ms": _percentiles([1e3 * t for t in self.solve_times]),
+            "loop_time_ms": _percentiles([1e3 * t for t in self.loop_times]),
+            # time of main_loop outside of the solver: state update, stage parameters, warm start, reading the solution
+            "overhead_ms": _percentiles(
+                [1e3 * (loop - solve) for loop, solve in zip(self.loop_times, self.solve_times)]),
+            "status": {str(status): count for status, count in sorted(statuses.items())},
+            "failure_rate": 1.0 - statuses[0] / max(len(self.statuses), 1),
+            "fallback_ticks": self.fallback_ticks,
+            "sqp_iter": _percentiles(self.sqp_iters),
+            "lap_times_s": self.lap_times,
+            "off_track_ticks": self.off_track_ticks,
+        }
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        lines = [f"{self.ctrl} {self.racecar_version} {self.overrides}: {summary['ticks']} ticks"]
+        for key in ("solve_time_ms", "loop_time_ms", "overhead_ms", "sqp_iter"):
+            values = summary[key]
+            if values:
+                lines.append(f"{key:<14} mean {values['mean']:8.3f}, p50 {values['p50']:8.3f}, "
+                             f"p90 {values['p90']:8.3f}, p99 {values['p99']:8.3f}, max {values['max']:8.3f}")
+        lines.append(f"status         {summary['status']}, failure rate {100 * summary['failure_rate']:.2f} %, "
+                     f"fallback {summary['fallback_ticks']} ticks")
+        lines.append(f"lap times [s]  {[round(t, 3) for t in summary['lap_times_s']]}")
+        lines.append(f"off track      {summary['off_track_ticks']} ticks")
+        return "\n".join(lines)
+
+
+def _parse_value(value: str):
+    try:
+        return yaml.safe_load(value)
+    except yaml.YAMLError:
+        return value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline solve time benchmark of the MPC controllers.")
+    parser.add_argument("--ctrl", type=str, default="STMPC", choices=["STMPC", "KMPC"], help="Controller")
+    parser.add_argument("--racecar_version", type=str, required=True, help="Version providing the configs")
+    parser.add_argument("--map", type=str, required=True, help="Map providing the raceline")
+    parser.add_argument("--floor", type=str, default="dubi", help="Pacejka floor of the STMPC")
+    parser.add_argument("--set", type=str, nargs="*", default=[], help="MPC config overrides as name=value")
+    parser.add_argument("--laps", type=int, default=1, help="Laps driven closed loop")
+    parser.add_argument("--max_duration", type=float, default=120.0, help="Maximum closed loop time in seconds")
+    parser.add_argument("--states", type=str, default=None, help="Recorded states (.npy, T x n_x), open loop")
+    parser.add_argument("--json", type=str, default=None, help="Write the summary to this json file")
+    args = parser.parse_args()
+
+    overrides = {}
+    for item in args.set:
+        key, value = item.split("=", 1)
+        overrides[key] = _parse_value(value)
+
+    bench = MPCBenchmark(args.ctrl, args.racecar_version, load_raceline(args.map), overrides, floor=args.floor)
+    if args.states is None:
+        bench.run_closed_loop(laps=args.laps, max_duration=args.max_duration)
+    else:
+        bench.run_states(np.load(args.states))
+    print(bench.format_summary())
+    if args.json is not None:
+        summary = bench.summary()
+        summary["map"] = args.map
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1 @@
+"""Utilities shared by the single track and the kinematic MPC."""
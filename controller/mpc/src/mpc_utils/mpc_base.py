@@ -0,0 +1,169 @@
+from typing import Tuple
+
+import numpy as np
+import rospy
+from f110_msgs.msg import WpntArray
+from frenet_converter.frenet_converter import FrenetConverter
+from spline_track.splinify import SplineTrack
+
+from mpc_utils.warm_start import shift_trajectory
+
+
+class MPCControllerBase:
+    """
+    Raceline handling, stage references and warm start shared by the single track and the kinematic MPC.
+
+    Subclasses provide `mpc_config` and set up the acados solver and model, the raceline (`fren_conv`, `spline`,
+    `s_ref`, `track_samples`, `kappa`) and `track_lock`. They reset their lap counting in `reset_progress`.
+    """
+
+    @property
+    def mpc_config(self):
+        """Config of the MPC, `STMPCConfig` or `KMPCConfig`"""
+        raise NotImplementedError
+
+    def reset_progress(self) -> None:
+        """
+        Resets the lap count and the s progress of the car, called when the raceline changed its s coordinates.
+        """
+        raise NotImplementedError
+
+    def track_parameters(self, s: np.ndarray) -> np.ndarray:
+        """
+        Samples the curvature and the left and right track bounds of the raceline at the s coordinates of the stages.
+
+        Input:  s           : s coordinates, shape (N+1,)
+
+        Returns: np.array   : curvature, left and right bound of shape (N+1, 3)
+        """
+        s_ref, track_samples = self.s_ref, self.track_samples
+        return np.column_stack([np.interp(s, s_ref, track_samples[:, i], period=s_ref[-1]) for i in range(3)])
+
+    def global_waypoints_cb(self, data: WpntArray):
+        """
+        Updates the raceline of the track independent solver without regenerating it.
+        """
+        s_ref = np.array([wpnt.s_m for wpnt in data.wpnts])
+        x, y = self._transform_waypoints_to_cartesian(data.wpnts)
+        d_left, coords_path, d_right = self._transform_waypoints_to_coords(data.wpnts)
+        kapparef = [wpnt.kappa_radpm for wpnt in data.wpnts]
+        track_samples = np.column_stack((kapparef, d_left, d_right))
+        if np.array_equal(s_ref, self.s_ref) and np.array_equal(track_samples, self.track_samples):
+            return
+
+        fren_conv = FrenetConverter(x, y)
+        spline = SplineTrack(coords_direct=coords_path)
+        with self.track_lock:
+            if not np.isclose(spline.track_length, self.spline.track_length):
+                # the lap count, the predicted s and the last solution are in the s coordinates of the old raceline
+                self.reset_progress()
+                self.mpc_sd = np.zeros((self.mpc_config.N + 1, 2))
+                self.x_solution = None
+                self.u_solution = None
+                self.t_solution = None
+                self.reset_warm_start = True
+            self.fren_conv, self.spline = fren_conv, spline
+            self.s_ref, self.track_samples, self.kappa = s_ref, track_samples, kapparef
+        rospy.loginfo("[MPC Controller] Raceline updated")
+
+    def stage_reference(self, s: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Interpolates the speed and the d of the local waypoints at the s coordinates of the stages.
+
+        The s coordinates are unwrapped from the first local waypoint on, as the local waypoints can cross the finish
+        line. Stages outside of the local waypoints get the value of the closest end.
+
+        Input:  s           : s coordinates of the stages, shape (N+1,)
+
+        Returns: Tuple      : reference speed and d of the stages
+        """
+        wpnt_s = self.waypoint_array_in_map[:, 4]
+        rel_wpnt_s = (wpnt_s - wpnt_s[0]) % self.track_length
+        # stages behind the first waypoint are not wrapped to the end of the track
+        margin = 0.5 * (self.track_length - rel_wpnt_s[-1])
+        rel_s = (s - wpnt_s[0] + margin) % self.track_length - margin
+        target_v_speed = np.interp(rel_s, rel_wpnt_s, self.waypoint_array_in_map[:, 2])
+        wpnt_d = np.interp(rel_s, rel_wpnt_s, self.waypoint_array_in_map[:, 3])
+        return target_v_speed, wpnt_d
+
+    def get_trajectory(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Reads the current iterate of the solver.
+
+        Returns: Tuple      : states of shape (N+1, n_x) and inputs of shape (N, n_u)
+        """
+        x_traj = np.array([self.acados_solver.get(i, "x") for i in range(self.mpc_config.N + 1)])
+        u_traj = np.array([self.acados_solver.get(i, "u") for i in range(self.mpc_config.N)])
+        return x_traj, u_traj
+
+    def update_warm_start(self, elapsed: float) -> bool:
+        """
+        Loads the last successful solution shifted by the elapsed time as initial guess of the solver.
+
+        The shift in stages is `elapsed / t_MPC` and can be fractional, the trajectory is then interpolated between
+        the stages. States after the end of the horizon are extrapolated linearly from the last two stages and the
+        last input is held.
+
+        Input:  elapsed     : time in seconds since the solve of the last successful solution
+
+        Returns: bool       : False if the shift exceeds the horizon and nothing was loaded
+        """
+        shift = elapsed / self.t_MPC
+        if shift >= self.mpc_config.N:
+            return False
+        stages = np.arange(self.mpc_config.N + 1) + shift
+        x_warm = shift_trajectory(self.x_solution, stages)
+        u_warm = shift_trajectory(self.u_solution, stages[:-1], extrapolate=False)
+        for i in range(self.mpc_config.N + 1):
+            self.acados_solver.set(i, "x", x_warm[i])
+            if i < self.mpc_config.N:
+                self.acados_solver.set(i, "u", u_warm[i])
+        return True
+
+    def integrate(self, states: np.ndarray, inputs: np.ndarray, dt: float) -> np.ndarray:
+        """
+        One RK4 step of the model dynamics, evaluated by the casadi function `f_rk4` of the model in a single call.
+
+        Input:  states      : state of shape (n_x,)
+                inputs      : input of shape (n_u,), constant over the step
+                dt          : step size in seconds
+
+        Returns: np.array   : state after `dt`
+        """
+        p = self.model_params.p
+        if self.mpc_config.track_params:
+            p = p.copy()
+            p[-3:] = self.track_parameters(np.array([states[0]]))[0]
+        return self.model.f_rk4(states, inputs, p, dt).full().ravel()
+
+    def _transform_waypoints_to_coords(self, data: WpntArray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Helper function to store the received waypoints into the right format such that they can be used for initialisation of SplineTrack.
+
+        Input: data: WpntArray: Holds the data received from the globalwaypoints.
+
+        Returns: Tuple: Stores the waypoints as follows: Left boundaries, reference path, right boundaries
+        """
+        waypoints = np.zeros((len(data), 2))
+        d_left = np.zeros(len(data))
+        d_right = np.zeros(len(data))
+        boundaries = np.zeros((len(data), 2))
+        for idx, wpnt in enumerate(data):
+            waypoints[idx] = [wpnt.x_m, wpnt.y_m]
+            d_left[idx] = wpnt.d_left              # Fix for boundaries due to frenet cartesian conversion
+            d_right[idx] = wpnt.d_right              # Fix for boundaries due to frenet cartesian conversion
+        res_coords = np.array([boundaries[:-1], waypoints[:-1], boundaries[:-1]])
+        return d_left, res_coords, d_right
+
+    def _transform_waypoints_to_cartesian(self, data: WpntArray) -> Tuple[np.ndarray, np.ndarray]:
+        """Helper function to store the received waypoints into the right format such that they can be used for initialisation of SplineTrack.
+
+        Input: data: WpntArray: Holds the data received from the globalwaypoints.
+
+        Returns: Tuple: Stores the waypoints as follows: Left boundaries, reference path, right boundaries
+        """
+        x = np.zeros(len(data))
+        y = np.zeros(len(data))
+        for idx, wpnt in enumerate(data):
+            x[idx] = wpnt.x_m
+            y[idx] = wpnt.y_m
+        return np.array(x), np.array(y)
@@ -0,0 +1,76 @@
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+from acados_template import AcadosOcp, AcadosOcpSolver
+from pydantic import BaseModel
+
+
+def default_cache_dir() -> str:
+    """
+    Directory of the generated solvers, `$ACADOS_SOLVER_CACHE` or `~/.ros/acados_solver_cache`.
+    """
+    return os.environ.get(
+        "ACADOS_SOLVER_CACHE", os.path.join(os.path.expanduser("~"), ".ros", "acados_solver_cache")
+    )
+
+
+def solver_key(*parts) -> str:
+    """
+    Hash of everything the generated solver depends on.
+
+    Input:  parts   : pydantic configs, dicts, raw bytes (e.g. the model sources) or array likes (e.g. the raceline)
+
+    Returns: str    : hex sha256 digest
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, BaseModel):
+            part = part.model_dump()
+        if isinstance(part, dict):
+            data = json.dumps(part, sort_keys=True).encode()
+        elif isinstance(part, bytes):
+            data = part
+        else:
+            data = np.ascontiguousarray(part, dtype=float).tobytes()
+        # the length separates the parts, such that their boundaries are part of the hash
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def source_bytes(*paths: str) -> bytes:
+    """
+    Contents of the given source files, such that changes of the model invalidate the cached solvers.
+    """
+    data = b""
+    for path in paths:
+        with open(path, "rb") as f:
+            data += f.read()
+    return data
+
+
+def cached_solver(ocp: AcadosOcp, key: str, cache_dir: str = None) -> AcadosOcpSolver:
+    """
+    Creates the solver of `ocp` in the cache directory of `key`. If a solver was already built for the key, its shared
+    library is loaded without generating and compiling the C code again.
+
+    Input:  ocp         : fully set up ocp
+            key         : hash of the model and config, see `solver_key`
+            cache_dir   : root of the cache, `default_cache_dir()` if None
+
+    Returns: AcadosOcpSolver
+    """
+    solver_dir = os.path.join(cache_dir or default_cache_dir(), f"{ocp.model.name}_{key[:16]}")
+    ocp.code_export_directory = os.path.join(solver_dir, "c_generated_code")
+    json_file = os.path.join(solver_dir, "acados_ocp.json")
+
+    # the shared library is linked last, so it only exists if the previous build went through
+    libs = glob.glob(os.path.join(ocp.code_export_directory, f"libacados_ocp_solver_{ocp.model.name}.*"))
+    if os.path.isfile(json_file) and libs:
+        return AcadosOcpSolver(ocp, json_file=json_file, generate=False, build=False)
+
+    os.makedirs(solver_dir, exist_ok=True)
+    return AcadosOcpSolver(ocp, json_file=json_file)
@@ -0,0 +1,20 @@
+import numpy as np
+
+
+def shift_trajectory(traj: np.ndarray, stages: np.ndarray, extrapolate: bool = True) -> np.ndarray:
+    """
+    Samples a trajectory at fractional stage indices.
+
+    Input:  traj        : trajectory of shape (n, dim), one row per stage
+            stages      : fractional stage indices to sample, e.g. shifted by the elapsed time
+            extrapolate : if True, stages after the last one are extrapolated linearly from the last two stages,
+                          otherwise the last stage is held
+
+    Returns: np.array   : sampled trajectory of shape (len(stages), dim)
+    """
+    n = traj.shape[0]
+    if not extrapolate:
+        stages = np.minimum(stages, n - 1)
+    idx = np.minimum(np.floor(stages).astype(int), n - 2)
+    w = (stages - idx)[:, None]
+    return traj[idx] * (1 - w) + traj[idx + 1] * w
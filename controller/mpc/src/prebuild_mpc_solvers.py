@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Builds the acados solvers of the single track and kinematic MPC into the solver cache, such that the controller
+manager loads them without code generation and compilation.
+
+Solvers are built for every racecar_version in `stack_master/config` with MPC params (and every pacejka floor for the
+single track MPC). With `track_params: false` the raceline is part of the solver, then these versions are only built
+if a map is given. The shipped configs all use `track_params: false`, so without `--map` nothing is built for them.
+
+Usage:
+    python3 prebuild_mpc_solvers.py
+    python3 prebuild_mpc_solvers.py --map JFR_racingv5 --racecar_version NUC2
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import rospkg
+from pbl_config import (load_car_config_ros, load_KMPC_config_ros, load_pacejka_tire_config_ros,
+                        load_STMPC_config_ros)
+
+from kinematic_mpc.acados_settings import acados_settings as kmpc_acados_settings
+from single_track_mpc.acados_settings import acados_settings as stmpc_acados_settings
+from mpc_utils.solver_cache import default_cache_dir
+
+
+def load_raceline(map_name: str) -> dict:
+    """
+    Loads the raceline which is published on /global_waypoints from `global_waypoints.json` of the map.
+
+    Returns:
+        raceline (dict): s, kappa, vx, d_left and d_right of the waypoints
+    """
+    path = os.path.join(rospkg.RosPack().get_path("stack_master"), "maps", map_name, "global_waypoints.json")
+    with open(path) as f:
+        wpnts = json.load(f)["global_traj_wpnts_iqp"]["wpnts"]
+    return {
+        "s0": np.array([w["s_m"] for w in wpnts]),
+        "kapparef": [w["kappa_radpm"] for w in wpnts],
+        "vx_ref": [w["vx_mps"] for w in wpnts],
+        "d_left": np.array([w["d_left"] for w in wpnts]),
+        "d_right": np.array([w["d_right"] for w in wpnts]),
+    }
+
+
+def track_independent_raceline() -> dict:
+    """
+    Placeholder raceline for configs with `track_params: true`, it does not enter the generated solver.
+    """
+    s0 = np.linspace(0.0, 10.0, 11)
+    zeros = np.zeros_like(s0)
+    return {"s0": s0, "kapparef": zeros, "vx_ref": zeros, "d_left": zeros + 1.0, "d_right": zeros + 1.0}
+
+
+def racecar_versions(config_dir: str):
+    return sorted(
+        version for version in os.listdir(config_dir)
+        if os.path.isfile(os.path.join(config_dir, version, "single_track_mpc_params.yaml"))
+        or os.path.isfile(os.path.join(config_dir, version, "kinematic_mpc_params.yaml"))
+    )
+
+
+def build_version(racecar_version: str, config_dir: str, raceline: dict, cache_dir: str):
+    try:
+        car_config = load_car_config_ros(racecar_version)
+    except FileNotFoundError:
+        print(f"[{racecar_version}] no car model, skipped")
+        return
+
+    if os.path.isfile(os.path.join(config_dir, racecar_version, "single_track_mpc_params.yaml")):
+        stmpc_config = load_STMPC_config_ros(racecar_version)
+        line = track_independent_raceline() if stmpc_config.track_params else raceline
+        pacejka_dir = os.path.join(config_dir, racecar_version, "pacejka")
+        floors = sorted(os.listdir(pacejka_dir)) if os.path.isdir(pacejka_dir) else []
+        for floor in floors:
+            if line is None:
+                print(f"[{racecar_version}] STMPC depends on the raceline, skipped without --map")
+                break
+            tire_config = load_pacejka_tire_config_ros(racecar_version, floor)
+            stmpc_acados_settings(line["s0"], line["kapparef"], line["d_left"], line["d_right"],
+                                  stmpc_config, car_config, tire_config, cache_dir=cache_dir)
+            print(f"[{racecar_version}] STMPC built for floor {floor}")
+
+    if os.path.isfile(os.path.join(config_dir, racecar_version, "kinematic_mpc_params.yaml")):
+        kmpc_config = load_KMPC_config_ros(racecar_version)
+        line = track_independent_raceline() if kmpc_config.track_params else raceline
+        if line is None:
+            print(f"[{racecar_version}] KMPC depends on the raceline, skipped without --map")
+            return
+        kmpc_acados_settings(line["s0"], line["kapparef"], line["vx_ref"], line["d_left"], line["d_right"],
+                             kmpc_config, car_config, cache_dir=cache_dir)
+        print(f"[{racecar_version}] KMPC built")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Pre-build the MPC solvers into the acados solver cache. Solvers of configs with "
+                    "track_params: false (all shipped configs) depend on the raceline and are only built with --map.")
+    parser.add_argument("--racecar_version", type=str, nargs="*", default=None, help="Versions, default all")
+    parser.add_argument("--map", type=str, default=None, help="Map of the raceline, required to build the solvers of configs with track_params: false")
+    parser.add_argument("--cache_dir", type=str, default=default_cache_dir(), help="Root of the solver cache")
+    args = parser.parse_args()
+
+    config_dir = os.path.join(rospkg.RosPack().get_path("stack_master"), "config")
+    raceline = load_raceline(args.map) if args.map is not None else None
+    for racecar_version in args.racecar_version or racecar_versions(config_dir):
+        build_version(racecar_version, config_dir, raceline, args.cache_dir)
@@ -32,17 +32,27 @@
 #
 # author: Daniel Kloeser
 
+import os
+
 import numpy as np
-from acados_template import AcadosModel, AcadosOcp, AcadosOcpSolver
+from acados_template import AcadosModel, AcadosOcp
 from pbl_config import STMPCConfig, CarConfig, PacejkaTireConfig
 from .bicycle_model import bicycle_model
 from typing import Tuple
 from single_track_mpc.utils.indicies import StateIndex
+from mpc_utils.solver_cache import cached_solver, solver_key, source_bytes
+
+# config fields which are parameters or bounds set at runtime, they do not change the generated solver
+RUNTIME_FIELDS = {
+    "t_delay", "propagate_delay", "steps_delay", "track_safety_margin", "overtake_d", "warm_start", "fallback_cycles",
+    "qjerk", "qddelta", "qadv", "qn", "qalpha", "qv",
+    "delta_min", "delta_max", "v_min", "v_max", "a_min", "a_max", "ddelta_min", "ddelta_max", "alat_max",
+}
 
 
 def acados_settings(s0, kapparef, d_left, d_right,
                     stmpc_config: STMPCConfig, car_config: CarConfig,
-                    tire_config: PacejkaTireConfig) -> Tuple:
+                    tire_config: PacejkaTireConfig, cache_dir: str = None) -> Tuple:
     # create render arguments
     ocp = AcadosOcp()
 
@@ -213,8 +223,8 @@ def acados_settings(s0, kapparef, d_left, d_right,
 
     # set QP solver and integration
     ocp.solver_options.tf = stmpc_config.N / stmpc_config.MPC_freq
-    ocp.solver_options.qp_solver = "PARTIAL_CONDENSING_HPIPM"
-    ocp.solver_options.nlp_solver_type = "SQP_RTI"
+    ocp.solver_options.qp_solver = stmpc_config.qp_solver
+    ocp.solver_options.nlp_solver_type = stmpc_config.nlp_solver_type
     ocp.solver_options.hessian_approx = "GAUSS_NEWTON" #NOTE: do not believe the acados warning, setting hessian approximation to "EXACT" makes the solver fail
     ocp.solver_options.integrator_type = "ERK"
     ocp.solver_options.sim_method_num_stages = 4
@@ -222,8 +232,9 @@ def acados_settings(s0, kapparef, d_left, d_right,
     ocp.solver_options.tol = 1e-2
     ocp.solver_options.print_level = 0
 
-    # create solver
-    acados_solver = AcadosOcpSolver(ocp, json_file="acados_ocp.json")
+    # create solver, reused from the cache if it was built for the same model
+    acados_solver = cached_solver(ocp, get_solver_key(s0, kapparef, d_left, d_right, stmpc_config, car_config,
+                                                      tire_config), cache_dir)
 
     return constraint, model, acados_solver, params
 
@@ -244,5 +255,23 @@ def get_parameters(cfg: STMPCConfig) -> np.ndarray:
         cfg.track_safety_margin,
         cfg.overtake_d
     ]).astype(float)
+    if cfg.track_params:
+        # curvature and track bounds, set per stage from the raceline
+        params = np.append(params, [0.0, cfg.track_max_width, cfg.track_max_width])
 
     return params
+
+
+def get_solver_key(s0, kapparef, d_left, d_right, cfg: STMPCConfig, car_config: CarConfig,
+                   tire_config: PacejkaTireConfig) -> str:
+    """Hash of the model sources, configs and, unless they are stage parameters, the raceline"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    parts = [
+        source_bytes(os.path.join(here, "acados_settings.py"), os.path.join(here, "bicycle_model.py")),
+        cfg.model_dump(exclude=RUNTIME_FIELDS),
+        car_config,
+        tire_config,
+    ]
+    if not cfg.track_params:
+        parts += [s0, kapparef, d_left, d_right]
+    return solver_key(*parts)
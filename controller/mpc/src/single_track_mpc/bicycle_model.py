@@ -138,6 +138,17 @@ def bicycle_model(s0: list, kapparef: list, d_left: list, d_right: list,
     # calculate the index
     s_mod = fmod(s, pathlength)
 
+    if stmpc_config.track_params:
+        # curvature and track bounds along the horizon are stage parameters, the generated solver is track independent
+        kappa = MX.sym('kappa')
+        left_bound = MX.sym('left_bound')
+        right_bound = MX.sym('right_bound')
+        p = vertcat(p, kappa, left_bound, right_bound)
+    else:
+        kappa = kapparef_s(s_mod)
+        left_bound = left_bound_s(s_mod)
+        right_bound = right_bound_s(s_mod)
+
     # single track model definition with pacejka tire model
     # tire model
     # side slip angle
@@ -167,10 +178,10 @@ def bicycle_model(s0: list, kapparef: list, d_left: list, d_right: list,
     F_xr = motor_split_rear * F_motor
 
     # dynamics
-    s_dot = ((v_x * cos(theta)) - (v_y * sin(theta))) / (1 - kapparef_s(s_mod) * n)
+    s_dot = ((v_x * cos(theta)) - (v_y * sin(theta))) / (1 - kappa * n)
     n_dot = v_x * sin(theta) + v_y * cos(theta)
-    theta_dot = yaw_rate - (kapparef_s(s_mod) * (((v_x * cos(theta)) -
-                            (v_y * sin(theta))) / (1 - kapparef_s(s_mod) * n)))
+    theta_dot = yaw_rate - (kappa * (((v_x * cos(theta)) -
+                            (v_y * sin(theta))) / (1 - kappa * n)))
     v_x_dot = (1 / m) * (
         F_xr
         + F_xf * cos(delta)
@@ -202,6 +213,15 @@ def bicycle_model(s0: list, kapparef: list, d_left: list, d_right: list,
     )
     f_expl_func = Function('f_expl_func', [s, n, theta, v_x, v_y, delta, yaw_rate, accel, jerk, derDelta, p], [f_expl])
 
+    # fixed step RK4 of the continuous dynamics with constant input and parameters, x_next = f_rk4(x, u, p, dt)
+    dt = MX.sym("dt")
+    f_cont = Function("f_cont", [x, u, p], [f_expl])
+    k1 = f_cont(x, u, p)
+    k2 = f_cont(x + 0.5 * dt * k1, u, p)
+    k3 = f_cont(x + 0.5 * dt * k2, u, p)
+    k4 = f_cont(x + dt * k3, u, p)
+    f_rk4 = Function("f_rk4", [x, u, p, dt], [x + dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4)])
+
     # Define initial conditions
     model.x0 = np.zeros(n_x)
 
@@ -221,8 +241,8 @@ def bicycle_model(s0: list, kapparef: list, d_left: list, d_right: list,
         model.cost_expr_ext_cost_e -= terminal_multiplier * weight_adv * s_dot / freq
 
     # constraint on lateral errors
-    n_right_bound = n + right_bound_s(s_mod) - safety_margin
-    n_left_bound = n - left_bound_s(s_mod) + safety_margin
+    n_right_bound = n + right_bound - safety_margin
+    n_left_bound = n - left_bound + safety_margin
 
     # nonlinear constraints
     if stmpc_config.correct_v_y_dot:
@@ -281,6 +301,7 @@ def bicycle_model(s0: list, kapparef: list, d_left: list, d_right: list,
     model.params = params
     model.kappa = kapparef_s
     model.f_expl_func = f_expl_func
+    model.f_rk4 = f_rk4
     model.left_bound_s = left_bound_s
     model.right_bound_s = right_bound_s
     model.track_max = stmpc_config.track_max_width
@@ -1,25 +1,28 @@
 #! /usr/bin/env python3
-from typing import Tuple
+import threading
 import numpy as np
 import rospy
-from scipy.integrate import solve_ivp
 from frenet_converter.frenet_converter import FrenetConverter
 from f110_msgs.msg import WpntArray
 from single_track_mpc.acados_settings import acados_settings
-from single_track_mpc.utils.splinify import SplineTrack
+from spline_track.splinify import SplineTrack
 from single_track_mpc.utils.indicies import StateIndex
+from mpc_utils.mpc_base import MPCControllerBase
 from pbl_config import STMPCConfig, CarConfig, PacejkaTireConfig, TrailingConfig
 
 
-class Single_track_MPC_Controller:
+class Single_track_MPC_Controller(MPCControllerBase):
     def __init__(self, pose_frenet, racecar_version: str,
                  stmpc_config: STMPCConfig, car_config: CarConfig,
                  tire_config: PacejkaTireConfig,
                  trailing_config: TrailingConfig,
                  controller_frequency: float,
-                 using_gokart: bool) -> None:
+                 using_gokart: bool,
+                 raceline: WpntArray = None) -> None:
         """
         Initialise MPC object.
+
+        Input:  raceline    : global waypoints, if None they are received from /global_waypoints
         """
 
         # Init the parameters
@@ -35,7 +38,15 @@ class Single_track_MPC_Controller:
             rospy.logwarn("[MPC Controller] Controller frequency and MPC frequency are not equal. Warm start update will not be applied.")
 
         # Init the solver
-        self.mpc_initialize_solver(pose_frenet)
+        self.mpc_initialize_solver(pose_frenet, raceline)
+
+    @property
+    def mpc_config(self) -> STMPCConfig:
+        return self.stmpc_config
+
+    def reset_progress(self) -> None:
+        self.nr_laps = 0
+        self.previous_frenet_s = 0
 
     def mpc_init_params(self) -> None:
         # upper layer parameters: MPC
@@ -50,6 +61,11 @@ class Single_track_MPC_Controller:
         buf_size = 2
         self.steering_angle_buf = np.zeros(buf_size)
 
+        # held by main_loop and the raceline update, such that a solve never mixes two racelines
+        self.track_lock = threading.Lock()
+        # set if the raceline changed the s coordinates, the solver is then warm started from the current state
+        self.reset_warm_start = False
+
         # Initial state
         self.mpc_sd = np.zeros((self.stmpc_config.N + 1, 2))
         self.u0 = np.zeros(2)
@@ -66,13 +82,29 @@ class Single_track_MPC_Controller:
         self.gap_actual = None
         self.v_diff = None
         self.i_gap = 0
-
-    def mpc_initialize_solver(self, pose_frenet: np.ndarray) -> None:
+        # per stage parameters (N+1, n_p) and the config they were built from
+        self.stage_params = None
+        self.stage_config_key = None
+        # last successful solution (states (N+1, n_x), inputs (N, n_u)) for the shifted warm start
+        self.x_solution = None
+        self.u_solution = None
+        self.t_solution = None  # time in seconds of the solve that produced the last successful solution
+        # True while the shifted last solution is followed because the solver failed
+        self.fallback_active = False
+        # solver statistics
+        self.n_solves = 0
+        self.n_failed_solves = 0
+        self.solve_time_sum = 0.0
+
+    def mpc_initialize_solver(self, pose_frenet: np.ndarray, raceline: WpntArray = None) -> None:
         """Initialises the controller. Global waypoints are stored in a SplineTrack. All necessary parameters are stored. """
 
-        rospy.loginfo(f"[MPC Controller] Waiting for global waypoints")
-        mincurv_raceline = rospy.wait_for_message("/global_waypoints", WpntArray)
-        rospy.loginfo(f"[MPC Controller] Global waypoints obtained")
+        online = raceline is None
+        if online:
+            rospy.loginfo(f"[MPC Controller] Waiting for global waypoints")
+            raceline = rospy.wait_for_message("/global_waypoints", WpntArray)
+            rospy.loginfo(f"[MPC Controller] Global waypoints obtained")
+        mincurv_raceline = raceline
 
         x, y = self._transform_waypoints_to_cartesian(mincurv_raceline.wpnts)
         self.fren_conv = FrenetConverter(x, y)
@@ -86,6 +118,8 @@ class Single_track_MPC_Controller:
         kapparef = [x.kappa_radpm for x in mincurv_raceline.wpnts]
         vx_ref = [x.vx_mps for x in mincurv_raceline.wpnts]
         self.s_ref = np.array([x.s_m for x in mincurv_raceline.wpnts])
+        # raceline samples for the per stage curvature and track bounds
+        self.track_samples = np.column_stack((kapparef, d_left, d_right))
         (
             self.constraint, self.model, self.acados_solver, self.model_params
         ) = acados_settings(self.s_ref, kapparef, d_left, d_right,
@@ -97,6 +131,10 @@ class Single_track_MPC_Controller:
         self.kappa = kapparef
         self.prev_acc = 0
 
+        if self.stmpc_config.track_params and online:
+            # the solver does not depend on the track, raceline updates only replace the samples
+            rospy.Subscriber("/global_waypoints", WpntArray, self.global_waypoints_cb)
+
     def apply_warm_start(self, pose_frenet: np.ndarray):
         """Applies a warm start to the MPC solver.
 
@@ -121,7 +159,31 @@ class Single_track_MPC_Controller:
             position_in_map_frenet,
             single_track_state,
             track_length,
-            compute_time):
+            compute_time,
+            stamp: float = None):
+        """
+        Runs one MPC iteration while holding the track lock, such that a raceline update never lands in a solve.
+
+        Input:  stamp       : time of the control cycle in seconds, the ROS time if None
+        """
+        if stamp is None:
+            stamp = rospy.get_time()
+        with self.track_lock:
+            return self._main_loop(state, position_in_map, waypoint_array_in_map, speed_now, opponent,
+                                   position_in_map_frenet, single_track_state, track_length, compute_time, stamp)
+
+    def _main_loop(
+            self,
+            state,
+            position_in_map,
+            waypoint_array_in_map,
+            speed_now,
+            opponent,
+            position_in_map_frenet,
+            single_track_state,
+            track_length,
+            compute_time,
+            stamp):
         # TODO: possibly rewrite
         # Updating parameters from manager
         self.state = state
@@ -165,94 +227,75 @@ class Single_track_MPC_Controller:
         x0 = np.array([self.fre_s, self.fre_d, self.fre_alpha, speed_now, self.vel_y,
                       self.measured_steer, self.yaw_rate, self.measured_acc], dtype=np.float64)
 
-        # time delat compensation
-        self.t_delay = self.comp_time
-        self.t_delay = 0.00
+        # time delay compensation, if enabled the state is propagated over the delay with the last applied input
+        self.t_delay = self.stmpc_config.t_delay + self.comp_time
+        if self.stmpc_config.propagate_delay and self.t_delay > 0 and x0[3] >= 0.1:
+            propagated_x = self.propagate_time_delay(x0, self.u0)
+        else:
+            propagated_x = x0
 
-        # print("t_delay",self.t_delay)
-        # if x0[3] >= 0.1:
-        #     propagated_x = self.propagate_time_delay(x0, self.u0)
-        # else:
-        propagated_x = x0
+        if self.reset_warm_start:
+            self.apply_warm_start(pose_frenet=[self.fre_s, self.fre_d, self.fre_alpha])
+            self.reset_warm_start = False
 
         # set the initial state for the mpc
         self.acados_solver.set(0, "lbx", propagated_x)
         self.acados_solver.set(0, "ubx", propagated_x)
 
         # dynamically change the target speed, weight parameters and constraints
+        self.update_stage_config()
         trailing = (self.state == "TRAILING" and self.opponent is not None)
         if trailing:  # Trailing controller
-            target_v_speed = self.trailing_controller(self.waypoint_array_in_map[0, 2])
-        for i in range(self.stmpc_config.N + 1):
-            # head to head racing
             # for the trailing, MPC just needs to change the reference speed (get from the trailing controller)
-            if not trailing:
-                idx = np.abs(self.waypoint_array_in_map[:,4]  - self.mpc_sd[i,0]%self.spline.track_length).argmin()
-                target_v_speed=self.waypoint_array_in_map[idx,2]
-                self.overtake_d=0
-                # head to head overtaking
-                
-                if self.state == "OVERTAKE":
-                    self.overtake_d = self.waypoint_array_in_map[idx, 3]
-
-            if i < self.stmpc_config.steps_delay:
-                # NOTE: increase the weight of the the steering angle cost, to effectively keep it constant
-                multiplier = 1e6
-                online_parameters = np.array([target_v_speed,
-                                              self.stmpc_config.qadv,
-                                              self.stmpc_config.qv,
-                                              self.stmpc_config.qn,
-                                              self.stmpc_config.qalpha,
-                                              self.stmpc_config.qjerk,
-                                              multiplier * self.stmpc_config.qddelta,
-                                              self.stmpc_config.alat_max,
-                                              self.stmpc_config.a_min,
-                                              self.stmpc_config.a_max,
-                                              self.stmpc_config.track_safety_margin,
-                                              self.overtake_d],
-                                             dtype=np.float64)
-            else:
-                online_parameters = np.array([target_v_speed,
-                                              self.stmpc_config.qadv,
-                                              self.stmpc_config.qv,
-                                              self.stmpc_config.qn,
-                                              self.stmpc_config.qalpha,
-                                              self.stmpc_config.qjerk,
-                                              self.stmpc_config.qddelta,
-                                              self.stmpc_config.alat_max,
-                                              self.stmpc_config.a_min,
-                                              self.stmpc_config.a_max,
-                                              self.stmpc_config.track_safety_margin,
-                                              self.overtake_d],
-                                             dtype=np.float64)
-
-            self.acados_solver.set(i, "p", online_parameters)
+            self.stage_params[:, 0] = self.trailing_controller(self.waypoint_array_in_map[0, 2])
+            self.stage_params[:, 11] = self.overtake_d
+        else:
+            # head to head racing
+            target_v_speed, wpnt_d = self.stage_reference(self.mpc_sd[:, 0] % self.spline.track_length)
+            self.stage_params[:, 0] = target_v_speed
+            # head to head overtaking
+            self.stage_params[:, 11] = wpnt_d if self.state == "OVERTAKE" else 0
+            self.overtake_d = self.stage_params[-1, 11]
 
-            if i < self.stmpc_config.N:
-                self.acados_solver.set(i, "lbu", np.array([-50, self.stmpc_config.ddelta_min]))
-                self.acados_solver.set(i, "ubu", np.array([50, self.stmpc_config.ddelta_max]))
-                # do not change i+1 to i since mpc needs the initial state
-                self.acados_solver.set(
-                    i + 1, "lbx", np.array([self.stmpc_config.v_min, self.stmpc_config.delta_min, self.stmpc_config.a_min]))
-                self.acados_solver.set(
-                    i + 1, "ubx", np.array([self.stmpc_config.v_max, self.stmpc_config.delta_max, self.stmpc_config.a_max]))
+        if self.stmpc_config.track_params:
+            self.stage_params[:, -3:] = self.track_parameters(self.mpc_sd[:, 0])
+
+        for i in range(self.stmpc_config.N + 1):
+            self.acados_solver.set(i, "p", self.stage_params[i])
 
         # Update Warm Start
-        # if self.stmpc_config.MPC_freq == self.controller_frequency:
-        #     self.update_warm_start()
+        if self.x_solution is not None:
+            elapsed = stamp - self.t_solution
+        if self.stmpc_config.warm_start == "shift" and self.x_solution is not None:
+            self.update_warm_start(elapsed)
 
         # Solve OCP
         status = self.acados_solver.solve()
+        self.n_solves += 1
+        self.solve_time_sum += float(np.squeeze(self.acados_solver.get_stats("time_tot")))
+        self.fallback_active = False
         if status != 0:
-            # if the solver fails, apply warm start again
-            # the initial warm start is a bit rough, but it does the job
-            self.apply_warm_start(pose_frenet=[self.fre_s, self.fre_d, self.fre_alpha])
+            self.n_failed_solves += 1
+            if (self.x_solution is not None
+                    and round(elapsed * self.controller_frequency) <= self.stmpc_config.fallback_cycles
+                    and self.update_warm_start(elapsed)):
+                # if the solver fails, follow the shifted last feasible solution, also the initial guess of the next solve
+                self.fallback_active = True
+            else:
+                # if the solver fails for too long, apply warm start again
+                # the initial warm start is a bit rough, but it does the job
+                self.x_solution = None
+                self.apply_warm_start(pose_frenet=[self.fre_s, self.fre_d, self.fre_alpha])
 
         # get solution
-        self.u0 = self.acados_solver.get(0, "u")
-        self.prev_acc = self.acados_solver.get(0, "x")[StateIndex.ACCEL.value]
+        x_traj, u_traj = self.get_trajectory()
+        if status == 0:
+            self.x_solution, self.u_solution = x_traj, u_traj
+            self.t_solution = stamp
+        self.u0 = u_traj[0]
+        self.prev_acc = x_traj[0, StateIndex.ACCEL.value]
         delayed_index = self.stmpc_config.steps_delay + 1
-        self.pred_x = self.acados_solver.get(delayed_index, "x")
+        self.pred_x = x_traj[delayed_index]
         self.steering_angle = self.pred_x[5]  # propagated_x[5] + self.u0[1]/40 #
         self.speed = self.pred_x[3]  # propagated_x[3] + self.u0[0]/40 #
         self.acceleration = self.prev_acc + self.u0[0] / self.controller_frequency # NOTE: Euler integration for accounting different frequencies controller/mpc time step
@@ -267,16 +310,9 @@ class Single_track_MPC_Controller:
 
         ##### visualization #####
         # Creating waypoint array with predicted positions
-        self.mpc_sd = np.array([
-            self.acados_solver.get(j, "x")[:2] for j in range(self.stmpc_config.N + 1)
-        ])
-        if status == 0:
-            states = []
-            for node in range(self.stmpc_config.N + 1):
-                result = self.acados_solver.get(node, "x").tolist()
-                for item in result:
-                    states.append(item)
-            self.states = states
+        self.mpc_sd = x_traj[:, :2]
+        if status == 0 or self.fallback_active:
+            self.states = x_traj.ravel().tolist()
             return self.speed, self.acceleration, self.jerk, self.steering_angle, self.states, status
         else:
             return 0, 0, 0, self.measured_steer , self.states, status
@@ -284,6 +320,54 @@ class Single_track_MPC_Controller:
     #############
     # Utilities #
     #############
+    def _stage_config_key(self) -> tuple:
+        cfg = self.stmpc_config
+        return (cfg.N, cfg.track_params, cfg.track_max_width, cfg.steps_delay, cfg.qadv, cfg.qv, cfg.qn, cfg.qalpha,
+                cfg.qjerk, cfg.qddelta, cfg.alat_max, cfg.a_min, cfg.a_max, cfg.track_safety_margin, cfg.ddelta_min,
+                cfg.ddelta_max, cfg.v_min, cfg.v_max, cfg.delta_min, cfg.delta_max)
+
+    def update_stage_config(self) -> None:
+        """
+        Rebuilds the per stage parameters and sets the constant bounds of the stages, if the config changed since the
+        last call. The reference speed and the overtaking d (columns 0 and 11) are overwritten every solve.
+        """
+        key = self._stage_config_key()
+        if key == self.stage_config_key:
+            return
+        self.stage_config_key = key
+        cfg = self.stmpc_config
+
+        stage_params = np.array([0.0,
+                                 cfg.qadv,
+                                 cfg.qv,
+                                 cfg.qn,
+                                 cfg.qalpha,
+                                 cfg.qjerk,
+                                 cfg.qddelta,
+                                 cfg.alat_max,
+                                 cfg.a_min,
+                                 cfg.a_max,
+                                 cfg.track_safety_margin,
+                                 0.0],
+                                dtype=np.float64)
+        if cfg.track_params:
+            # curvature and track bounds, overwritten every solve
+            stage_params = np.append(stage_params, [0.0, cfg.track_max_width, cfg.track_max_width])
+        self.stage_params = np.tile(stage_params, (cfg.N + 1, 1))
+        # NOTE: increase the weight of the the steering angle cost, to effectively keep it constant during the delay
+        self.stage_params[:cfg.steps_delay, 6] *= 1e6
+
+        lbu = np.array([-50, cfg.ddelta_min])
+        ubu = np.array([50, cfg.ddelta_max])
+        lbx = np.array([cfg.v_min, cfg.delta_min, cfg.a_min])
+        ubx = np.array([cfg.v_max, cfg.delta_max, cfg.a_max])
+        for i in range(cfg.N):
+            self.acados_solver.set(i, "lbu", lbu)
+            self.acados_solver.set(i, "ubu", ubu)
+            # do not change i+1 to i since mpc needs the initial state
+            self.acados_solver.set(i + 1, "lbx", lbx)
+            self.acados_solver.set(i + 1, "ubx", ubx)
+
     def get_warm_start(self, pose_frenet: np.ndarray, const_acc: float, const_steer_vel: float) -> np.array:
         """
         Returns a warm start trajectory for the MPC. This is done by propagating the current state with a constant acceleration and steering angle.
@@ -293,76 +377,18 @@ class Single_track_MPC_Controller:
 
         Returns: np.array    : Warm start trajectory
         """
-        warm_start = np.zeros((self.stmpc_config.N + 1, 10)) # TODO: hardcoded state space dimension
-        warm_start[0] = np.array([pose_frenet[0], pose_frenet[1], pose_frenet[2],
-                                 1, 0, 0, 0, const_acc, 0, const_steer_vel]) # TODO setting the velocity to current actual velocity might remove slowing down
+        warm_start = np.zeros((self.stmpc_config.N + 1, self.model.n_x + self.model.n_u))
+        warm_start[:, self.model.n_x:] = [0, const_steer_vel]
+        warm_start[0, :self.model.n_x] = [pose_frenet[0], pose_frenet[1], pose_frenet[2],
+                                          1, 0, 0, 0, const_acc] # TODO setting the velocity to current actual velocity might remove slowing down
         for i in range(1, self.stmpc_config.N + 1):
-            xdot = self._dynamics_of_car(0, warm_start[i - 1])
-            warm_start[i] = warm_start[i-1] + np.array(xdot) / self.stmpc_config.MPC_freq  # ugly euler integration
+            warm_start[i, :self.model.n_x] = self.integrate(
+                warm_start[i - 1, :self.model.n_x], warm_start[i - 1, self.model.n_x:], self.t_MPC)
         return warm_start
 
-    def update_warm_start(self) -> np.array:
-        """
-        Updates the warm start trajectory for the MPC. This is done by propagating the current states with the given inputs and reapplying the last input.
-        """
-        for i in range(self.stmpc_config.N + 1):
-            # Get the current state and input
-            current_state = self.acados_solver.get(i, "x")
-            if i < self.stmpc_config.N:
-                current_input = self.acados_solver.get(i, "u")
-            else:
-                current_input = np.zeros(self.model.n_u)  # Use zeros for the last step input
-
-            # Concatenate state and input for dynamics computation
-            state_with_input = np.concatenate((current_state, current_input))
-
-            # Compute the state derivative
-            xdot = self._dynamics_of_car(0, state_with_input)
-
-            # Update the state using Euler integration
-            updated_state = current_state + np.array(xdot)[:self.model.n_x] / self.controller_frequency
-            self.acados_solver.set(i, "x", updated_state)
-
-            # Update the input for the next state
-            if i < self.stmpc_config.N - 1:
-                next_inputs = self.acados_solver.get(i + 1, "u")
-                self.acados_solver.set(i, "u", next_inputs)
-
-    def _transform_waypoints_to_coords(self, data: WpntArray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-        """Helper function to store the received waypoints into the right format such that they can be used for initialisation of SplineTrack.
-
-        Input: data: WpntArray: Holds the data received from the globalwaypoints.
-
-        Returns: Tuple: Stores the waypoints as follows: Left boundaries, reference path, right boundaries
-        """
-        waypoints = np.zeros((len(data), 2))
-        d_left = np.zeros(len(data))
-        d_right = np.zeros(len(data))
-        boundaries = np.zeros((len(data), 2))
-        for idx, wpnt in enumerate(data):
-            waypoints[idx] = [wpnt.x_m, wpnt.y_m]
-            d_left[idx] = wpnt.d_left              # Fix for boundaries due to frenet cartesian conversion
-            d_right[idx] = wpnt.d_right              # Fix for boundaries due to frenet cartesian conversion
-        res_coords = np.array([boundaries[:-1], waypoints[:-1], boundaries[:-1]])
-        return d_left, res_coords, d_right
-
-    def _transform_waypoints_to_cartesian(self, data: WpntArray) -> Tuple[np.ndarray, np.ndarray]:
-        """Helper function to store the received waypoints into the right format such that they can be used for initialisation of SplineTrack.
-
-        Input: data: WpntArray: Holds the data received from the globalwaypoints.
-
-        Returns: Tuple: Stores the waypoints as follows: Left boundaries, reference path, right boundaries
-        """
-        x = np.zeros(len(data))
-        y = np.zeros(len(data))
-        for idx, wpnt in enumerate(data):
-            x[idx] = wpnt.x_m
-            y[idx] = wpnt.y_m
-        return np.array(x), np.array(y)
-
     def propagate_time_delay(self, states: np.array, inputs: np.array) -> np.array:
         """
-        RK45 forward propagation. Calls the function _dynamics_of_car which contains the dynamics of the car.
+        RK4 forward propagation over `t_delay` with the inputs held constant.
 
         Input:  np.array    : Holds the current state which needs to be propagated.
                 inputs      : Holds the current inputs from the MPC.
@@ -370,35 +396,9 @@ class Single_track_MPC_Controller:
         Returns: np.array   : Propagated state without input.
 
         """
+        # the steering rate is not applied during the delay
+        solution = self.integrate(states, np.array([inputs[0], 0.0]), self.t_delay)
 
-        # Initial condition on the ODE
-        x0 = np.concatenate((states, [inputs[0]], [0]), axis=0)
-        # forward propagation
-        self.t_delay = 0.0
-        # DEBUG print nicely formatted aligned state
-        # print("BEFORE state:", end=" ")
-        # for x in x0:
-        #     print(f"{x:5.2f}", end=" ")
-        # print("\n")
-
-        solution = solve_ivp(
-            self._dynamics_of_car,
-            t_span=[
-                0,
-                self.t_delay],
-            y0=x0,
-            method='RK45',
-            atol=1e-4,
-            rtol=1e-4)
-        # NOTE: can't really converge? seen with negative acceleration
-
-        # DEBUG print nicely formatted aligned state
-        # print("AFTER  state:", end=" ")
-        # for x in solution.y[:,-1]:
-        #     print(f"{x:5.2f}", end=" ")
-        # print("\n")
-
-        solution = [x[-1] for x in solution.y]
         # Constraint on max. steering angle
         if abs(solution[5]) > self.constraint.delta_max:
             solution[5] = np.sign(solution[5]) * self.constraint.delta_max
@@ -411,35 +411,7 @@ class Single_track_MPC_Controller:
         if abs(solution[3]) < self.constraint.v_x_min:
             solution[3] = self.constraint.v_x_min
 
-        # Only get the state as solution of where the car will be in t_delay seconds
-        # not including the input
-        # states[5] = solution[5]
-        # states[6] = solution[6]
-        # return states
-        return np.array(solution)[:-2]
-
-    def _dynamics_of_car(self, t, x0) -> list:
-        '''
-        Used for forward propagation. This function takes the dynamics from the acados model.
-        '''
-
-        s = x0[0]
-        n = x0[1]
-        theta = x0[2]
-        v_x = x0[3]
-        v_y = x0[4]
-        delta = x0[5]
-        yaw_rate = x0[6]
-        accel = x0[7]
-        derDelta = x0[8]
-        jerk = x0[9]
-        xdot = self.model.f_expl_func(
-            s, n, theta, v_x, v_y, delta, yaw_rate, accel, derDelta, jerk, self.model_params.p)
-
-        xdot = [float(xdot[0]), float(xdot[1]), float(xdot[2]), float(xdot[3]),
-                float(xdot[4]), float(xdot[5]), float(xdot[6]), float(xdot[7]), derDelta, jerk]
-
-        return xdot
+        return solution
 
     def trailing_controller(self, global_speed):
 
@@ -18,7 +18,7 @@ from pbl_config import (load_car_config_ros, load_pacejka_tire_config_ros,
 from plotting_fnc import *
 from single_track_mpc.bicycle_model import bicycle_model
 from single_track_mpc.utils.indicies import StateIndex
-from single_track_mpc.utils.splinify import SplineTrack
+from spline_track.splinify import SplineTrack
 from std_msgs.msg import Float64MultiArray
 from visualization_msgs.msg import Marker, MarkerArray
 
@@ -0,0 +1 @@
+from spline_track.splinify import *
@@ -7,17 +7,19 @@ import matplotlib.pyplot as plt
 class EnhancedSpline():
     """
     A class that defines a spline, with functions that help.
+
+    The line is sampled once into a table, which the closest point projections search before refining on the spline.
+    The evaluation functions accept a single theta or an array of thetas.
     """
 
-    def __init__(self, coords, params, track_length, lame = True) -> None:
+    def __init__(self, coords, params, track_length, lame = True, table_step: float = 0.05) -> None:
         """
         Args:
             coords: coordinate that define the spline
             params: parameters that correspon to the coordinates
             track_length: total length
-            safety_margin: the track will be shrinked by this amount on both
-            sides so that the car will be at a more safe distance from the
-            borders
+            lame: if True, the first coordinate is appended to close the line
+            table_step: approximate distance in theta between the samples of the projection table
 
         """
         self.track_length = track_length
@@ -45,6 +47,14 @@ class EnhancedSpline():
                 k = k,
             )
 
+        # sampling table, the step divides the track length such that the table wraps around exactly
+        n_table = int(np.ceil(track_length / table_step))
+        self.table_step = track_length / n_table
+        self.theta_table = np.arange(n_table) * self.table_step
+        self.coord_table = np.column_stack((self.line_x(self.theta_table), self.line_y(self.theta_table)))
+        # result of the last projection of a single point, warm start of the next one
+        self.theta_prev = None
+
     def get_coordinate(self, theta) -> np.array:
         """
         Returns the coordinate of the point corresponding to theta on the
@@ -53,7 +63,7 @@ class EnhancedSpline():
         Args:
             theta: parameter which is used to evaluate the spline
         Returns:
-            coord: 2-d coordinate
+            coord: 2-d coordinate, shape (2,) or (2, k) for k thetas
         """
         theta = theta%self.track_length
 
@@ -61,75 +71,75 @@ class EnhancedSpline():
 
         return coord
 
-    def find_theta(self, coord: np.ndarray, theta_est, eps: float = 0.01):
+    def find_theta(self, coord: np.ndarray, theta_est = None, eps: float = 0.01):
         """
         Find the parameter of the track nearest to the point given an
         approximation of it.
 
-        Args:
-            coord: coordinate of point projected around, as np.array
-            track: splinified track
-            theta_est: best guess at theta
-            eps: precision at which the algorithm looks around for theta
-        """
-
-        found = False
-        max_dist = self.track_length/20
-
-        dist = np.linalg.norm(
-            coord - np.array(self.get_coordinate(theta_est)).reshape(2)
-            )
-        min_dist = dist
-        min_theta = theta_est
-        theta_i = theta_est
-        while not found:
-            theta_i += eps
-            dist = np.linalg.norm(
-                coord - np.array(self.get_coordinate(theta_i)).reshape(2)
-                )
+        The nearest table sample within a twentieth of the track length around the approximation is refined with
+        Newton steps on the squared distance. Several points can be projected at once.
 
-            if dist <= min_dist:
-                min_dist = dist
-                min_theta = theta_i
-            else:
-                found = True
-
-            if theta_i - theta_est >= max_dist:
-                found = True
-
-        # now try to look backwards
-        found = False
-        theta_i = theta_est
-        while not found:
-            theta_i -= eps
-
-            dist = np.linalg.norm(
-                coord - np.array(self.get_coordinate(theta_i)).reshape(2)
-                )
-
-            if dist <= min_dist:
-                min_dist = dist
-                min_theta = theta_i
-            else:
-                found = True
-
-            if theta_est - theta_i >= max_dist:
-                found = True
+        Args:
+            coord: coordinate of point projected around, as np.array of shape (2,) or (k, 2)
+            theta_est: best guess at theta, scalar or shape (k,). If None, the result of the last projection of a
+                single point is used
+            eps: precision of theta
 
+        Returns:
+            min_theta: parameter of the nearest point, in the same lap as theta_est
+        """
+        coord = np.asarray(coord, dtype=float)
+        if theta_est is None:
+            if self.theta_prev is None:
+                return self.find_theta_slow(coord, eps)
+            theta_est = self.theta_prev
+        coords = coord.reshape(-1, 2)
+        theta_est = np.broadcast_to(np.asarray(theta_est, dtype=float), coords.shape[:1])
+
+        n_table = self.theta_table.shape[0]
+        half_window = int(np.ceil(self.track_length / 20 / self.table_step))
+        offsets = np.arange(-half_window, half_window + 1)
+        idx_est = np.rint((theta_est % self.track_length) / self.table_step).astype(int)
+        # squared distances to the table samples of the window, shape (k, window)
+        dists = np.sum((self.coord_table[(idx_est[:, None] + offsets) % n_table] - coords[:, None, :])**2, axis=2)
+        best = offsets[np.argmin(dists, axis=1)]
+        theta = theta_est - theta_est % self.track_length + (idx_est + best) * self.table_step
+
+        min_theta = self._refine_theta(coords, theta, eps)
+        if coord.ndim == 1:
+            min_theta = float(min_theta[0])
+            self.theta_prev = min_theta
         return min_theta
 
+    def _refine_theta(self, coords: np.ndarray, theta: np.ndarray, eps: float, max_iter: int = 5) -> np.ndarray:
+        """
+        Newton steps on the squared distance between the points and the line, each limited to one table step.
+        """
+        for _ in range(max_iter):
+            theta_mod = theta % self.track_length
+            r_x = self.line_x(theta_mod) - coords[:, 0]
+            r_y = self.line_y(theta_mod) - coords[:, 1]
+            x_d, y_d = self.line_x(theta_mod, 1), self.line_y(theta_mod, 1)
+            x_dd, y_dd = self.line_x(theta_mod, 2), self.line_y(theta_mod, 2)
+            grad = r_x * x_d + r_y * y_d
+            hess = x_d**2 + y_d**2 + r_x * x_dd + r_y * y_dd
+            step = np.where(hess > 0, -grad / np.where(hess > 0, hess, 1.0), 0.0)
+            step = np.clip(step, -self.table_step, self.table_step)
+            theta = theta + step
+            if np.all(np.abs(step) < eps):
+                break
+        return theta
+
     def get_angle(self, theta) -> float:
         """
         Returns the angle wrt x axis tangent to the line given the
-        parameter theta
+        parameter theta, in [0, 2pi)
         """
         theta = theta%self.track_length
         delt_y = self.line_y(theta, 1)
         delt_x = self.line_x(theta, 1)
 
-        angle = arctan2(delt_y, delt_x)
-        if angle<0:
-            angle += 2*np.pi
+        angle = arctan2(delt_y, delt_x) % (2*np.pi)
 
         return angle
 
@@ -141,11 +151,11 @@ class EnhancedSpline():
             theta: parameter which is used to evaluate the spline
 
         Returns:
-            der: dx/dtheta, dy/dtheta
+            der: dx/dtheta, dy/dtheta, shape (2,) or (2, k) for k thetas
         """
         theta = theta%self.track_length
 
-        der = [self.line_x(theta, 1), self.line_y(theta, 1)]
+        der = np.array([self.line_x(theta, 1), self.line_y(theta, 1)])
 
         return der
 
@@ -200,33 +210,28 @@ class EnhancedSpline():
     def find_theta_slow(self, coord: np.ndarray, eps: float = 0.1):
         """
         Find the parameter of the line nearest to the point without an
-        approximation of it.
-        Could be slower than find_theta as it looks along the whole line.
+        approximation of it, by searching the whole sampling table.
 
         Args:
-            coord: coordinate of point projected around, as np.array
-            track: splinified track
-            eps: precision at which the algorithm looks around for theta
-        """
-
-        found = False
-        dist = np.linalg.norm(coord - np.array(self.get_coordinate(0)))
-
-        min_dist = dist
-        min_theta = 0
-        theta_i = 0
-
-        while theta_i <= self.track_length:
-            theta_i += eps
-            dist = np.linalg.norm(
-                coord - np.array(self.get_coordinate(theta_i))
-                )
-
-            if dist <= min_dist:
-                min_dist = dist
-                min_theta = theta_i
-
+            coord: coordinate of point projected around, as np.array of shape (2,) or (k, 2)
+            eps: precision of theta
 
+        Returns:
+            min_theta: parameter of the nearest point in [0, track_length)
+        """
+        coord = np.asarray(coord, dtype=float)
+        coords = coord.reshape(-1, 2)
+        # squared distances to all table samples, in chunks to bound the memory for many points
+        theta = np.empty(coords.shape[0])
+        for start in range(0, coords.shape[0], 256):
+            chunk = coords[start:start + 256]
+            dists = np.sum((self.coord_table[None, :, :] - chunk[:, None, :])**2, axis=2)
+            theta[start:start + 256] = self.theta_table[np.argmin(dists, axis=1)]
+
+        min_theta = self._refine_theta(coords, theta, eps) % self.track_length
+        if coord.ndim == 1:
+            min_theta = float(min_theta[0])
+            self.theta_prev = min_theta
         return min_theta
 
     def is_coord_behind(self, coord: np.ndarray, theta: float):
@@ -299,16 +304,16 @@ class SplineTrack():
 
         # 2 shrink the track for robustness #
         #####################################
-        for i in range(len(params)-1):
-            # shrink int line
-            direction = coords[1,i,:] - coords[0,i,:]
-            coords[0,i,:] = coords[0,i,:] + \
-                safety_margin*direction/np.linalg.norm(direction+0.001)
+        n_coords = len(params)-1
+        # shrink int line
+        direction = coords[1,:n_coords,:] - coords[0,:n_coords,:]
+        coords[0,:n_coords,:] += \
+            safety_margin*direction/np.linalg.norm(direction+0.001, axis=1, keepdims=True)
 
-            # shrink out line
-            direction = coords[1,i,:] - coords[2,i,:]
-            coords[2,i,:] = coords[2,i,:] + \
-                safety_margin*direction/np.linalg.norm(direction+0.001)
+        # shrink out line
+        direction = coords[1,:n_coords,:] - coords[2,:n_coords,:]
+        coords[2,:n_coords,:] += \
+            safety_margin*direction/np.linalg.norm(direction+0.001, axis=1, keepdims=True)
 
         # 3 set track #
         ###############
@@ -460,16 +465,15 @@ class SplineTrack():
 
         return derivative
 
-    def find_theta(self, coord: np.ndarray, theta_est, eps: float = 0.01):
+    def find_theta(self, coord: np.ndarray, theta_est = None, eps: float = 0.01):
         """
         Find the parameter of the track nearest to the point given an
         approximation of it.
 
         Args:
-            coord: coordinate of point projected around, as np.array
-            track: splinified track
-            theta_est: best guess at theta
-            eps: precision at which the algorithm looks around for theta
+            coord: coordinate of point projected around, as np.array of shape (2,) or (k, 2)
+            theta_est: best guess at theta, the last projected theta if None
+            eps: precision of theta
         """
 
         min_theta = self.refline.find_theta(coord, theta_est, eps)
@@ -756,16 +760,15 @@ class SplineTrackNew():
 
         return derivative
 
-    def find_theta(self, coord: np.ndarray, theta_est, eps: float = 0.01):
+    def find_theta(self, coord: np.ndarray, theta_est = None, eps: float = 0.01):
         """
         Find the parameter of the track nearest to the point given an
         approximation of it.
 
         Args:
-            coord: coordinate of point projected around, as np.array
-            track: splinified track
-            theta_est: best guess at theta
-            eps: precision at which the algorithm looks around for theta
+            coord: coordinate of point projected around, as np.array of shape (2,) or (k, 2)
+            theta_est: best guess at theta, the last projected theta if None
+            eps: precision of theta
         """
 
         min_theta = self.refline.find_theta(coord, theta_est, eps)
@@ -887,17 +890,9 @@ def find_params(coords: np.ndarray):
         length: length of the track
     """
 
-    cum_param = [0]
-
-    prev_el = coords[0]
-    length = 0
-
-    for el in coords[1:]:
-        length += np.linalg.norm((el-prev_el))
-        prev_el = el
-        cum_param.append(length)
-
-    length += np.linalg.norm(el - coords[0])
-    cum_param.append(length)
+    coords = np.asarray(coords, dtype=float)
+    # segment lengths, including the one closing the loop
+    seg_lengths = np.linalg.norm(np.diff(coords, axis=0, append=coords[:1]), axis=1)
+    cum_param = np.concatenate(([0.0], np.cumsum(seg_lengths)))
 
-    return cum_param, length
+    return cum_param, cum_param[-1]
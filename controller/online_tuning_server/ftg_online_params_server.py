@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+import rospy
+from dynamic_reconfigure.server import Server
+from controller.cfg import dyn_ftg_params_tunerConfig
+from pbl_config import FTGConfig, load_FTG_config_ros, FTGConfigDyn
+
+
+def callback(config, level):
+    rospy.loginfo("[FTG dynamic parameter server] FTG Parameters Updated")
+
+    for k in FTGConfigDyn.model_fields.keys():
+        # Ensuring rounding to the second decimal
+        setattr(config, k, round(getattr(config, k), 2))
+
+    return config
+
+def get_default_dict() -> dict:
+    # get full config from yaml
+    racecar_version = rospy.get_param('/racecar_version', 'DEFAULT') # NUCX or JETx, not set for mapping
+
+    config: FTGConfig = load_FTG_config_ros(racecar_version)
+    # only iterate in possible keys of the dynamic reconfigure
+    default_config = {key: getattr(config, key) for key in FTGConfigDyn.model_fields.keys()}
+
+    return default_config
+
+
+if __name__ == "__main__":
+    rospy.init_node("ftg_dyn_rec_tuner_server", anonymous=False)
+
+    server = Server(dyn_ftg_params_tunerConfig, callback)
+
+    default_dict = get_default_dict()
+
+    server.update_configuration(default_dict)
+    rospy.spin()
@@ -2,6 +2,7 @@
 
 import logging
 import numpy as np
+from waypoint_tracker import NearestWaypointTracker
 
 class PP_Controller:
     """This class implements a Pure Pursuit controller for autonomous driving.
@@ -66,6 +67,7 @@ class PP_Controller:
         self.lateral_error_list = [] # list of squared lateral error 
         self.curr_steering_angle = 0
         self.idx_nearest_waypoint = None # index of nearest waypoint to car
+        self.wpnt_tracker = NearestWaypointTracker() # warm started nearest waypoint search
         self.track_length = None
 
         self.gap = None
@@ -94,6 +96,7 @@ class PP_Controller:
         self.position_in_map_frenet = position_in_map_frenet
         self.acc_now = acc_now
         self.track_length = track_length
+        self.wpnt_tracker.set_waypoints(self.waypoint_array_in_map[:, :2], self.waypoint_array_in_map[:, 4], track_length)
         ## PREPROCESS ##
         # speed vector
         yaw = self.position_in_map[0, 2]
@@ -149,7 +152,7 @@ class PP_Controller:
         else:
             adv_ts_st = self.speed_lookahead_for_steer
             la_position_steer = [self.position_in_map[0, 0] + v[0]*adv_ts_st, self.position_in_map[0, 1] + v[1]*adv_ts_st]
-            idx_la_steer = self.nearest_waypoint(la_position_steer, self.waypoint_array_in_map[:, :2])
+            idx_la_steer = self.nearest_waypoint(la_position_steer)
             speed_la_for_lu = self.waypoint_array_in_map[idx_la_steer, 2]
         speed_for_lu = self.speed_adjust_lat_err(speed_la_for_lu, lat_e_norm)
 
@@ -189,7 +192,7 @@ class PP_Controller:
             L1_distance: distance of the L1 point to the car
         """
         
-        self.idx_nearest_waypoint = self.nearest_waypoint(self.position_in_map[0, :2], self.waypoint_array_in_map[:, :2]) 
+        self.idx_nearest_waypoint = self.wpnt_tracker.track(self.position_in_map[0, :2])
         
         # if all waypoints are equal set self.idx_nearest_waypoint to 0
         if np.isnan(self.idx_nearest_waypoint): 
@@ -206,7 +209,7 @@ class PP_Controller:
         lower_bound = max(self.t_clip_min, np.sqrt(2)*lateral_error)
         L1_distance = np.clip(L1_distance, lower_bound, self.t_clip_max)
 
-        L1_point = self.waypoint_at_distance_before_car(L1_distance, self.waypoint_array_in_map[:,:2], self.idx_nearest_waypoint)
+        L1_point = self.waypoint_at_distance_before_car(L1_distance, self.idx_nearest_waypoint)
         return L1_point, L1_distance
     
     
@@ -225,7 +228,7 @@ class PP_Controller:
         # lookahead for speed (speed delay incorporation by propagating position)
         adv_ts_sp = self.speed_lookahead
         la_position = [self.position_in_map[0, 0] + v[0]*adv_ts_sp, self.position_in_map[0, 1] + v[1]*adv_ts_sp]
-        idx_la_position = self.nearest_waypoint(la_position, self.waypoint_array_in_map[:, :2])
+        idx_la_position = self.nearest_waypoint(la_position)
         global_speed = self.waypoint_array_in_map[idx_la_position, 2]
         if(self.state == "TRAILING" and (self.opponent is not None)): #Trailing controller
             speed_command = self.trailing_controller(global_speed)
@@ -360,28 +363,24 @@ class PP_Controller:
         self.logger_info(f"[MAP Controller] heading error decreasing velocity by {scaler}")
         return speed_command * scaler
         
-    def nearest_waypoint(self, position, waypoints):
+    def nearest_waypoint(self, position):
         """
-        Calculates index of nearest waypoint to the car
+        Calculates index of nearest waypoint to the position, searched around the nearest waypoint to the car
 
         Returns:
-            index of nearest waypoint to the car
-        """        
-        position_array = np.array([position]*len(waypoints))
-        distances_to_position = np.linalg.norm(abs(position_array - waypoints), axis=1)
-        return np.argmin(distances_to_position)
+            index of nearest waypoint to the position
+        """
+        return self.wpnt_tracker.nearest(position)
 
-    def waypoint_at_distance_before_car(self, distance, waypoints, idx_waypoint_behind_car):
+    def waypoint_at_distance_before_car(self, distance, idx_waypoint_behind_car):
         """
-        Calculates the waypoint at a certain frenet distance in front of the car
+        Calculates the point at a certain distance along the waypoints in front of the car, interpolated on the
+        arc length of the waypoints
 
         Returns:
-            waypoint as numpy array at a ceratin distance in front of the car
+            point as numpy array at a ceratin distance in front of the car
         """
         if distance is None:
             distance = self.t_clip_min
-        d_distance = distance
-        waypoints_distance = 0.1
-        d_index= int(d_distance/waypoints_distance + 0.5)
 
-        return np.array(waypoints[min(len(waypoints) -1, idx_waypoint_behind_car + d_index)]) 
\ No newline at end of file
+        return self.wpnt_tracker.point_at_distance(idx_waypoint_behind_car, distance) 
\ No newline at end of file
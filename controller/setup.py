@@ -5,7 +5,7 @@ from catkin_pkg.python_setup import generate_distutils_setup
 
 # fetch values from package.xml
 setup_args = generate_distutils_setup(
-    packages=['single_track_mpc', 'kinematic_mpc'],
+    packages=['single_track_mpc', 'kinematic_mpc', 'spline_track', 'mpc_utils'],
     package_dir={'': 'mpc/src'},
     )
 
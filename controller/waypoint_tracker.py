@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import numpy as np
+
+
+class NearestWaypointTracker:
+    """
+    Nearest waypoint search which is warm started from the waypoint nearest to the car in the last cycle.
+
+    Only a small window around that waypoint is searched. When new waypoints are set, the warm start index is carried
+    over by the s coordinate of the last nearest waypoint, such that it also works for the local waypoints which are
+    republished every cycle. A global search is done if the minimum lies on the border of the window or is further
+    away than `max_jump`, e.g. after a relocalisation.
+    """
+
+    def __init__(self, window_back: int = 5, window_fwd: int = 40, max_jump: float = 1.0):
+        """
+        Args:
+            window_back (int): number of waypoints searched behind the warm start index
+            window_fwd (int): number of waypoints searched in front of the warm start index
+            max_jump (float): distance in meters above which the windowed result is not trusted
+        """
+        self.window_back = window_back
+        self.window_fwd = window_fwd
+        self.max_jump = max_jump
+
+        self.xy = None
+        self.s = None
+        self.arc = None
+        self.closed = False
+        self.idx = None  # index of the waypoint nearest to the car
+        self.s_prev = None  # s of the waypoint nearest to the car
+
+    def set_waypoints(self, xy: np.ndarray, s: np.ndarray = None, track_length: float = None, closed: bool = False):
+        """
+        Sets the waypoints of the current cycle.
+
+        Args:
+            xy (np.ndarray): x and y of the waypoints, shape (n, 2)
+            s (np.ndarray): s coordinates of the waypoints, used to carry over the warm start index
+            track_length (float): length of the track, where s wraps around
+            closed (bool): True if the waypoints are a closed loop, then the search window wraps around
+        """
+        self.xy = np.asarray(xy, dtype=float)
+        self.arc = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(self.xy, axis=0), axis=1))))
+        self.closed = closed
+        self.s = s
+        n = self.xy.shape[0]
+
+        if self.idx is not None:
+            if s is not None and self.s_prev is not None and track_length:
+                # unwrap s starting from the first waypoint, as the local waypoints can cross the finish line
+                s_unwrapped = s[0] + (s - s[0]) % track_length
+                self.idx = int(np.searchsorted(s_unwrapped, s[0] + (self.s_prev - s[0]) % track_length))
+            self.idx = min(self.idx, n - 1)
+
+    def _global_search(self, position: np.ndarray) -> int:
+        return int(np.argmin(np.linalg.norm(self.xy - position, axis=1)))
+
+    def nearest(self, position) -> int:
+        """
+        Index of the waypoint nearest to `position`, searched around the waypoint nearest to the car.
+        """
+        position = np.asarray(position, dtype=float)[:2]
+        n = self.xy.shape[0]
+        if self.idx is None or n <= self.window_back + self.window_fwd + 1:
+            return self._global_search(position)
+
+        if self.closed:
+            idxs = np.arange(self.idx - self.window_back, self.idx + self.window_fwd + 1) % n
+            lo_open = hi_open = True
+        else:
+            lo = max(self.idx - self.window_back, 0)
+            hi = min(self.idx + self.window_fwd, n - 1)
+            idxs = np.arange(lo, hi + 1)
+            lo_open, hi_open = lo > 0, hi < n - 1
+
+        dists = np.linalg.norm(self.xy[idxs] - position, axis=1)
+        k = int(np.argmin(dists))
+        on_border = (k == 0 and lo_open) or (k == idxs.shape[0] - 1 and hi_open)
+        if on_border or dists[k] > self.max_jump:
+            return self._global_search(position)
+        return int(idxs[k])
+
+    def track(self, position) -> int:
+        """
+        Index of the waypoint nearest to the car at `position`, which is used as warm start for the next queries.
+        """
+        self.idx = self.nearest(position)
+        if self.s is not None:
+            self.s_prev = self.s[self.idx]
+        return self.idx
+
+    def point_at_distance(self, idx: int, distance):
+        """
+        Point at a distance along the waypoints in front of waypoint `idx`, interpolated on the arc length. Points
+        beyond the last waypoint are clipped to it.
+
+        Args:
+            idx (int): index of the waypoint the distance is measured from
+            distance (float or np.ndarray): distance(s) along the waypoints
+
+        Returns:
+            point (np.ndarray): x and y, shape (2,) or (k, 2) for k distances
+        """
+        target = self.arc[idx] + np.asarray(distance, dtype=float)
+        return np.stack(
+            [np.interp(target, self.arc, self.xy[:, 0]), np.interp(target, self.arc, self.xy[:, 1])], axis=-1
+        )
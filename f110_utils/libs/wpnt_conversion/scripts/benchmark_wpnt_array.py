@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the waypoint ingestion of the controller manager.
+
+Compares the deserialization of a `WpntArray` followed by the list comprehension over all waypoint fields with the
+decoding of the serialized buffer by `wpnts_from_buffer`.
+
+Usage:
+    python3 benchmark_wpnt_array.py --n_wpnts 100 1000 5000
+"""
+import argparse
+import timeit
+from io import BytesIO
+
+import numpy as np
+from f110_msgs.msg import Wpnt, WpntArray
+
+from wpnt_conversion.wpnt_array import wpnt_columns, wpnts_from_buffer
+
+
+def make_buffer(n_wpnts: int) -> bytes:
+    rng = np.random.default_rng(0)
+    msg = WpntArray()
+    msg.header.frame_id = "map"
+    for i, values in enumerate(rng.uniform(-10, 10, (n_wpnts, 10))):
+        msg.wpnts.append(Wpnt(i, *values))
+    buff = BytesIO()
+    msg.serialize(buff)
+    return buff.getvalue()
+
+
+def legacy_path(buff: bytes) -> np.ndarray:
+    data = WpntArray().deserialize(buff)
+    return np.array(
+        [
+            [w.x_m, w.y_m, w.vx_mps, w.d_m, w.s_m, w.kappa_radpm, w.psi_rad, w.ax_mps2]
+            for w in data.wpnts
+        ]
+    )
+
+
+def buffer_path(buff: bytes) -> np.ndarray:
+    return wpnt_columns(wpnts_from_buffer(buff))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the WpntArray ingestion.")
+    parser.add_argument("--n_wpnts", type=int, nargs="*", default=[100, 1000, 5000], help="Numbers of waypoints")
+    parser.add_argument("--repeat", type=int, default=200, help="Conversions per measurement")
+    args = parser.parse_args()
+
+    for n_wpnts in args.n_wpnts:
+        buff = make_buffer(n_wpnts)
+        assert np.array_equal(legacy_path(buff), buffer_path(buff))
+        t_legacy = min(timeit.repeat(lambda: legacy_path(buff), number=args.repeat, repeat=5)) / args.repeat
+        t_buffer = min(timeit.repeat(lambda: buffer_path(buff), number=args.repeat, repeat=5)) / args.repeat
+        print(
+            f"{n_wpnts:6d} waypoints: deserialize + list comprehension {1e6 * t_legacy:9.1f} us, "
+            f"frombuffer {1e6 * t_buffer:7.1f} us, speedup {t_legacy / t_buffer:6.1f}x"
+        )
@@ -0,0 +1,72 @@
+import struct
+from typing import Sequence
+
+import numpy as np
+
+# layout of a serialized f110_msgs/Wpnt, ROS serializes little endian without padding
+WPNT_DTYPE = np.dtype(
+    [
+        ("id", "<i4"),
+        ("s_m", "<f8"),
+        ("d_m", "<f8"),
+        ("x_m", "<f8"),
+        ("y_m", "<f8"),
+        ("d_right", "<f8"),
+        ("d_left", "<f8"),
+        ("psi_rad", "<f8"),
+        ("kappa_radpm", "<f8"),
+        ("vx_mps", "<f8"),
+        ("ax_mps2", "<f8"),
+    ]
+)
+
+# columns of the waypoint array used by the controllers: x, y, v, d, s, kappa, psi, ax
+CONTROLLER_FIELDS = ("x_m", "y_m", "vx_mps", "d_m", "s_m", "kappa_radpm", "psi_rad", "ax_mps2")
+
+_UINT32 = struct.Struct("<I")
+# std_msgs/Header: uint32 seq, uint32 secs, uint32 nsecs, string frame_id
+_HEADER_FIXED_SIZE = 12
+
+
+def wpnts_from_buffer(buff: bytes) -> np.ndarray:
+    """
+    Decodes a serialized `f110_msgs/WpntArray` into a structured array of dtype `WPNT_DTYPE`.
+
+    The waypoints are a fixed stride block after the header, so they are read with `np.frombuffer` without
+    deserializing the message. The result is a read-only view on `buff`.
+
+    Args:
+        buff (bytes): serialized message, e.g. `_buff` of a `rospy.AnyMsg`
+
+    Returns:
+        wpnts (np.ndarray): structured array with one entry per waypoint and the fields of `f110_msgs/Wpnt`
+    """
+    offset = _HEADER_FIXED_SIZE
+    (frame_id_len,) = _UINT32.unpack_from(buff, offset)
+    offset += _UINT32.size + frame_id_len
+    (n_wpnts,) = _UINT32.unpack_from(buff, offset)
+    offset += _UINT32.size
+    return np.frombuffer(buff, dtype=WPNT_DTYPE, count=n_wpnts, offset=offset)
+
+
+def wpnts_from_msg(msg) -> np.ndarray:
+    """
+    Converts an already deserialized `f110_msgs/WpntArray` into a structured array of dtype `WPNT_DTYPE`.
+    """
+    return np.array(
+        [
+            (w.id, w.s_m, w.d_m, w.x_m, w.y_m, w.d_right, w.d_left, w.psi_rad, w.kappa_radpm, w.vx_mps, w.ax_mps2)
+            for w in msg.wpnts
+        ],
+        dtype=WPNT_DTYPE,
+    )
+
+
+def wpnt_columns(wpnts: np.ndarray, fields: Sequence[str] = CONTROLLER_FIELDS) -> np.ndarray:
+    """
+    Stacks the given fields of a structured waypoint array into a float array of shape (n, len(fields)).
+    """
+    out = np.empty((wpnts.shape[0], len(fields)))
+    for i, field in enumerate(fields):
+        out[:, i] = wpnts[field]
+    return out
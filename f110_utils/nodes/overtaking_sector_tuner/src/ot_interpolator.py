@@ -1,7 +1,5 @@
 #! /usr/bin/env python3
 
-import copy
-import tqdm
 from tracemalloc import start
 import rospy
 import numpy as np
@@ -9,6 +7,7 @@ import matplotlib.pyplot as plt
 from f110_msgs.msg import Wpnt, WpntArray
 from dynamic_reconfigure.msg import Config
 from scipy.interpolate import InterpolatedUnivariateSpline as Spline
+from scipy.spatial import cKDTree
 from visualization_msgs.msg import Marker, MarkerArray
 from frenet_converter.frenet_converter import FrenetConverter
 
@@ -173,147 +172,105 @@ class OvertakingInterpolator:
         else:
             return self.sectors_params[f"Overtaking_sector{idx+1}"]['ot_flag']
 
+    @staticmethod
+    def project_on_polyline(points: np.ndarray, polyline: np.ndarray, window: int = 5) -> np.ndarray:
+        """
+        Batched closest point on a closed polyline
+
+        Parameters
+        ----------
+        points
+            Points to project, shape (n, 2)
+        polyline
+            Vertices of the closed polyline, shape (m, 2)
+        window
+            Number of segments before and after the nearest vertex that are considered
+
+        Returns
+        -------
+        projection
+            Closest points on the polyline, shape (n, 2)
+        """
+        n_vertices = polyline.shape[0]
+        _, nearest = cKDTree(polyline).query(points)
+        seg = (nearest[:, None] + np.arange(-window, window)[None, :]) % n_vertices
+        seg_start = polyline[seg]
+        seg_vec = polyline[(seg + 1) % n_vertices] - seg_start
+        seg_len2 = np.maximum(np.sum(seg_vec**2, axis=2), 1e-12)
+        t = np.clip(np.sum((points[:, None, :] - seg_start) * seg_vec, axis=2) / seg_len2, 0, 1)
+        candidates = seg_start + t[:, :, None] * seg_vec
+        best = np.argmin(np.sum((points[:, None, :] - candidates)**2, axis=2), axis=1)
+        return candidates[np.arange(points.shape[0]), best]
+
     def interpolate_line(self, schedule):
         """
         Interpolates the point between the two trajectories according to the given schedule
-        
+
+        Every global waypoint with a positive schedule is blended with its closest point on the shortest path.
+
         Parameters
         ----------
-        start_s
-            s parameter indicating the start of where we want to interpolate
-        end_s
-            s parameter indicating the end of where we want to interpolate
-        """
-        ses = []
-        last_point = None
-        nearest_p_idx = None
-        self.interp_wpnt = copy.deepcopy(self.glb_wpnts_scaled)
-
-        for i, waypoint in tqdm.tqdm(enumerate(self.interp_wpnt.wpnts)):
-            if schedule[i] > 0: 
-                # find direction of global
-                coordinate = np.array([self.glb_wpnts_scaled.wpnts[i].x_m, self.glb_wpnts_scaled.wpnts[i].y_m])
-                direction = np.array([self.glb_spline_x(i/10, 1), self.glb_spline_y(i/10, 1)])
-                direction /= np.linalg.norm(direction)
-
-                # find nearest point
-                nearest_p_idx = np.argmin((np.linalg.norm((self.ot_spline_np-coordinate), axis=1)))
-                
-                # find point perpendicular
-                start_idx = nearest_p_idx
-                idx_fwd = start_idx
-                idx_bwd = start_idx
-                min_perp_fwd = None
-                min_perp_bwd = None
-                #  look forward
-                for _ in range(50):
-                    point_on_mindist = np.array([self.ot_spline_x(idx_fwd/10), self.ot_spline_y(idx_fwd/10)])
-                    vector = point_on_mindist-coordinate
-                    vector /= np.linalg.norm(vector)
-                    perp_fwd = np.abs(np.dot(direction, vector))
-                    if min_perp_fwd is None:
-                        min_perp_fwd = perp_fwd
-                        point_fwd = copy.deepcopy(point_on_mindist)
-                    else:
-                        if perp_fwd < min_perp_fwd:
-                            min_perp_fwd = perp_fwd
-                            point_fwd = copy.deepcopy(point_on_mindist)
-                        else:
-                            break
-                    idx_fwd += 0.01
-                # look backward
-                for _ in range(50):
-                    point_on_mindist = np.array([self.ot_spline_x(idx_bwd/10), self.ot_spline_y(idx_bwd/10)])
-                    vector = point_on_mindist-coordinate
-                    vector /= np.linalg.norm(vector)
-                    perp_bwd = np.abs(np.dot(direction, vector))
-                    if min_perp_bwd is None:
-                        min_perp_bwd = perp_bwd
-                        point_bwd = copy.deepcopy(point_on_mindist)
-                    else:
-                        if perp_bwd < min_perp_bwd:
-                            min_perp_bwd = perp_bwd
-                            point_bwd = copy.deepcopy(point_on_mindist)
-                        else:
-                            break
-                    
-                    idx_bwd -= 0.01
-
-                if min_perp_bwd < min_perp_fwd:
-                    point_chosen = point_bwd
-                    idx_chosen = idx_bwd
-                else:
-                    point_chosen = point_fwd
-                    idx_chosen = idx_fwd
+        schedule
+            Blending factor for every global waypoint, 0 is the global line, 1 the shortest path
 
-                # interpolate
-                new_point = schedule[i]*point_chosen + (1-schedule[i])*coordinate 
+        Returns
+        -------
+        x, y, vx
+            Arrays of the interpolated line
+        """
+        coords = np.array([[wpnt.x_m, wpnt.y_m, wpnt.vx_mps] for wpnt in self.glb_wpnts_scaled.wpnts])
+        xy = coords[:, :2].copy()
+        vx = coords[:, 2].copy()
 
-                # interpolate for speed
-                # speed_scaling = self.glb_wpnts_scaled.wpnts[i].vx_mps/self.glb_wpnts_og.wpnts[i].vx_mps
-                # new_point_speed = schedule[i]*self.ot_spline_speed(idx_chosen/10) + (1-schedule[i])*self.glb_wpnts_og.wpnts[i].vx_mps
-                # new_point_speed *= speed_scaling*self.yeet_factor
-                new_point_speed = self.glb_wpnts_scaled.wpnts[i].vx_mps*self.yeet_factor
+        blend = schedule > 0
+        if np.any(blend):
+            projection = self.project_on_polyline(xy[blend], self.ot_spline_np)
+            weights = schedule[blend][:, None]
+            xy[blend] = weights*projection + (1-weights)*xy[blend]
+            vx[blend] *= self.yeet_factor
 
-                last_point = copy.deepcopy(new_point)
-                waypoint.x_m = last_point[0]
-                waypoint.y_m = last_point[1]
-                waypoint.vx_mps = new_point_speed
+        return xy[:, 0], xy[:, 1], vx
 
-    def recalculate_ot_s(self):
+    def recalculate_ot_s(self, x: np.ndarray, y: np.ndarray, vx: np.ndarray):
         # fit spline to whole new track, speed included
         # for s and d we take them relative to the global mincurv
-        coords = np.inf*np.ones((len(self.interp_wpnt.wpnts), 4))
-        s = 0
-        i = 0
-        for wpnt in self.interp_wpnt.wpnts:
-            if i > 0:
-                # for points different from the first we should not add if they're the same
-                dist_from_previous = np.linalg.norm([wpnt.x_m - coords[i-1, 1], wpnt.y_m - coords[i-1, 2]])
-                if dist_from_previous > 0:
-                    s += dist_from_previous
-                    coords[i, 0] = s
-                    coords[i, 1] = wpnt.x_m
-                    coords[i, 2] = wpnt.y_m
-                    coords[i, 3] = wpnt.vx_mps
-                    i+=1
-            else:
-                # default action for first point
-                coords[i, 0] = s
-                coords[i, 1] = wpnt.x_m
-                coords[i, 2] = wpnt.y_m
-                coords[i, 3] = wpnt.vx_mps
-                i+=1
-        tot_len = s + np.linalg.norm([coords[0, 1] - coords[i-1, 1], coords[0, 2] - coords[i-1, 2]])
-
-        spline_x = Spline(coords[:i, 0], coords[:i, 1])
-        spline_y = Spline(coords[:i, 0], coords[:i, 2])
-        spline_speed = Spline(coords[:i, 0], coords[:i, 3])
+        # points which are the same as the previous one are not added
+        step = np.linalg.norm(np.diff(np.stack([x, y], axis=1), axis=0), axis=1)
+        keep = np.concatenate(([True], step > 0))
+        s = np.concatenate(([0.0], np.cumsum(step[keep[1:]])))
+        x, y, vx = x[keep], y[keep], vx[keep]
+        tot_len = s[-1] + np.linalg.norm([x[0] - x[-1], y[0] - y[-1]])
+
+        spline_x = Spline(s, x)
+        spline_y = Spline(s, y)
+        spline_speed = Spline(s, vx)
+
+        # resample the whole line every 0.1 m
+        s_new = np.arange(int(tot_len*10))/10
+        x_new = spline_x(s_new)
+        y_new = spline_y(s_new)
+        vx_new = spline_speed(s_new)
+        # curvature
+        x_d = spline_x(s_new, 1)
+        x_dd = spline_x(s_new, 2)
+        y_d = spline_y(s_new, 1)
+        y_dd = spline_y(s_new, 2)
+        curvature = np.abs(x_d * y_dd - y_d * x_dd)/pow((x_d**2 + y_d **2), 1.5)
+        # frenet components
+        s_frenet, d_frenet = self.converter.get_frenet(x_new, y_new)
 
         # rewrite whole array
         self.interp_wpnt = WpntArray()
-        wpnts = []
-        for i in range(0, int(tot_len*10)):
+        for i in range(s_new.shape[0]):
             new_wpnt = Wpnt()
-            new_wpnt.id =  i
-            new_wpnt.x_m = spline_x(i/10)
-            new_wpnt.y_m = spline_y(i/10)
-            new_wpnt.vx_mps = spline_speed(i/10)
-            # curvature 
-            x_d = spline_x(i/10, 1)
-            x_dd = spline_x(i/10, 2)
-            y_d = spline_y(i/10, 1)
-            y_dd = spline_y(i/10, 2)
-            curvature = (
-                np.abs(x_d * y_dd - y_d * x_dd)/pow((x_d**2 + y_d **2), 1.5)
-            )
-            new_wpnt.kappa_radpm = curvature
-            # frenet components
-            frenet_newpoint = self.converter.get_frenet(np.array([new_wpnt.x_m]), np.array([new_wpnt.y_m]))
-            new_wpnt.s_m = frenet_newpoint[0]
-            new_wpnt.d_m = frenet_newpoint[1]
-
-            self.interp_wpnt.wpnts.append(copy.deepcopy(new_wpnt))
+            new_wpnt.id = i
+            new_wpnt.x_m = x_new[i]
+            new_wpnt.y_m = y_new[i]
+            new_wpnt.vx_mps = vx_new[i]
+            new_wpnt.kappa_radpm = curvature[i]
+            new_wpnt.s_m = s_frenet[i]
+            new_wpnt.d_m = d_frenet[i]
+            self.interp_wpnt.wpnts.append(new_wpnt)
 
     def interpolate_points(self):
         """
@@ -323,8 +280,8 @@ class OvertakingInterpolator:
             # we need to wait the global waitpoint scaled, otherwise we might use old ones
             rospy.wait_for_message(self.glb_wpnts_name, WpntArray)
             schedule =  self.get_interpolating_schedule()
-            self.interpolate_line(schedule)
-            self.recalculate_ot_s()
+            x, y, vx = self.interpolate_line(schedule)
+            self.recalculate_ot_s(x, y, vx)
             
             self.need_to_reinterpolate = False
         pass
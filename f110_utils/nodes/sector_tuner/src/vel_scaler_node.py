@@ -1,5 +1,7 @@
 #! /usr/bin/env python3
 
+import copy
+
 import rospy
 import numpy as np
 import matplotlib.pyplot as plt
@@ -20,6 +22,9 @@ class VelocityScaler:
         self.glb_wpnts_scaled = None
         self.glb_wpnts_sp_og = None
         self.glb_wpnts_sp_scaled = None
+        self.glb_wpnts_og_arr = None  # x, y, vx of the source waypoints, for detecting changes
+        self.scaling = None  # velocity scaling per waypoint
+        self.needs_update = True
         
         # get initial scaling
         self.sectors_params = rospy.get_param("/map_params")
@@ -32,14 +37,20 @@ class VelocityScaler:
         rospy.Subscriber(self.glb_wpnts_name+"/shortest_path", WpntArray, self.glb_wpnts_sp_cb)
         
         # new glb_waypoints pub
-        self.scaled_points_pub = rospy.Publisher("/global_waypoints_scaled", WpntArray, queue_size=10)
-        self.scaled_points_sp_pub = rospy.Publisher("/global_waypoints_scaled/shortest_path", WpntArray, queue_size=10)
+        # latched, since it is only republished on changes
+        self.scaled_points_pub = rospy.Publisher("/global_waypoints_scaled", WpntArray, queue_size=10, latch=True)
+        self.scaled_points_sp_pub = rospy.Publisher("/global_waypoints_scaled/shortest_path", WpntArray, queue_size=10, latch=True)
 
     def glb_wpnts_cb(self, data:WpntArray):
         """
-        Saves the global waypoints
+        Saves the global waypoints, the scaling is only redone if they changed
         """
-        self.glb_wpnts_og = data
+        wpnts_arr = np.array([[wpnt.x_m, wpnt.y_m, wpnt.vx_mps] for wpnt in data.wpnts])
+        if self.glb_wpnts_og_arr is None or not np.array_equal(wpnts_arr, self.glb_wpnts_og_arr):
+            self.glb_wpnts_og_arr = wpnts_arr
+            self.glb_wpnts_og = data
+            self.scaling = None
+            self.needs_update = True
 
     def glb_wpnts_sp_cb(self, data:WpntArray):
         """
@@ -61,6 +72,8 @@ class VelocityScaler:
             )
 
         rospy.loginfo(self.sectors_params)
+        self.scaling = None
+        self.needs_update = True
 
     def get_vel_scaling(self, s):
         """
@@ -73,56 +86,43 @@ class VelocityScaler:
             s parameter whose sector we want to find
         """
         hl_change = 10
+        s = np.asarray(s, dtype=float)
+        scaler = np.ones_like(s)
 
         if self.n_sectors > 1:
+            # later sectors overwrite earlier ones, as the transition regions overlap. Within a sector only the
+            # first matching region applies
             for i in range(self.n_sectors):
-                if i == 0 :
-                    if (s >= self.sectors_params[f'Sector{i}']['start']) and (s < self.sectors_params[f'Sector{i}']['start'] + hl_change):
-                        scaler = np.interp(
-                            x=s,
-                            xp=[self.sectors_params[f'Sector{i}']['start']-hl_change, self.sectors_params[f'Sector{i}']['start']+hl_change],
-                            fp=[self.sectors_params[f'Sector{self.n_sectors-1}']['scaling'], self.sectors_params[f'Sector{i}']['scaling']]
-                        )
-                    elif (s >= self.sectors_params[f'Sector{i}']['start'] + hl_change) and (s < self.sectors_params[f'Sector{i+1}']['start'] - hl_change):
-                        scaler = self.sectors_params[f"Sector{i}"]['scaling']
-                    elif (s >= self.sectors_params[f'Sector{i+1}']['start'] - hl_change) and (s < self.sectors_params[f'Sector{i+1}']['start']):
-                        scaler = np.interp(
-                        x=s,
-                        xp=[self.sectors_params[f'Sector{i+1}']['start']-hl_change, self.sectors_params[f'Sector{i+1}']['start']+hl_change],
-                        fp=[self.sectors_params[f'Sector{i}']['scaling'], self.sectors_params[f'Sector{i+1}']['scaling']]
-                    )
-                elif i != self.n_sectors-1:
-                    if (s >= self.sectors_params[f'Sector{i}']['start']) and (s < self.sectors_params[f'Sector{i}']['start'] + hl_change):
-                        scaler = np.interp(
-                            x=s,
-                            xp=[self.sectors_params[f'Sector{i}']['start']-hl_change, self.sectors_params[f'Sector{i}']['start']+hl_change],
-                            fp=[self.sectors_params[f'Sector{i-1}']['scaling'], self.sectors_params[f'Sector{i}']['scaling']]
-                        )
-                    elif (s >= self.sectors_params[f'Sector{i}']['start'] + hl_change) and (s < self.sectors_params[f'Sector{i+1}']['start'] - hl_change):
-                        scaler = self.sectors_params[f"Sector{i}"]['scaling']
-                    elif (s >= self.sectors_params[f'Sector{i+1}']['start'] - hl_change) and (s < self.sectors_params[f'Sector{i+1}']['start']):
-                        scaler = np.interp(
-                        x=s,
-                        xp=[self.sectors_params[f'Sector{i+1}']['start']-hl_change, self.sectors_params[f'Sector{i+1}']['start']+hl_change],
-                        fp=[self.sectors_params[f'Sector{i}']['scaling'], self.sectors_params[f'Sector{i+1}']['scaling']]
+                start = self.sectors_params[f'Sector{i}']['start']
+                scaling = self.sectors_params[f'Sector{i}']['scaling']
+                prev_scaling = self.sectors_params[f'Sector{(i - 1) % self.n_sectors}']['scaling']
+
+                # transition from the previous sector
+                mask = (s >= start) & (s < start + hl_change)
+                scaler[mask] = np.interp(s[mask], [start - hl_change, start + hl_change], [prev_scaling, scaling])
+                taken = mask
+
+                if i != self.n_sectors-1:
+                    next_start = self.sectors_params[f'Sector{i+1}']['start']
+                    next_scaling = self.sectors_params[f'Sector{i+1}']['scaling']
+                    mask = ~taken & (s >= start + hl_change) & (s < next_start - hl_change)
+                    scaler[mask] = scaling
+                    # transition to the next sector
+                    mask = ~(taken | mask) & (s >= next_start - hl_change) & (s < next_start)
+                    scaler[mask] = np.interp(
+                        s[mask], [next_start - hl_change, next_start + hl_change], [scaling, next_scaling]
                     )
                 else:
-                    if (s >= self.sectors_params[f'Sector{i}']['start']) and (s < self.sectors_params[f'Sector{i}']['start'] + hl_change):
-                        scaler = np.interp(
-                            x=s,
-                            xp=[self.sectors_params[f'Sector{i}']['start']-hl_change, self.sectors_params[f'Sector{i}']['start']+hl_change],
-                            fp=[self.sectors_params[f'Sector{i-1}']['scaling'], self.sectors_params[f'Sector{i}']['scaling']]
-                        )
-                    elif (s >= self.sectors_params[f'Sector{i}']['start'] + hl_change) and (s < self.sectors_params[f'Sector{i}']['end'] - hl_change):
-                        scaler = self.sectors_params[f"Sector{i}"]['scaling']
-                    elif (s >= self.sectors_params[f'Sector{i}']['end'] - hl_change):
-                        scaler = np.interp(
-                        x=s,
-                        xp=[self.sectors_params[f'Sector{i}']['end']-hl_change, self.sectors_params[f'Sector{i}']['end']+hl_change],
-                        fp=[self.sectors_params[f'Sector{i}']['scaling'], self.sectors_params[f'Sector{0}']['scaling']]
+                    end = self.sectors_params[f'Sector{i}']['end']
+                    mask = ~taken & (s >= start + hl_change) & (s < end - hl_change)
+                    scaler[mask] = scaling
+                    # transition to the first sector over the finish line
+                    mask = ~(taken | mask) & (s >= end - hl_change)
+                    scaler[mask] = np.interp(
+                        s[mask], [end - hl_change, end + hl_change], [scaling, self.sectors_params['Sector0']['scaling']]
                     )
         elif self.n_sectors == 1:
-            scaler = self.sectors_params["Sector0"]['scaling']
+            scaler[:] = self.sectors_params["Sector0"]['scaling']
 
         return scaler
 
@@ -130,21 +130,20 @@ class VelocityScaler:
         """
         Scales the global waypoints' velocities
         """
-        scaling = []
+        if self.scaling is None:
+            self.scaling = self.get_vel_scaling(np.arange(len(self.glb_wpnts_og.wpnts)))
 
-        if self.glb_wpnts_scaled is None:
-            self.glb_wpnts_scaled = self.glb_wpnts_og
-            self.glb_wpnts_sp_scaled = self.glb_wpnts_sp_og
+        # a new message every time, since it is only built on changes and the old one may still be latched
+        self.glb_wpnts_scaled = copy.deepcopy(self.glb_wpnts_og)
+        self.glb_wpnts_sp_scaled = self.glb_wpnts_sp_og
 
-        for i, wpnt  in enumerate(self.glb_wpnts_og.wpnts):
-            vel_scaling = self.get_vel_scaling(i)
-            new_vel = wpnt.vx_mps*vel_scaling
-            self.glb_wpnts_scaled.wpnts[i].vx_mps = new_vel
-            scaling.append(self.get_vel_scaling(i))
+        new_vel = self.glb_wpnts_og_arr[:, 2]*self.scaling
+        for wpnt, vel in zip(self.glb_wpnts_scaled.wpnts, new_vel):
+            wpnt.vx_mps = vel
 
         if self.debug_plot:
             plt.clf()
-            plt.plot(scaling)
+            plt.plot(self.scaling)
             plt.legend(['og', 'scaled'])
             plt.ylim(0,1)
             plt.show()
@@ -155,13 +154,13 @@ class VelocityScaler:
         rospy.wait_for_message(self.glb_wpnts_name, WpntArray)
         rospy.loginfo("Global waypoints received!")
 
-        # initialise scaled points
-        self.scale_points()
-
+        # only rescale and republish if the parameters or the source waypoints changed
         run_rate = rospy.Rate(2)
         while not rospy.is_shutdown():
-            self.scale_points()
-            self.scaled_points_pub.publish(self.glb_wpnts_scaled)
+            if self.needs_update:
+                self.needs_update = False
+                self.scale_points()
+                self.scaled_points_pub.publish(self.glb_wpnts_scaled)
             run_rate.sleep()
 
 if __name__ == '__main__':
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+from typing import List, Tuple
+
+import numpy as np
+
+
+class Corridor:
+    """
+    Precomputed free space along the raceline.
+
+    Holds fine-resolution arrays of the usable lateral interval [lower, upper] per s, i.e. the track bounds reduced by
+    the inflation (vehicle half-width plus safety margin). It is built once per `/global_waypoints` update, such that
+    all queries are index arithmetic on arrays. Obstacles are overlaid as interval cuts with vectorized operations.
+    """
+
+    def __init__(
+        self,
+        s: np.ndarray,
+        d_left: np.ndarray,
+        d_right: np.ndarray,
+        track_length: float,
+        inflation: float = 0.0,
+        resolution: float = 0.05,
+    ):
+        """
+        Args:
+            s (np.ndarray): s coordinates of the global waypoints
+            d_left (np.ndarray): distance to the left track bound at the global waypoints
+            d_right (np.ndarray): distance to the right track bound at the global waypoints
+            track_length (float): length of the track, where s wraps around
+            inflation (float): distance kept from the track bounds, i.e. vehicle half-width plus safety margin
+            resolution (float): resolution of the corridor arrays in meters
+        """
+        self.track_length = track_length
+        self.resolution = resolution
+        self.s = np.arange(0, track_length, resolution)
+        self.bound_left = np.interp(self.s, s, np.abs(d_left), period=track_length)
+        self.bound_right = np.interp(self.s, s, np.abs(d_right), period=track_length)
+        self.set_inflation(inflation)
+
+    def set_inflation(self, inflation: float):
+        """
+        Recomputes the usable interval for a new inflation.
+        """
+        self.inflation = inflation
+        self.upper = self.bound_left - inflation
+        self.lower = -self.bound_right + inflation
+
+    def _idx(self, s: np.ndarray) -> np.ndarray:
+        return np.rint((np.asarray(s) % self.track_length) / self.resolution).astype(int) % self.s.shape[0]
+
+    def bounds(self, s: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Usable lateral interval at the given s coordinates, without obstacles.
+
+        Returns:
+            lower (np.ndarray): lowest usable d
+            upper (np.ndarray): highest usable d
+        """
+        idx = self._idx(s)
+        return self.lower[idx], self.upper[idx]
+
+    def track_bounds(self, s: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Distance to the left and right track bound at the given s coordinates, without inflation.
+        """
+        idx = self._idx(s)
+        return self.bound_left[idx], self.bound_right[idx]
+
+    def with_obstacles(
+        self,
+        s: np.ndarray,
+        side: str,
+        obs_s_start: np.ndarray,
+        obs_s_end: np.ndarray,
+        obs_d_left: np.ndarray,
+        obs_d_right: np.ndarray,
+        clearance: float,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Usable lateral interval at the given s coordinates when passing all obstacles on `side`.
+
+        Every obstacle cuts the interval from the other side up to its bound plus `clearance` over its s extent.
+
+        Args:
+            s (np.ndarray): s coordinates of shape (n,)
+            side (str): "left" or "right", the side on which the obstacles are passed
+            obs_s_start (np.ndarray): start s of the obstacles, shape (m,)
+            obs_s_end (np.ndarray): end s of the obstacles, shape (m,)
+            obs_d_left (np.ndarray): left bound of the obstacles, shape (m,)
+            obs_d_right (np.ndarray): right bound of the obstacles, shape (m,)
+            clearance (float): lateral distance kept from the obstacles
+
+        Returns:
+            lower (np.ndarray): lowest usable d
+            upper (np.ndarray): highest usable d, the interval is empty where lower > upper
+        """
+        lower, upper = self.bounds(s)
+        if len(obs_s_start) == 0:
+            return lower, upper
+        s = np.asarray(s)[:, None]
+        extent = (np.asarray(obs_s_end) - np.asarray(obs_s_start)) % self.track_length
+        in_obs = (s - np.asarray(obs_s_start)[None, :]) % self.track_length <= extent[None, :]
+        if side == "left":
+            cut = np.where(in_obs, np.asarray(obs_d_left)[None, :] + clearance, -np.inf).max(axis=1)
+            lower = np.maximum(lower, cut)
+        else:
+            cut = np.where(in_obs, np.asarray(obs_d_right)[None, :] - clearance, np.inf).min(axis=1)
+            upper = np.minimum(upper, cut)
+        return lower, upper
+
+    def violates(self, s: np.ndarray, d: np.ndarray, side: str, min_offset: float = 0.0) -> np.ndarray:
+        """
+        Checks which points leave the corridor towards the track bound on `side`.
+
+        Args:
+            s (np.ndarray): s coordinates of the points
+            d (np.ndarray): d coordinates of the points
+            side (str): "left" or "right", the track bound which is checked
+            min_offset (float): points with |d| below this offset are considered on the raceline and not checked
+
+        Returns:
+            violation (np.ndarray): boolean mask of the violating points
+        """
+        idx = self._idx(s)
+        limit = self.upper[idx] if side == "left" else -self.lower[idx]
+        abs_d = np.abs(d)
+        return (abs_d > min_offset) & (abs_d > limit)
+
+    @staticmethod
+    def obstacle_arrays(obstacles: List) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Converts a list of `Obstacle` messages into the arrays used by `with_obstacles`.
+        """
+        arr = np.array([[obs.s_start, obs.s_end, obs.d_left, obs.d_right] for obs in obstacles]).reshape(-1, 4)
+        return arr[:, 0], arr[:, 1], arr[:, 2], arr[:, 3]
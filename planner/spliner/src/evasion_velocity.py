@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+from typing import Tuple
+
+import numpy as np
+
+
+def load_veh_dyn_info(ggv_path: str, ax_max_machines_path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Loads the ggv diagram and the machine acceleration limits used by the global optimizer.
+
+    Args:
+        ggv_path (str): path to the `ggv.csv` file with columns v_mps, ax_max_mps2, ay_max_mps2
+        ax_max_machines_path (str): path to the `ax_max_machines.csv` file with columns v_mps, ax_max_machines_mps2
+
+    Returns:
+        ggv (np.ndarray): array of shape (n, 3)
+        ax_max_machines (np.ndarray): array of shape (m, 2)
+    """
+    ggv = np.loadtxt(ggv_path, comments="#", delimiter=",", ndmin=2)
+    ax_max_machines = np.loadtxt(ax_max_machines_path, comments="#", delimiter=",", ndmin=2)
+    return ggv, ax_max_machines
+
+
+class EvasionVelocityProfiler:
+    """
+    Computes a curvature-aware velocity profile along an evasion path.
+
+    The profile is obtained by a forward (acceleration) and a backward (deceleration) pass over the path's own
+    curvature, respecting the ggv diagram, the machine acceleration limits and the acceleration limits of the `CarConfig`.
+    Both passes are written as a cumulative minimum over v^2 and are therefore fully vectorized: the available
+    longitudinal acceleration of each segment is evaluated at the velocity ceiling, which is conservative since the
+    combined friction usage only shrinks for lower velocities.
+    """
+
+    def __init__(self, ggv: np.ndarray, ax_max_machines: np.ndarray, a_max: float, a_min: float, v_max: float):
+        """
+        Args:
+            ggv (np.ndarray): ggv diagram of shape (n, 3) with columns v_mps, ax_max_mps2, ay_max_mps2
+            ax_max_machines (np.ndarray): machine limits of shape (m, 2) with columns v_mps, ax_max_machines_mps2
+            a_max (float): maximum acceleration of the car, from the `CarConfig`
+            a_min (float): minimum acceleration (maximum deceleration) of the car, from the `CarConfig`
+            v_max (float): maximum velocity of the car, from the `CarConfig`
+        """
+        self.ggv_v = ggv[:, 0]
+        self.ggv_ax = ggv[:, 1]
+        self.ggv_ay = ggv[:, 2]
+        self.machines_v = ax_max_machines[:, 0]
+        self.machines_ax = ax_max_machines[:, 1]
+        self.a_max = abs(a_max)
+        self.a_min = abs(a_min)
+        self.v_max = v_max
+
+    @staticmethod
+    def path_curvature(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Computes the arc length and the signed curvature of a cartesian path.
+
+        Args:
+            x (np.ndarray): x coordinates of the path
+            y (np.ndarray): y coordinates of the path
+
+        Returns:
+            s (np.ndarray): cumulative arc length starting at 0
+            kappa (np.ndarray): signed curvature at every point
+        """
+        ds = np.hypot(np.diff(x), np.diff(y))
+        s = np.concatenate(([0.0], np.cumsum(ds)))
+        if s.shape[0] < 3:
+            return s, np.zeros_like(s)
+        dx = np.gradient(x, s, edge_order=2)
+        dy = np.gradient(y, s, edge_order=2)
+        ddx = np.gradient(dx, s, edge_order=2)
+        ddy = np.gradient(dy, s, edge_order=2)
+        kappa = (dx * ddy - dy * ddx) / np.maximum((dx ** 2 + dy ** 2) ** 1.5, 1e-9)
+        return s, kappa
+
+    def compute(self, s: np.ndarray, kappa: np.ndarray, v_ceil: np.ndarray) -> np.ndarray:
+        """
+        Computes the velocity profile along the evasion path.
+
+        Args:
+            s (np.ndarray): strictly increasing arc length of the evasion path
+            kappa (np.ndarray): curvature of the evasion path at every point
+            v_ceil (np.ndarray): velocity ceiling at every point, i.e. the global profile. The first and last entry
+                bound the profile at entry and exit so that the evasion merges into the global profile.
+
+        Returns:
+            v (np.ndarray): velocity profile along the evasion path
+        """
+        v_ceil = np.minimum(v_ceil, self.v_max)
+        if s.shape[0] < 2:
+            return v_ceil.copy()
+        abs_kappa = np.abs(kappa)
+
+        # lateral limit from the ggv diagram
+        ay_max = np.interp(v_ceil, self.ggv_v, self.ggv_ay)
+        v_lat = np.sqrt(ay_max / np.maximum(abs_kappa, 1e-6))
+        v_ceil = np.minimum(v_ceil, v_lat)
+
+        # remaining longitudinal acceleration per segment from the friction ellipse, evaluated at the ceiling
+        ay_usage = np.clip(v_ceil ** 2 * abs_kappa / ay_max, 0.0, 1.0)
+        ax_tires = np.interp(v_ceil, self.ggv_v, self.ggv_ax) * np.sqrt(1.0 - ay_usage ** 2)
+        ax_tires = np.minimum(ax_tires[:-1], ax_tires[1:])
+        ax_machines = np.interp(v_ceil, self.machines_v, self.machines_ax)
+        ax_machines = np.minimum(ax_machines[:-1], ax_machines[1:])
+        ax_fwd = np.minimum(np.minimum(ax_tires, ax_machines), self.a_max)
+        ax_bwd = np.minimum(ax_tires, self.a_min)
+
+        # forward pass: v_i^2 = min_j (v_ceil_j^2 + 2 * sum_{k=j}^{i-1} a_k ds_k)
+        ds = np.diff(s)
+        v2_ceil = v_ceil ** 2
+        acc_fwd = np.concatenate(([0.0], np.cumsum(2 * ax_fwd * ds)))
+        v2 = acc_fwd + np.minimum.accumulate(v2_ceil - acc_fwd)
+
+        # backward pass on the reversed path
+        acc_bwd = np.concatenate(([0.0], np.cumsum(2 * ax_bwd[::-1] * ds[::-1])))
+        v2_rev = acc_bwd + np.minimum.accumulate(v2[::-1] - acc_bwd)
+
+        return np.sqrt(np.maximum(v2_rev[::-1], 0.0))
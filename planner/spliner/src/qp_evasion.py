@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+from typing import Optional
+
+import numpy as np
+from scipy.linalg import solveh_banded
+
+
+class QPEvasionSolver:
+    """
+    Computes an evasion trajectory as lateral offset d(s) on an equally spaced s-grid by solving a banded QP.
+
+    The cost penalizes the curvature (second difference) and the jerk (third difference) of d(s) and, with a small
+    weight, the offset from the raceline. Track bounds and the obstacle corridor enter as box constraints on d, the
+    continuity to the ego state and to the raceline as fixed values of the first and last two points.
+
+    The box constrained QP is solved with a primal-dual active set method. Every iteration solves the reduced
+    system of the free variables, which keeps the band structure of the Hessian, with `scipy.linalg.solveh_banded`.
+    The active set is warm started from the previous solution. The Hessian only depends on the number of grid points
+    and their spacing. Only its diagonals are stored and cached, every step is O(n).
+    """
+
+    BANDWIDTH = 3
+
+    def __init__(
+        self,
+        w_curvature: float = 1.0,
+        w_jerk: float = 0.1,
+        w_raceline: float = 1e-3,
+        max_iter: int = 20,
+    ):
+        """
+        Args:
+            w_curvature (float): weight of the squared second derivative of d(s)
+            w_jerk (float): weight of the squared third derivative of d(s)
+            w_raceline (float): weight of the squared offset from the raceline
+            max_iter (int): maximum number of active set iterations
+        """
+        self.w_curvature = w_curvature
+        self.w_jerk = w_jerk
+        self.w_raceline = w_raceline
+        self.max_iter = max_iter
+
+        self.n_points = None
+        self.spacing = None
+        self.hessian = None
+        self.prev_s = None
+        self.prev_d = None
+        self.last_iterations = 0
+
+    def _build_hessian(self, n: int, spacing: float):
+        """
+        Builds the diagonals of the Hessian for the given grid directly from the difference stencils, the dense matrix
+        is never formed. `hessian[k, i]` holds the entry (i, i + k). It is cached as long as the grid does not change.
+        """
+        hessian = np.zeros((self.BANDWIDTH + 1, n))
+        hessian[0] = self.w_raceline
+        for weight, order in ((self.w_curvature, 2), (self.w_jerk, 3)):
+            # D^T D of the difference matrix D, whose row r holds the stencil c at the columns r to r + order
+            stencil = np.diff(np.eye(order + 1), n=order, axis=0)[0] / spacing ** order
+            n_rows = n - order
+            for k in range(order + 1):
+                for j in range(order + 1 - k):
+                    hessian[k, j:j + n_rows] += weight * stencil[j] * stencil[j + k]
+        self.hessian = hessian * spacing
+        self.n_points = n
+        self.spacing = spacing
+
+    def _hessian_dot(self, x: np.ndarray) -> np.ndarray:
+        """
+        Product of the banded Hessian with `x`.
+        """
+        y = self.hessian[0] * x
+        for k in range(1, self.BANDWIDTH + 1):
+            y[:-k] += self.hessian[k, :-k] * x[k:]
+            y[k:] += self.hessian[k, :-k] * x[:-k]
+        return y
+
+    def _solve_reduced(self, free: np.ndarray, x: np.ndarray) -> np.ndarray:
+        """
+        Minimizes the cost over the free variables with all other variables fixed at their value in `x`.
+
+        Removing variables keeps the free ones in order, so the reduced Hessian is banded as well. Its diagonal k pairs
+        free variables k positions apart, which couple if their distance on the grid is within the band.
+        """
+        idx = np.flatnonzero(free)
+        n_free = idx.shape[0]
+        bands = np.zeros((self.BANDWIDTH + 1, n_free))
+        bands[self.BANDWIDTH] = self.hessian[0, idx]
+        for k in range(1, min(self.BANDWIDTH, n_free - 1) + 1):
+            gap = idx[k:] - idx[:-k]
+            in_band = gap <= self.BANDWIDTH
+            bands[self.BANDWIDTH - k, k:] = np.where(
+                in_band, self.hessian[np.minimum(gap, self.BANDWIDTH), idx[:-k]], 0.0
+            )
+        # coupling to the fixed and active variables
+        rhs = -self._hessian_dot(np.where(free, 0.0, x))[idx]
+        return solveh_banded(bands, rhs, check_finite=False)
+
+    def solve(
+        self,
+        s_grid: np.ndarray,
+        d_lower: np.ndarray,
+        d_upper: np.ndarray,
+        d_start: float = 0.0,
+        d_slope_start: float = 0.0,
+    ) -> Optional[np.ndarray]:
+        """
+        Solves the evasion QP.
+
+        Args:
+            s_grid (np.ndarray): equally spaced, unwrapped s coordinates, at least 5 points
+            d_lower (np.ndarray): lower bound of d at every grid point
+            d_upper (np.ndarray): upper bound of d at every grid point
+            d_start (float): lateral offset of the ego at the first grid point
+            d_slope_start (float): derivative dd/ds of the ego at the first grid point
+
+        Returns:
+            d (np.ndarray): optimal lateral offset at every grid point, or None if the QP is infeasible
+        """
+        n = s_grid.shape[0]
+        spacing = s_grid[1] - s_grid[0]
+        if self.hessian is None or n != self.n_points or not np.isclose(spacing, self.spacing):
+            self._build_hessian(n, spacing)
+
+        # continuity to the ego state at the start and to the raceline at the end
+        fixed = np.zeros(n, dtype=bool)
+        fixed[[0, 1, n - 2, n - 1]] = True
+        fixed_values = np.zeros(n)
+        fixed_values[0] = d_start
+        fixed_values[1] = d_start + spacing * d_slope_start
+
+        lower = np.where(fixed, -np.inf, d_lower)
+        upper = np.where(fixed, np.inf, d_upper)
+        if np.any(lower > upper):
+            return None
+
+        # warm start from the previous solution shifted to the new grid
+        if self.prev_d is not None:
+            x = np.interp(s_grid, self.prev_s, self.prev_d, left=d_start, right=0.0)
+        else:
+            x = np.zeros(n)
+        x[fixed] = fixed_values[fixed]
+        at_lower = ~fixed & (x <= lower)
+        at_upper = ~fixed & (x >= upper)
+
+        for self.last_iterations in range(1, self.max_iter + 1):
+            x[at_lower] = lower[at_lower]
+            x[at_upper] = upper[at_upper]
+            free = ~(fixed | at_lower | at_upper)
+            if np.any(free):
+                x[free] = self._solve_reduced(free, x)
+
+            # gradient of the cost gives the multipliers of the active bounds
+            grad = self._hessian_dot(x)
+            new_lower = ~fixed & ((free & (x < lower)) | (at_lower & (grad > 0)))
+            new_upper = ~fixed & ((free & (x > upper)) | (at_upper & (grad < 0)))
+            if np.array_equal(new_lower, at_lower) and np.array_equal(new_upper, at_upper):
+                break
+            at_lower, at_upper = new_lower, new_upper
+        else:
+            # no convergence, project onto the bounds if the result is still usable
+            x = np.clip(x, lower, upper)
+
+        self.prev_s = s_grid.copy()
+        self.prev_d = x.copy()
+        return x
+
+    def reset(self):
+        """
+        Drops the warm start.
+        """
+        self.prev_s = None
+        self.prev_d = None
@@ -1,17 +1,32 @@
 #!/usr/bin/env python3
 import time
-from typing import List, Any, Tuple
+import threading
+from typing import List, Tuple
 
 import rospy
+import rospkg
 import numpy as np
 from nav_msgs.msg import Odometry
-from std_msgs.msg import Float32
+from std_msgs.msg import Float32, Float32MultiArray, MultiArrayDimension
 from visualization_msgs.msg import Marker, MarkerArray
 from scipy.interpolate import InterpolatedUnivariateSpline as Spline
 
 from dynamic_reconfigure.msg import Config
 from f110_msgs.msg import Obstacle, ObstacleArray, OTWpntArray, Wpnt, WpntArray
 from frenet_converter.frenet_converter import FrenetConverter
+from pbl_config import CarConfig, load_car_config_ros
+
+from evasion_velocity import EvasionVelocityProfiler, load_veh_dyn_info
+from qp_evasion import QPEvasionSolver
+from corridor import Corridor
+from stage_timer import StageTimer
+
+
+class _NullPublisher:
+    """Stand-in for rospy.Publisher in offline mode"""
+
+    def publish(self, *args, **kwargs):
+        pass
 
 
 class ObstacleSpliner:
@@ -30,15 +45,24 @@ class ObstacleSpliner:
         - `/planner/avoidance/considered_OBS`: Publishes markers for the closest obstacle.
         - `/planner/avoidance/propagated_obs`: Publishes markers for the propagated obstacle.
         - `/planner/avoidance/latency`: Publishes the latency of the spliner node. (only if measuring is enabled)
+        - `/planner/avoidance/latency_stages`: Publishes p50/p90/p99/max latency per stage. (only if measuring is enabled)
     """
 
-    def __init__(self):
+    def __init__(self, offline: bool = False):
         """
         Initialize the node, subscribe to topics, and create publishers and service proxies.
+
+        Args:
+            offline (bool): If True, no ROS node is initialized and nothing is subscribed or published.
+                Used to replay recorded data through `do_spline` without a ROS master, see `spliner_replay.py`.
         """
         # Initialize the node
         self.name = "obs_spliner_node"
-        rospy.init_node(self.name)
+        self.offline = offline
+        if offline:
+            rospy.rostime.switch_to_wallclock()
+        else:
+            rospy.init_node(self.name)
 
         # initialize the instance variable
         self.obs = ObstacleArray()
@@ -49,18 +73,33 @@ class ObstacleSpliner:
         self.cur_s = 0
         self.cur_d = 0
         self.cur_vs = 0
+        self.cur_vd = 0
         self.gb_scaled_wpnts = WpntArray()
         self.lookahead = 10  # in meters [m]
         self.last_switch_time = rospy.Time.now()
         self.last_ot_side = ""
-        self.from_bag = rospy.get_param("/from_bag", False)
-        self.measuring = rospy.get_param("/measure", False)
+        self.from_bag = offline or rospy.get_param("/from_bag", False)
+        self.measuring = offline or rospy.get_param("/measure", False)
+
+        # Event driven mode: replan on every new obstacle array instead of polling at a fixed rate
+        self.event_driven = not offline and rospy.get_param("~event_driven", False)
+        self.max_rate = 40 if offline else rospy.get_param("~max_rate", 40)  # Hz, upper bound of the replanning rate
+        self.min_rate = 5 if offline else rospy.get_param("~min_rate", 5)  # Hz, keep-alive rate without new obstacles
+        self.last_plan_time = rospy.Time(0)
+        self.plan_lock = threading.Lock()
+        self.replan_lock = threading.Lock()  # guards replan_timer
+        self.replan_timer = None  # one-shot timer of a deferred replan, it plans with the latest obstacles
+        self.ready = False
+
+        # Per-stage timing, only measures if measuring is enabled
+        self.stage_timer = StageTimer(enabled=self.measuring)
+        self.stage_pub_period = 1.0  # in seconds [s]
+        self.last_stage_pub = time.perf_counter()
+
+        # Evasion backend: "spline" through the apex points or "qp" for the banded QP on an s-grid
+        self.spline_backend = "spline" if offline else rospy.get_param("~spline_backend", "spline")
+        self.qp_solver = QPEvasionSolver()
 
-        # Subscribe to the topics
-        rospy.Subscriber("/perception/obstacles", ObstacleArray, self.obs_cb)
-        rospy.Subscriber("/car_state/odom_frenet", Odometry, self.state_cb)
-        rospy.Subscriber("/global_waypoints", WpntArray, self.gb_cb)
-        rospy.Subscriber("/global_waypoints_scaled", WpntArray, self.gb_scaled_cb)
         # dyn params sub
         self.pre_apex_0 = -4
         self.pre_apex_1 = -3
@@ -71,18 +110,41 @@ class ObstacleSpliner:
         self.evasion_dist = 0.65
         self.obs_traj_tresh = 0.3
         self.spline_bound_mindist = 0.2
+        self.kd_obs_pred = 1
+        self.fixed_pred_time = 0.15
+
+        # Free space corridor, rebuilt on every global waypoints update
+        self.car_width = 0.0 if offline else rospy.get_param("~car_width", 0.0)  # in meters [m]
+        self.corridor = None
+
+        # Subscribe to the topics
+        if not offline:
+            rospy.Subscriber("/perception/obstacles", ObstacleArray, self.obs_cb)
+            rospy.Subscriber("/car_state/odom_frenet", Odometry, self.state_cb)
+            rospy.Subscriber("/global_waypoints", WpntArray, self.gb_cb)
+            rospy.Subscriber("/global_waypoints_scaled", WpntArray, self.gb_scaled_cb)
         if not self.from_bag:
             rospy.Subscriber("/dynamic_spline_tuner_node/parameter_updates", Config, self.dyn_param_cb)
 
+        if offline:
+            self.mrks_pub = self.evasion_pub = self.closest_obs_pub = self.pub_propagated = _NullPublisher()
+            self.latency_pub = self.stage_latency_pub = _NullPublisher()
+            # The converter and the velocity profiler are initialized by the caller once the waypoints are known
+            self.converter = None
+            self.vel_profiler = None
+            return
+
         self.mrks_pub = rospy.Publisher("/planner/avoidance/markers", MarkerArray, queue_size=10)
         self.evasion_pub = rospy.Publisher("/planner/avoidance/otwpnts", OTWpntArray, queue_size=10)
         self.closest_obs_pub = rospy.Publisher("/planner/avoidance/considered_OBS", Marker, queue_size=10)
         self.pub_propagated = rospy.Publisher("/planner/avoidance/propagated_obs", Marker, queue_size=10)
         if self.measuring:
             self.latency_pub = rospy.Publisher("/planner/avoidance/latency", Float32, queue_size=10)
+            self.stage_latency_pub = rospy.Publisher("/planner/avoidance/latency_stages", Float32MultiArray, queue_size=10)
 
 
         self.converter = self.initialize_converter()
+        self.vel_profiler = self.initialize_vel_profiler(racecar_version=rospy.get_param("/racecar_version"))
 
         # Set the rate at which the loop runs
         self.rate = rospy.Rate(20)  # Hz
@@ -93,16 +155,59 @@ class ObstacleSpliner:
     # Callback for obstacle topic
     def obs_cb(self, data: ObstacleArray):
         self.obs = data
+        if self.event_driven and self.ready:
+            self.request_replan()
+
+    # Callback for the keep-alive timer in event driven mode
+    def keep_alive_cb(self, event: rospy.timer.TimerEvent):
+        if (rospy.Time.now() - self.last_plan_time).to_sec() >= 1 / self.min_rate:
+            self.plan_and_publish(obs=self.obs)
+
+    # Callback for the one-shot timer of a deferred replan in event driven mode
+    def deferred_replan_cb(self, event: rospy.timer.TimerEvent):
+        with self.replan_lock:
+            self.replan_timer = None
+        self.request_replan()
+
+    def request_replan(self):
+        """
+        Replans with the latest obstacles, rate limited to max_rate.
+
+        Within 1 / max_rate of the last plan, or while a plan is running, a single replan is deferred to the end of the
+        rate limit instead. Obstacles arriving in the meantime only replace the ones this deferred replan uses.
+        """
+        with self.replan_lock:
+            if self.replan_timer is not None:
+                return
+            wait = (self.last_plan_time - rospy.Time.now()).to_sec() + 1 / self.max_rate
+            if wait > 0:
+                self.replan_timer = rospy.Timer(rospy.Duration(wait), self.deferred_replan_cb, oneshot=True)
+                return
+        if not self.plan_and_publish(obs=self.obs):
+            # a plan with older obstacles is running, plan again after it
+            with self.replan_lock:
+                if self.replan_timer is None:
+                    self.replan_timer = rospy.Timer(rospy.Duration(1 / self.max_rate), self.deferred_replan_cb,
+                                                    oneshot=True)
 
     def state_cb(self, data: Odometry):
         self.cur_s = data.pose.pose.position.x
         self.cur_d = data.pose.pose.position.y
         self.cur_vs = data.twist.twist.linear.x
+        self.cur_vd = data.twist.twist.linear.y
 
     # Callback for global waypoint topic
     def gb_cb(self, data: WpntArray):
         self.waypoints = np.array([[wpnt.x_m, wpnt.y_m] for wpnt in data.wpnts])
         self.gb_wpnts = data
+        bounds = np.array([[wpnt.s_m, wpnt.d_left, wpnt.d_right] for wpnt in data.wpnts])
+        self.corridor = Corridor(
+            s=bounds[:, 0],
+            d_left=bounds[:, 1],
+            d_right=bounds[:, 2],
+            track_length=data.wpnts[-1].s_m,
+            inflation=self._corridor_inflation(),
+        )
         if self.gb_vmax is None:
             self.gb_vmax = np.max(np.array([wpnt.vx_mps for wpnt in data.wpnts]))
             self.gb_max_idx = data.wpnts[-1].id
@@ -117,19 +222,53 @@ class ObstacleSpliner:
         """
         Notices the change in the parameters and changes spline params
         """
-        self.pre_apex_0 = -1 * rospy.get_param("dynamic_spline_tuner_node/pre_apex_dist0", -4)
-        self.pre_apex_1 = -1 * rospy.get_param("dynamic_spline_tuner_node/pre_apex_dist1", -3)
-        self.pre_apex_2 = -1 * rospy.get_param("dynamic_spline_tuner_node/pre_apex_dist2", -1.5) + 0.1
-        self.post_apex_0 = rospy.get_param("dynamic_spline_tuner_node/post_apex_dist0", 2)
-        self.post_apex_1 = rospy.get_param("dynamic_spline_tuner_node/post_apex_dist1", 3)
-        self.post_apex_2 = rospy.get_param("dynamic_spline_tuner_node/post_apex_dist2", 4)
+        self.set_spline_params(
+            pre_apex_dist0=rospy.get_param("dynamic_spline_tuner_node/pre_apex_dist0", -4),
+            pre_apex_dist1=rospy.get_param("dynamic_spline_tuner_node/pre_apex_dist1", -3),
+            pre_apex_dist2=rospy.get_param("dynamic_spline_tuner_node/pre_apex_dist2", -1.5),
+            post_apex_dist0=rospy.get_param("dynamic_spline_tuner_node/post_apex_dist0", 2),
+            post_apex_dist1=rospy.get_param("dynamic_spline_tuner_node/post_apex_dist1", 3),
+            post_apex_dist2=rospy.get_param("dynamic_spline_tuner_node/post_apex_dist2", 4),
+            evasion_dist=rospy.get_param("dynamic_spline_tuner_node/evasion_dist", 0.65),
+            obs_traj_tresh=rospy.get_param("dynamic_spline_tuner_node/obs_traj_tresh", 0.3),
+            spline_bound_mindist=rospy.get_param("dynamic_spline_tuner_node/spline_bound_mindist", 0.2),
+            kd_obs_pred=rospy.get_param("dynamic_spline_tuner_node/kd_obs_pred"),
+            fixed_pred_time=rospy.get_param("dynamic_spline_tuner_node/fixed_pred_time"),
+        )
 
-        self.evasion_dist = rospy.get_param("dynamic_spline_tuner_node/evasion_dist", 0.65)
-        self.obs_traj_tresh = rospy.get_param("dynamic_spline_tuner_node/obs_traj_tresh", 0.3)
-        self.spline_bound_mindist = rospy.get_param("dynamic_spline_tuner_node/spline_bound_mindist", 0.2)
+    def set_spline_params(
+        self,
+        pre_apex_dist0: float,
+        pre_apex_dist1: float,
+        pre_apex_dist2: float,
+        post_apex_dist0: float,
+        post_apex_dist1: float,
+        post_apex_dist2: float,
+        evasion_dist: float,
+        obs_traj_tresh: float,
+        spline_bound_mindist: float,
+        kd_obs_pred: float,
+        fixed_pred_time: float,
+    ):
+        """
+        Sets the spline params, named as in the dynamic reconfigure of the spliner
+        """
+        self.pre_apex_0 = -1 * pre_apex_dist0
+        self.pre_apex_1 = -1 * pre_apex_dist1
+        self.pre_apex_2 = -1 * pre_apex_dist2 + 0.1
+        self.post_apex_0 = post_apex_dist0
+        self.post_apex_1 = post_apex_dist1
+        self.post_apex_2 = post_apex_dist2
+
+        self.evasion_dist = evasion_dist
+        self.obs_traj_tresh = obs_traj_tresh
+        self.spline_bound_mindist = spline_bound_mindist
+
+        self.kd_obs_pred = kd_obs_pred
+        self.fixed_pred_time = fixed_pred_time
 
-        self.kd_obs_pred = rospy.get_param("dynamic_spline_tuner_node/kd_obs_pred")
-        self.fixed_pred_time = rospy.get_param("dynamic_spline_tuner_node/fixed_pred_time")
+        if self.corridor is not None:
+            self.corridor.set_inflation(self._corridor_inflation())
 
         spline_params = [
             self.pre_apex_0,
@@ -147,6 +286,9 @@ class ObstacleSpliner:
             f" obstacle prediciton k_d: {self.kd_obs_pred},    obstacle prediciton constant time: {self.fixed_pred_time} [s] "
         )
 
+    def _corridor_inflation(self) -> float:
+        return self.car_width / 2 + self.spline_bound_mindist
+
     #############
     # MAIN LOOP #
     #############
@@ -159,21 +301,48 @@ class ObstacleSpliner:
         rospy.wait_for_message("/dynamic_spline_tuner_node/parameter_updates", Config)
         rospy.loginfo(f"[{self.name}] Ready!")
 
+        self.ready = True
+
+        if self.event_driven:
+            rospy.Timer(rospy.Duration(1 / self.min_rate), self.keep_alive_cb)
+            rospy.spin()
+            return
+
         while not rospy.is_shutdown():
+            self.plan_and_publish(obs=self.obs)
+            self.rate.sleep()
+
+    def plan_and_publish(self, obs: ObstacleArray):
+        """
+        Plans the evasion trajectory for the given obstacles and publishes the waypoints and markers.
+
+        In event driven mode the output is stamped with the stamp of the obstacle array, such that the end-to-end latency
+        from the perception output can be measured. If a planning step is already running, the call is skipped.
+
+        Args:
+            obs (ObstacleArray): The obstacles to be evaded.
+
+        Returns:
+            bool: False if the call was skipped.
+        """
+        if not self.plan_lock.acquire(blocking=False):
+            return False
+        try:
+            self.last_plan_time = rospy.Time.now()
             if self.measuring:
                 start = time.perf_counter()
             # Sample data
-            obs = self.obs
             gb_scaled_wpnts = self.gb_scaled_wpnts.wpnts
+            stamp = obs.header.stamp if self.event_driven and not obs.header.stamp.is_zero() else rospy.Time.now()
             wpnts = OTWpntArray()
             mrks = MarkerArray()
 
-
             # If obs then do splining around it
             if len(obs.obstacles) > 0:
-                wpnts, mrks = self.do_spline(obstacles=obs, gb_wpnts=gb_scaled_wpnts)
+                wpnts, mrks = self.do_spline(obstacles=obs, gb_wpnts=gb_scaled_wpnts, stamp=stamp)
             # Else delete spline markers
             else:
+                wpnts.header.stamp = stamp
                 del_mrk = Marker()
                 del_mrk.header.stamp = rospy.Time.now()
                 del_mrk.action = Marker.DELETEALL
@@ -183,10 +352,16 @@ class ObstacleSpliner:
             if self.measuring:
                 end = time.perf_counter()
                 self.latency_pub.publish(end - start)
+                self.stage_timer.record("total", end - start)
+                if end - self.last_stage_pub > self.stage_pub_period:
+                    self.publish_stage_latencies()
+                    self.last_stage_pub = end
             self.evasion_pub.publish(wpnts)
             self.mrks_pub.publish(mrks)
-            self.rate.sleep()
-    
+        finally:
+            self.plan_lock.release()
+        return True
+
     #########
     # UTILS #
     #########
@@ -201,10 +376,39 @@ class ObstacleSpliner:
 
         return converter
 
-    def _more_space(self, obstacle: Obstacle, gb_wpnts: List[Any], gb_idxs: List[int]) -> Tuple[str, float]:
-        left_gap = abs(gb_wpnts[gb_idxs[0]].d_left - obstacle.d_left)
-        right_gap = abs(gb_wpnts[gb_idxs[0]].d_right + obstacle.d_right)
-        min_space = self.evasion_dist + self.spline_bound_mindist
+    def initialize_vel_profiler(self, racecar_version: str) -> EvasionVelocityProfiler:
+        """
+        Initialize the EvasionVelocityProfiler from the car config and the vehicle dynamics files of the global optimizer"""
+        car_config: CarConfig = load_car_config_ros(racecar_version)
+
+        veh_dyn_path = rospkg.RosPack().get_path("stack_master") + "/config/gb_optimizer/veh_dyn_info/"
+        ggv, ax_max_machines = load_veh_dyn_info(veh_dyn_path + "ggv.csv", veh_dyn_path + "ax_max_machines.csv")
+        profiler = EvasionVelocityProfiler(
+            ggv=ggv, ax_max_machines=ax_max_machines, a_max=car_config.a_max, a_min=car_config.a_min, v_max=car_config.v_max
+        )
+        rospy.loginfo(f"[{self.name}] initialized EvasionVelocityProfiler object for {racecar_version}")
+
+        return profiler
+
+    def publish_stage_latencies(self):
+        """
+        Publishes the p50/p90/p99/max latency of every stage in seconds as a (stages x 4) array.
+        The first dimension label holds the comma separated stage names.
+        """
+        summary = self.stage_timer.summary()
+        msg = Float32MultiArray()
+        msg.layout.dim = [
+            MultiArrayDimension(label=",".join(summary.keys()), size=len(summary), stride=4 * len(summary)),
+            MultiArrayDimension(label=",".join(StageTimer.STATS), size=4, stride=4),
+        ]
+        msg.data = np.concatenate(list(summary.values())).tolist() if summary else []
+        self.stage_latency_pub.publish(msg)
+
+    def _more_space(self, obstacle: Obstacle, s_apex: float) -> Tuple[str, float]:
+        bound_left, bound_right = self.corridor.track_bounds(s_apex)
+        left_gap = abs(bound_left - obstacle.d_left)
+        right_gap = abs(bound_right + obstacle.d_right)
+        min_space = self.evasion_dist + self._corridor_inflation()
 
         if right_gap > min_space and left_gap < min_space:
             # Compute apex distance to the right of the opponent
@@ -236,7 +440,7 @@ class ObstacleSpliner:
                     candidate_d_apex_right = 0
                 return "right", candidate_d_apex_right
 
-    def do_spline(self, obstacles: ObstacleArray, gb_wpnts: WpntArray) -> Tuple[WpntArray, MarkerArray]:
+    def do_spline(self, obstacles: ObstacleArray, gb_wpnts: WpntArray, stamp: rospy.Time = None) -> Tuple[WpntArray, MarkerArray]:
         """
         Creates an evasion trajectory for the closest obstacle by splining between pre- and post-apex points.
 
@@ -248,13 +452,16 @@ class ObstacleSpliner:
         Args:
         - obstacles (ObstacleArray): An array of obstacle objects to be evaded.
         - gb_wpnts (WpntArray): A list of global waypoints that describe a reference raceline.
-        - state (Odometry): The current state of the car.
+        - stamp (rospy.Time): The stamp of the output waypoints. Defaults to the current time.
 
         Returns:
         - wpnts (WpntArray): An array of waypoints that describe the evasion trajectory to the closest obstacle.
         - mrks (MarkerArray): An array of markers that represent the waypoints in a visualization format.
 
         """
+        if stamp is None:
+            stamp = rospy.Time.now()
+
         # Return wpnts and markers
         mrks = MarkerArray()
         wpnts = OTWpntArray()
@@ -263,7 +470,9 @@ class ObstacleSpliner:
         wpnt_dist = gb_wpnts[1].s_m - gb_wpnts[0].s_m
 
         # Only use obstacles that are within a threshold of the raceline, else we don't care about them
+        self.stage_timer.start()
         close_obs = self._obs_filtering(obstacles=obstacles)
+        self.stage_timer.lap("prediction")
 
         # If there are obstacles within the lookahead distance, then we need to generate an evasion trajectory considering the closest one
         if len(close_obs) > 0:
@@ -282,45 +491,24 @@ class ObstacleSpliner:
             kappas = np.array([gb_wpnts[gb_idx].kappa_radpm for gb_idx in gb_idxs])
             outside = "left" if np.sum(kappas) < 0 else "right"
             # Choose the correct side and compute the distance to the apex based on left of right of the obstacle
-            more_space, d_apex = self._more_space(closest_obs, gb_wpnts, gb_idxs)
+            more_space, d_apex = self._more_space(closest_obs, s_apex)
 
             # Publish the point around which we are splining
             mrk = self.xy_to_point(x=gb_wpnts[gb_idxs[0]].x_m, y=gb_wpnts[gb_idxs[0]].y_m, opponent=False)
             self.closest_obs_pub.publish(mrk)
 
-            # Choose wpnts from global trajectory for splining with velocity
-            evasion_points = []
-            spline_params = [
-                self.pre_apex_0,
-                self.pre_apex_1,
-                self.pre_apex_2,
-                0,
-                self.post_apex_0,
-                self.post_apex_1,
-                self.post_apex_2,
-            ]
-            for i, dst in enumerate(spline_params):
-                # scale dst linearly between 1 and 1.5 depending on the speed normalised to the max speed
-                dst = dst * np.clip(1.0 + self.cur_vs / self.gb_vmax, 1, 1.5)
-                # If we overtake on the outside, we smoothen the spline
-                if outside == more_space:
-                    si = s_apex + dst * 1.75 #TODO make parameter
-                else:
-                    si = s_apex + dst
-                di = d_apex if dst == 0 else 0
-                evasion_points.append([si, di])
-            # Convert to nump
-            evasion_points = np.array(evasion_points)
-
-            # Spline spatialy for d with s as base
             spline_resolution = 0.1 # TODO read from ros params to make consistent in case it changes
-            spatial_spline = Spline(x=evasion_points[:, 0], y=evasion_points[:, 1])
-            evasion_s = np.arange(evasion_points[0, 0], evasion_points[-1, 0], spline_resolution)
-            # Clipe the d to the apex distance
-            if d_apex < 0:
-                evasion_d = np.clip(spatial_spline(evasion_s), d_apex, 0)
-            else:
-                evasion_d = np.clip(spatial_spline(evasion_s), 0, d_apex)
+            evasion_s, evasion_d = None, None
+            if self.spline_backend == "qp":
+                evasion_s, evasion_d = self._qp_evasion(
+                    closest_obs, s_apex, more_space, outside, spline_resolution
+                )
+                if evasion_d is None:
+                    rospy.loginfo_throttle_identical(
+                        2, f"[{self.name}]: Evasion QP infeasible, falling back to the spline"
+                    )
+            if evasion_d is None:
+                evasion_s, evasion_d = self._spline_evasion(s_apex, d_apex, more_space, outside, spline_resolution)
 
             # Handle Wrapping of s
             evasion_s = evasion_s % self.gb_max_s
@@ -332,27 +520,35 @@ class ObstacleSpliner:
             # Check if a side switch is possible
             if not self._check_ot_side_possible(more_space):
                 danger_flag = True
-            
-            for i in range(evasion_s.shape[0]):
-                gb_wpnt_i = int((evasion_s[i] / wpnt_dist) % self.gb_max_idx)
-                # Check if wpnt is too close to the trackbounds but only if spline is actually off the raceline
-                if abs(evasion_d[i]) > spline_resolution:
-                    tb_dist = gb_wpnts[gb_wpnt_i].d_left if more_space == "left" else gb_wpnts[gb_wpnt_i].d_right
-                    if abs(evasion_d[i]) > abs(tb_dist) - self.spline_bound_mindist:
-                        rospy.loginfo_throttle_identical(
-                            2, f"[{self.name}]: Evasion trajectory too close to TRACKBOUNDS, aborting evasion"
-                        )
-                        danger_flag = True
-                        break
-                # Get V from gb wpnts and go slower if we are going through the inside
-                vi = gb_wpnts[gb_wpnt_i].vx_mps if outside == more_space else gb_wpnts[gb_wpnt_i].vx_mps * 0.9 # TODO make speed scaling ros param
-                wpnts.wpnts.append(
-                    self.xyv_to_wpnts(x=resp[0, i], y=resp[1, i], s=evasion_s[i], d=evasion_d[i], v=vi, wpnts=wpnts)
+            self.stage_timer.lap("spline")
+
+            # Get V from gb wpnts and go slower if we are going through the inside, then limit it by the evasion curvature
+            gb_wpnt_idxs = ((evasion_s / wpnt_dist) % self.gb_max_idx).astype(int)
+            v_scale = 1.0 if outside == more_space else 0.9 # TODO make speed scaling ros param
+            evasion_v_ceil = np.array([gb_wpnts[gb_wpnt_i].vx_mps for gb_wpnt_i in gb_wpnt_idxs]) * v_scale
+            path_s, path_kappa = self.vel_profiler.path_curvature(resp[0], resp[1])
+            evasion_v = self.vel_profiler.compute(s=path_s, kappa=path_kappa, v_ceil=evasion_v_ceil)
+            self.stage_timer.lap("velocity")
+
+            # Check if wpnts are too close to the trackbounds but only if spline is actually off the raceline
+            if np.any(self.corridor.violates(evasion_s, evasion_d, side=more_space, min_offset=spline_resolution)):
+                rospy.loginfo_throttle_identical(
+                    2, f"[{self.name}]: Evasion trajectory too close to TRACKBOUNDS, aborting evasion"
                 )
-                mrks.markers.append(self.xyv_to_markers(x=resp[0, i], y=resp[1, i], v=vi, mrks=mrks))
+                danger_flag = True
+            self.stage_timer.lap("bounds")
+
+            # The waypoints are discarded anyway if the evasion is dangerous
+            if not danger_flag:
+                for i in range(evasion_s.shape[0]):
+                    vi = evasion_v[i]
+                    wpnts.wpnts.append(
+                        self.xyv_to_wpnts(x=resp[0, i], y=resp[1, i], s=evasion_s[i], d=evasion_d[i], v=vi, wpnts=wpnts)
+                    )
+                    mrks.markers.append(self.xyv_to_markers(x=resp[0, i], y=resp[1, i], v=vi, mrks=mrks))
 
             # Fill the rest of OTWpnts
-            wpnts.header.stamp = rospy.Time.now()
+            wpnts.header.stamp = stamp
             wpnts.header.frame_id = "map"
             if not danger_flag:
                 wpnts.ot_side = more_space
@@ -362,16 +558,111 @@ class ObstacleSpliner:
 
                 # Update the last switch time and the last side
                 if self.last_ot_side != more_space:
-                    self.last_switch_time = rospy.Time.now()
+                    self.last_switch_time = stamp
                 self.last_ot_side = more_space
             else:
                 wpnts.wpnts = []
                 mrks.markers = []
                 # This fools the statemachine to cool down
                 wpnts.side_switch = True
-                self.last_switch_time = rospy.Time.now()
+                self.last_switch_time = stamp
+            self.stage_timer.lap("messages")
         return wpnts, mrks
 
+    def _spline_evasion(
+        self, s_apex: float, d_apex: float, more_space: str, outside: str, spline_resolution: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Splines between pre- and post-apex points around the apex.
+
+        Returns:
+            evasion_s (np.ndarray): unwrapped s coordinates of the evasion trajectory
+            evasion_d (np.ndarray): d coordinates of the evasion trajectory
+        """
+        # Choose wpnts from global trajectory for splining with velocity
+        evasion_points = []
+        spline_params = [
+            self.pre_apex_0,
+            self.pre_apex_1,
+            self.pre_apex_2,
+            0,
+            self.post_apex_0,
+            self.post_apex_1,
+            self.post_apex_2,
+        ]
+        for i, dst in enumerate(spline_params):
+            # scale dst linearly between 1 and 1.5 depending on the speed normalised to the max speed
+            dst = dst * np.clip(1.0 + self.cur_vs / self.gb_vmax, 1, 1.5)
+            # If we overtake on the outside, we smoothen the spline
+            if outside == more_space:
+                si = s_apex + dst * 1.75 #TODO make parameter
+            else:
+                si = s_apex + dst
+            di = d_apex if dst == 0 else 0
+            evasion_points.append([si, di])
+        # Convert to nump
+        evasion_points = np.array(evasion_points)
+
+        # Spline spatialy for d with s as base
+        spatial_spline = Spline(x=evasion_points[:, 0], y=evasion_points[:, 1])
+        evasion_s = np.arange(evasion_points[0, 0], evasion_points[-1, 0], spline_resolution)
+        # Clipe the d to the apex distance
+        if d_apex < 0:
+            evasion_d = np.clip(spatial_spline(evasion_s), d_apex, 0)
+        else:
+            evasion_d = np.clip(spatial_spline(evasion_s), 0, d_apex)
+
+        return evasion_s, evasion_d
+
+    def _qp_evasion(
+        self,
+        obstacle: Obstacle,
+        s_apex: float,
+        more_space: str,
+        outside: str,
+        spline_resolution: float,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Computes the evasion trajectory with the banded QP of the `QPEvasionSolver`.
+
+        The s-grid spans the same range as the spline. The free space of the `Corridor` and the
+        corridor next to the obstacle on the side `more_space` are box constraints. If the car is already within the
+        s-grid, the trajectory starts at its current position and heading, else on the raceline.
+
+        Returns:
+            evasion_s (np.ndarray): unwrapped s coordinates of the evasion trajectory, or None if the QP is infeasible
+            evasion_d (np.ndarray): d coordinates of the evasion trajectory, or None if the QP is infeasible
+        """
+        # Same extent as the spline
+        dst_scale = np.clip(1.0 + self.cur_vs / self.gb_vmax, 1, 1.5)
+        if outside == more_space:
+            dst_scale *= 1.75
+        s_start = s_apex + self.pre_apex_0 * dst_scale
+        s_end = s_apex + self.post_apex_2 * dst_scale
+
+        # Start at the car if it is already within the evasion
+        d_start, d_slope_start = 0.0, 0.0
+        ego_progress = (self.cur_s - s_start) % self.gb_max_s
+        if ego_progress < s_end - s_start:
+            s_start += ego_progress
+            d_start = self.cur_d
+            d_slope_start = self.cur_vd / max(self.cur_vs, 1.0)
+        evasion_s = np.arange(s_start, s_end, spline_resolution)
+        if evasion_s.shape[0] < 5:
+            return None, None
+
+        # Track bounds with the obstacle cut out
+        d_lower, d_upper = self.corridor.with_obstacles(
+            evasion_s, more_space, *Corridor.obstacle_arrays([obstacle]), clearance=self.evasion_dist
+        )
+
+        evasion_d = self.qp_solver.solve(
+            s_grid=evasion_s, d_lower=d_lower, d_upper=d_upper, d_start=d_start, d_slope_start=d_slope_start
+        )
+        if evasion_d is None:
+            return None, None
+        return evasion_s, evasion_d
+
     def _obs_filtering(self, obstacles: ObstacleArray) -> List[Obstacle]:
         # Only use obstacles that are within a threshold of the raceline, else we don't care about them
         obs_on_traj = [obs for obs in obstacles.obstacles if abs(obs.d_center) < self.obs_traj_tresh]
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Replays recorded obstacle and odometry inputs from a rosbag through `ObstacleSpliner.do_spline` without a running
+ROS master and prints the per-stage latency breakdown.
+
+Usage:
+    python3 spliner_replay.py --bag <path/to/bag> --racecar_version NUC2
+"""
+import argparse
+import time
+
+import rosbag
+
+from frenet_converter.frenet_converter import FrenetConverter
+from spliner_node import ObstacleSpliner
+from stage_timer import StageTimer
+
+
+def replay(bag_path: str, racecar_version: str, repeat: int = 1, backend: str = "spline") -> ObstacleSpliner:
+    """
+    Replays the bag through the spliner.
+
+    Args:
+        bag_path (str): path to a bag containing `/perception/obstacles`, `/car_state/odom_frenet`,
+            `/global_waypoints` and `/global_waypoints_scaled`. If `/dynamic_spline_tuner_node/parameter_updates`
+            is recorded, the spline params are updated accordingly.
+        racecar_version (str): car whose `CarConfig` is used for the evasion velocity profile
+        repeat (int): number of times the bag is replayed
+        backend (str): evasion backend of the spliner, "spline" or "qp"
+
+    Returns:
+        spliner (ObstacleSpliner): the spliner, holding the timing statistics in `stage_timer`
+    """
+    spliner = ObstacleSpliner(offline=True)
+    spliner.spline_backend = backend
+    # Keep all samples of the replay for the statistics
+    spliner.stage_timer = StageTimer(enabled=True, size=100000)
+    topics = [
+        "/perception/obstacles",
+        "/car_state/odom_frenet",
+        "/global_waypoints",
+        "/global_waypoints_scaled",
+        "/dynamic_spline_tuner_node/parameter_updates",
+    ]
+
+    with rosbag.Bag(bag_path) as bag:
+        for _ in range(repeat):
+            for topic, msg, _ in bag.read_messages(topics=topics):
+                if topic == "/global_waypoints":
+                    if spliner.converter is None:
+                        spliner.gb_cb(msg)
+                        spliner.converter = FrenetConverter(spliner.waypoints[:, 0], spliner.waypoints[:, 1])
+                        spliner.vel_profiler = spliner.initialize_vel_profiler(racecar_version=racecar_version)
+                elif topic == "/global_waypoints_scaled":
+                    spliner.gb_scaled_cb(msg)
+                elif topic == "/car_state/odom_frenet":
+                    spliner.state_cb(msg)
+                elif topic == "/dynamic_spline_tuner_node/parameter_updates":
+                    spliner.set_spline_params(**{param.name: param.value for param in msg.doubles})
+                elif topic == "/perception/obstacles":
+                    if spliner.converter is None or len(spliner.gb_scaled_wpnts.wpnts) == 0:
+                        continue
+                    if len(msg.obstacles) == 0:
+                        continue
+                    start = time.perf_counter()
+                    spliner.do_spline(obstacles=msg, gb_wpnts=spliner.gb_scaled_wpnts.wpnts)
+                    spliner.stage_timer.record("total", time.perf_counter() - start)
+
+    return spliner
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a bag through the spliner and print the latency per stage.")
+    parser.add_argument("--bag", type=str, required=True, help="Path to the bag file")
+    parser.add_argument("--racecar_version", type=str, default="NUC2", help="Car used for the velocity profile")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of times the bag is replayed")
+    parser.add_argument("--backend", type=str, default="spline", choices=["spline", "qp"], help="Evasion backend")
+    args = parser.parse_args()
+
+    spliner = replay(bag_path=args.bag, racecar_version=args.racecar_version, repeat=args.repeat, backend=args.backend)
+    print(spliner.stage_timer.format_summary())
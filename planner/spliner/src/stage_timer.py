@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List
+
+import numpy as np
+
+
+class StageTimer:
+    """
+    Lightweight per-stage timing facility.
+
+    The durations of every stage are kept in a fixed-size ring buffer, such that the memory footprint and the cost of
+    the statistics do not grow over time. When disabled, `stage` returns a shared no-op context manager and
+    `start`/`lap` return immediately.
+
+    Usage:
+        timer = StageTimer(enabled=True)
+        with timer.stage("prediction"):
+            ...
+        # or, for consecutive stages
+        timer.start()
+        ...
+        timer.lap("spline")
+        ...
+        timer.lap("bounds")
+        print(timer.format_summary())
+    """
+
+    STATS = ("p50", "p90", "p99", "max")
+
+    def __init__(self, enabled: bool = True, size: int = 1000):
+        """
+        Args:
+            enabled (bool): if False, the timer does not measure anything
+            size (int): number of samples kept per stage
+        """
+        self.enabled = enabled
+        self.size = size
+        self.buffers: Dict[str, np.ndarray] = {}
+        self.counts: Dict[str, int] = {}
+        self._null = nullcontext()
+        self._lap_start = 0.0
+
+    def stage(self, name: str):
+        """
+        Returns a context manager measuring the duration of the enclosed code as stage `name`.
+        """
+        if not self.enabled:
+            return self._null
+        return self._measure(name)
+
+    @contextmanager
+    def _measure(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def start(self):
+        """
+        Starts a sequence of consecutive stages measured with `lap`.
+        """
+        if self.enabled:
+            self._lap_start = time.perf_counter()
+
+    def lap(self, name: str):
+        """
+        Records the time since the last `start` or `lap` as stage `name`.
+        """
+        if self.enabled:
+            now = time.perf_counter()
+            self.record(name, now - self._lap_start)
+            self._lap_start = now
+
+    def record(self, name: str, duration: float):
+        """
+        Records the duration of stage `name` in seconds.
+        """
+        if name not in self.buffers:
+            self.buffers[name] = np.zeros(self.size)
+            self.counts[name] = 0
+        self.buffers[name][self.counts[name] % self.size] = duration
+        self.counts[name] += 1
+
+    @property
+    def stages(self) -> List[str]:
+        return list(self.buffers.keys())
+
+    def summary(self) -> Dict[str, np.ndarray]:
+        """
+        Computes the p50/p90/p99/max statistics of every stage in seconds.
+
+        Returns:
+            summary (Dict[str, np.ndarray]): maps the stage name to an array with the statistics in the order of `STATS`
+        """
+        summary = {}
+        for name, buffer in self.buffers.items():
+            samples = buffer[:min(self.counts[name], self.size)]
+            summary[name] = np.append(np.percentile(samples, [50, 90, 99]), np.max(samples))
+        return summary
+
+    def format_summary(self) -> str:
+        """
+        Formats the statistics of every stage as a table in milliseconds.
+        """
+        lines = [f"{'stage':<12}" + "".join(f"{stat:>10}" for stat in self.STATS) + f"{'samples':>10}"]
+        for name, stats in self.summary().items():
+            lines.append(f"{name:<12}" + "".join(f"{1e3 * stat:>10.3f}" for stat in stats) + f"{self.counts[name]:>10}")
+        return "\n".join(lines)
+
+    def reset(self):
+        self.buffers = {}
+        self.counts = {}
@@ -1,4 +1,7 @@
 from pbl_config.CarConfig import CarConfig, load_car_config_ros
+from pbl_config.controller.ftg.FTGConfig import FTGConfig, load_FTG_config_ros
+from pbl_config.controller.ftg.FTGConfigDyn import (
+    FTGConfigDyn, create_FTG_dynamic_parameters)
 from pbl_config.controller.mpc.KMPCConfig import (KMPCConfig,
                                                   load_KMPC_config_ros)
 from pbl_config.controller.mpc.KMPCConfigDyn import (
@@ -21,6 +24,8 @@ from pbl_config.planner.MultiOppSplinerConfig import MultiOppSplinerConfig, load
 
 __all__ = [
     'CarConfig', 'load_car_config_ros',
+    'FTGConfig', 'load_FTG_config_ros',
+    'FTGConfigDyn', 'create_FTG_dynamic_parameters',
     'KMPCConfig', 'load_KMPC_config_ros',
     'KMPCConfigDyn', 'create_KMPC_dynamic_parameters',
     'STMPCConfig', 'load_STMPC_config_ros',
@@ -0,0 +1,68 @@
+import os
+
+import rospkg
+import yaml
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+
+class FTGConfig(BaseModel):
+    """Follow The Gap configuration class"""
+    model_config = ConfigDict(extra='forbid', use_attribute_docstrings=True)
+
+    debug: bool
+    """Publish the processed scan, the best gap and the best point as markers"""
+    debug_rate: float
+    """Maximum rate of the debug markers in Hz"""
+
+    # lidar processing
+    preprocess_conv_size: int
+    """Number of beams of the moving average smoothing the scan"""
+    safety_radius: int
+    """Minimum number of beams the safety bubble of an edge covers, helps not to cut corners"""
+    safety_bubble: float
+    """Lateral clearance of the safety bubble in meters, widens it beyond safety_radius beams for close edges"""
+    max_lidar_dist: float
+    """Ranges are clipped to this distance in meters"""
+    range_offset: int
+    """Only the beams [range_offset, -range_offset] of the scan are considered"""
+    track_width: float
+    """Approximate gap distance on a straight without obstacles, sets the gap radius"""
+
+    # speed
+    max_speed: float = Field(gt=0)
+    """Maximum speed in m/s, the gap radius is scaled by the speed relative to it"""
+    speed_scale: float
+    """Scale of max_speed for the speed of each steering range"""
+    mapping_speed: float
+    """Constant speed in m/s when FTG is used for mapping"""
+
+
+def load_FTG_config_ros(racecar_version: str) -> FTGConfig:
+    """Loads the FTG config from the yaml file, the one of DEFAULT if the car has no ftg_params.yaml
+
+    Args:
+        racecar_version (str): a car name
+    """
+
+    relative_path = '/config/' + racecar_version + '/ftg_params.yaml'
+    if not os.path.isfile(rospkg.RosPack().get_path('stack_master') + relative_path):
+        relative_path = '/config/DEFAULT/ftg_params.yaml'
+    config_path = rospkg.RosPack().get_path('stack_master') + relative_path
+    with open(config_path, 'r') as file:
+        cfg_dict = yaml.safe_load(file)
+        try:
+            config = FTGConfig(**cfg_dict)
+        except ValidationError as e:
+            for error in e.errors():
+                if error["type"] == "missing":
+                    for missing_key in error["loc"]:
+                        print(f"Missing key <{missing_key}> in {config_path} file. Please add it.")
+                elif error["type"] == "extra_forbidden":
+                    for extra_key in error["loc"]:
+                        print(f"Extra key <{extra_key}> in {config_path} file. Please remove it.")
+                else:
+                    print(f"Error loading the {config_path} file. Please contact support (edo) with this traceback.")
+                    raise e
+            return None
+
+    return config
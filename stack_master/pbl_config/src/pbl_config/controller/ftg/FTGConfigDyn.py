@@ -0,0 +1,75 @@
+from typing import Tuple
+
+import rospkg
+import yaml
+from dynamic_reconfigure.parameter_generator_catkin import ParameterGenerator
+from pbl_config import FTGConfig, load_FTG_config_ros
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+
+class FTGConfigDyn(BaseModel):
+    """Follow The Gap dynamic reconfigure configuration class"""
+    model_config = ConfigDict(extra='forbid', use_attribute_docstrings=True)
+
+    safety_radius: Tuple[float, float]
+    """Minimum number of beams the safety bubble of an edge covers, helps not to cut corners"""
+    safety_bubble: Tuple[float, float]
+    """Lateral clearance of the safety bubble in meters, widens it beyond safety_radius beams for close edges"""
+    max_lidar_dist: Tuple[float, float]
+    """Ranges are clipped to this distance in meters"""
+    track_width: Tuple[float, float]
+    """Approximate gap distance on a straight without obstacles, sets the gap radius"""
+    max_speed: Tuple[float, float]
+    """Maximum speed in m/s, the gap radius is scaled by the speed relative to it"""
+    speed_scale: Tuple[float, float]
+    """Scale of max_speed for the speed of each steering range"""
+
+
+def create_FTG_dynamic_parameters(gen: ParameterGenerator):
+    """Create dynamic reconfigure parameters for the FTG controller
+
+    Args:
+        gen (ParameterGenerator): The dynamic reconfigure parameter generator
+    """
+    default_car = "DEFAULT"
+    # load default parameters from the yaml file
+    FTGcfg: FTGConfig = load_FTG_config_ros(racecar_version=default_car)
+
+    # load the dynamic reconfigure parameters
+    relative_path = f'/config/{default_car}/ftg_dyn_params.yaml'
+    config_path = rospkg.RosPack().get_path('stack_master') + relative_path
+    with open(config_path, 'r') as file:
+        cfg_dict = yaml.safe_load(file)
+    try:
+        config = FTGConfigDyn(**cfg_dict)
+    except ValidationError as e:
+        for error in e.errors():
+            if error["type"] == "missing":
+                for missing_key in error["loc"]:
+                    raise ValueError(f"Missing key <{missing_key}> in {config_path} file. Please add it.")
+            elif error["type"] == "extra_forbidden":
+                for extra_key in error["loc"]:
+                    raise ValueError(f"Extra key <{extra_key}> in {config_path} file. Please remove it.")
+            else:
+                raise ValueError(f"Error loading the {config_path} file. Please contact support (edo) with this traceback.")
+        return None
+
+    # check dyn parameters are available in the normal config
+    for key in config.model_dump().keys():
+        if key not in FTGcfg.model_dump().keys():
+            raise ValueError(f"Key <{key}> is not available in the normal config. Please only try to dynamically reconfigure only the available parameters.")
+
+    # create the dynamic reconfigure parameters, integer parameters of the config stay integers
+    for key, value in config.model_dump().items():
+        default = FTGcfg.model_dump()[key]
+        is_int = isinstance(default, int)
+        gen.add(name=key,
+                paramtype='int' if is_int else 'double',
+                level=0,
+                description=f"{config.model_fields[key].description}",
+                default=default,
+                min=int(value[0]) if is_int else value[0],
+                max=int(value[1]) if is_int else value[1],
+        )
+
+    return gen
@@ -13,6 +13,8 @@ class STMPCConfig(BaseModel):
     """Prediction horizon"""
     t_delay: float
     """Delay in seconds accounted for propagation before the MPC is applied"""
+    propagate_delay: bool
+    """If true, the initial state of the MPC is propagated over t_delay and the compute time with the last input"""
     steps_delay: int
     """Delays for the steering angle"""
     MPC_freq: int
@@ -25,6 +27,18 @@ class STMPCConfig(BaseModel):
     """MPC Overtake path lateral tracking distance"""
 
 
+    # solver settings
+    nlp_solver_type: str
+    """SQP_RTI for a single SQP iteration per control cycle, SQP to iterate until convergence"""
+    qp_solver: str
+    """acados QP solver, e.g. PARTIAL_CONDENSING_HPIPM or FULL_CONDENSING_HPIPM"""
+    warm_start: str
+    """shift: shifted last solution as initial guess, none: last iterate of the solver"""
+    fallback_cycles: int
+    """Control cycles the shifted last feasible solution is followed if the solver fails, before the warm start is reset"""
+    track_params: bool
+    """If true, curvature and track bounds are stage parameters and the generated solver does not depend on the track"""
+
     # Cost function settings #
     qjerk: float
     """jerk cost weight"""
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Checks the array-backed conditions of the state machine against the former ones, which walk the obstacle lists.
+
+A synthetic head-to-head sequence is replayed with `StateMachineSim` through a state machine with the current
+conditions and through one with the former conditions. The ego drives on the raceline and catches up with an opponent,
+the spliner provides an avoidance line around the opponent and static obstacles are scattered around the track. All
+overtaking sectors of the map are enabled, such that the overtaking states are reached. Both state machines must visit
+the same states on every tick, and on every tick the current conditions must return the same values as the former ones
+on the same inputs. The latency per tick of both is reported for every number of obstacles.
+
+Usage:
+    python3 check_state_machine_conditions.py
+    python3 check_state_machine_conditions.py --map JFR_racingv5 --ot_planner spliner --n_obstacles 0 1 5 20 50
+"""
+import argparse
+import json
+import sys
+from typing import Callable, Dict, List
+
+import numpy as np
+import rospkg
+import rospy
+from f110_msgs.msg import Obstacle, OTWpntArray, Wpnt, WpntArray
+
+from state_machine_node import StateMachine
+from state_machine_sim import StateMachineSim, load_params
+
+
+def legacy_check_ofree(sm: StateMachine) -> bool:
+    """
+    Former `_check_ofree` of the spliner and frenet planners.
+    """
+    o_free = True
+    if sm.ot_planner == "spliner" or sm.ot_planner == "predictive_spliner":
+        if not sm.timetrials_only and sm.last_valid_avoidance_wpnts is not None:
+            horizon = sm.overtaking_horizon_m
+            for obs in sm.obstacles:
+                if sm.ot_planner == "spliner" or (sm.ot_planner == "predictive_spliner" and obs.is_static == True):
+                    obs_s = obs.s_center
+                    dist_to_obj = (obs_s - sm.cur_s) % sm.max_s
+                    if dist_to_obj < horizon and len(sm.last_valid_avoidance_wpnts):
+                        obs_d = obs.d_center
+                        avoid_wpnt_idx = np.argmin(
+                            np.array([abs(avoid_s.s_m - obs_s) for avoid_s in sm.last_valid_avoidance_wpnts])
+                        )
+                        ot_d = sm.last_valid_avoidance_wpnts[avoid_wpnt_idx].d_m
+                        ot_obs_dist = ot_d - obs_d
+                        if abs(ot_obs_dist) < sm.lateral_width_ot_m:
+                            o_free = False
+                            rospy.loginfo("[State Machine] O_FREE False, obs dist to ot lane: {} m".format(ot_obs_dist))
+                            break
+        return o_free
+    elif sm.ot_planner == "frenet":
+        if not sm.timetrials_only and sm.overtake_wpnts is not None:
+            horizon = sm.overtaking_horizon_m
+            for obs in sm.obstacles:
+                obs_s = obs.s_center
+                dist_to_obj = (obs_s - sm.cur_s) % sm.max_s
+                if dist_to_obj < horizon and len(sm.frenet_wpnts.wpnts):
+                    obs_d = obs.d_center
+                    avoid_wpnt_idx = np.argmin(np.array([abs(avoid_s.s_m - obs_s) for avoid_s in sm.frenet_wpnts.wpnts]))
+                    ot_d = sm.frenet_wpnts.wpnts[avoid_wpnt_idx].d_m
+                    ot_obs_dist = ot_d - obs_d
+                    if abs(ot_obs_dist) < sm.lateral_width_ot_m:
+                        o_free = False
+                        rospy.loginfo("[State Machine] O_FREE False, obs dist to ot lane: {} m".format(ot_obs_dist))
+                        break
+        return o_free
+    raise NotImplementedError
+
+
+def legacy_check_gbfree(sm: StateMachine) -> bool:
+    """
+    Former `_check_gbfree`.
+    """
+    gb_free = True
+    if not sm.timetrials_only:
+        horizon = sm.gb_horizon_m
+        for obs in sm.obstacles:
+            gap = (obs.s_center - sm.cur_s) % sm.track_length
+            if gap < horizon:
+                obs_d = obs.d_center
+                if abs(obs_d) < sm.lateral_width_gb_m:
+                    gb_free = False
+                    rospy.loginfo(f"[{sm.name}] GB_FREE False, obs dist to ot lane: {obs_d} m")
+                    break
+    return gb_free
+
+
+def legacy_check_prediction_gbfree(sm: StateMachine) -> bool:
+    """
+    Former `_check_prediction_gbfree`.
+    """
+    if not sm.timetrials_only:
+        horizon = 10
+        for obs in sm.obstacles_prediction:
+            gap = (obs.s_start - sm.cur_s) % sm.track_length
+            if gap < horizon:
+                return False
+    return True
+
+
+def legacy_check_enemy_in_front(sm: StateMachine) -> bool:
+    """
+    Former `_check_enemy_in_front`.
+    """
+    if not sm.timetrials_only:
+        horizon = sm.gb_horizon_m
+        for obs in sm.obstacles:
+            gap = (obs.s_start - sm.cur_s) % sm.track_length
+            if gap < horizon:
+                return True
+        return False
+
+
+def legacy_check_emergency_break(sm: StateMachine) -> bool:
+    """
+    Former `_check_emergency_break`.
+    """
+    emergency_break = False
+    if sm.ot_planner == "predictive_spliner":
+        if not sm.timetrials_only:
+            obstacles = sm.obstacles_perception.copy()
+            if obstacles != []:
+                horizon = sm.emergency_break_horizon
+                for obs in obstacles:
+                    dist_to_obj = (obs.s_start - sm.cur_s) % sm.max_s
+                    if dist_to_obj < horizon:
+                        local_wpnt_idx = np.argmin(
+                            np.array([abs(avoid_s.s_m - obs.s_center) for avoid_s in sm.local_wpnts.wpnts])
+                        )
+                        ot_d = sm.local_wpnts.wpnts[local_wpnt_idx].d_m
+                        ot_obs_dist = ot_d - obs.d_center
+                        if abs(ot_obs_dist) < sm.emergency_break_d:
+                            emergency_break = True
+                            rospy.logwarn("[State Machine] emergency break")
+        return emergency_break
+
+
+LEGACY_CONDITIONS: Dict[str, Callable[[StateMachine], bool]] = {
+    "_check_ofree": legacy_check_ofree,
+    "_check_gbfree": legacy_check_gbfree,
+    "_check_prediction_gbfree": legacy_check_prediction_gbfree,
+    "_check_enemy_in_front": legacy_check_enemy_in_front,
+    "_check_emergency_break": legacy_check_emergency_break,
+}
+
+
+class LegacyStateMachine(StateMachine):
+    """
+    `StateMachine` with the former conditions and without the tick context.
+    """
+
+    def update_tick_context(self):
+        pass
+
+    def _check_ofree(self) -> bool:
+        return legacy_check_ofree(self)
+
+    def _check_gbfree(self) -> bool:
+        return legacy_check_gbfree(self)
+
+    def _check_prediction_gbfree(self) -> bool:
+        return legacy_check_prediction_gbfree(self)
+
+    def _check_enemy_in_front(self) -> bool:
+        return legacy_check_enemy_in_front(self)
+
+    def _check_emergency_break(self) -> bool:
+        return legacy_check_emergency_break(self)
+
+
+def load_global_waypoints(stack_master: str, map_name: str) -> WpntArray:
+    with open(f"{stack_master}/maps/{map_name}/global_waypoints.json") as f:
+        wpnts = json.load(f)["global_traj_wpnts_iqp"]["wpnts"]
+    return WpntArray(wpnts=[Wpnt(**wpnt) for wpnt in wpnts])
+
+
+def make_obstacle(s: float, d: float, track_length: float, is_static: bool, size: float = 0.5) -> Obstacle:
+    s = s % track_length
+    return Obstacle(
+        s_start=(s - size / 2) % track_length,
+        s_end=(s + size / 2) % track_length,
+        s_center=s,
+        d_center=d,
+        d_left=d + size / 2,
+        d_right=d - size / 2,
+        size=size,
+        is_static=is_static,
+        is_visible=True,
+    )
+
+
+def make_sequence(glb_wpnts: WpntArray, n_obstacles: int, duration: float, rate_hz: float, rng: np.random.Generator):
+    """
+    Synthetic inputs of every tick: the ego drives at 6 m/s and catches up with an opponent driving at 4 m/s on the
+    raceline. The avoidance line passes the opponent on its left between 5 m behind and 5 m in front of it and the ego
+    follows it. The remaining obstacles are static and scattered around the track within 1 m of the raceline.
+
+    Returns:
+        ticks (List): (pose, perception, prediction, avoidance) of every tick, the avoidance is None while the opponent
+            is out of reach
+    """
+    track_length = glb_wpnts.wpnts[-1].s_m
+    wpnt_dist = glb_wpnts.wpnts[1].s_m - glb_wpnts.wpnts[0].s_m
+    n_static = max(n_obstacles - 1, 0)
+    static = [
+        make_obstacle(s, d, track_length, is_static=True)
+        for s, d in zip(rng.uniform(0, track_length, n_static), rng.uniform(-1, 1, n_static))
+    ]
+    ego_s, ego_vs = 0.0, 6.0
+    opp_s, opp_vs = 15.0, 4.0
+    ot_d = 0.6
+    dt = 1 / rate_hz
+    ticks = []
+    for i in range(int(duration * rate_hz)):
+        gap = (opp_s - ego_s) % track_length
+        opponent = make_obstacle(opp_s, 0.05 * np.sin(0.5 * i * dt), track_length, is_static=False)
+        perception = ([opponent] if n_obstacles > 0 else []) + static
+        prediction = [opponent] if n_obstacles > 0 and gap < 12 else []
+
+        avoidance = None
+        ego_d = 0.0
+        if n_obstacles > 0 and (gap < 10 or gap > track_length - 6):
+            avoidance = OTWpntArray(ot_side="left", ot_line="left")
+            avoidance.header.stamp = rospy.Time.from_sec(10 + i * dt)
+            avoidance.last_switch_time = rospy.Time.from_sec(0)
+            s_line = opp_s + np.arange(-5, 5, wpnt_dist)
+            d_line = ot_d * np.sin(np.pi * (s_line - opp_s + 5) / 10)
+            avoidance.wpnts = [Wpnt(s_m=s % track_length, d_m=d) for s, d in zip(s_line, d_line)]
+            ego_d = float(np.interp((ego_s - opp_s + 5) % track_length, s_line - opp_s + 5, d_line, left=0, right=0))
+
+        ticks.append(((ego_s, ego_d, ego_vs), perception, prediction, avoidance))
+        ego_s = (ego_s + ego_vs * dt) % track_length
+        opp_s = (opp_s + opp_vs * dt) % track_length
+    return ticks
+
+
+def replay(sim: StateMachineSim, glb_wpnts: WpntArray, ticks: List, on_tick: Callable = None):
+    sim.set_global_waypoints(glb_wpnts)
+    for pose, perception, prediction, avoidance in ticks:
+        sim.set_pose(*pose)
+        sim.set_obstacles(perception, prediction)
+        if avoidance is not None:
+            sim.set_avoidance(avoidance)
+        sim.tick()
+        if on_tick is not None:
+            on_tick(sim.state_machine)
+
+
+def check(params: Dict, glb_wpnts: WpntArray, n_obstacles: int, duration: float, seed: int) -> bool:
+    ticks = make_sequence(glb_wpnts, n_obstacles, duration, params["state_machine/rate"], np.random.default_rng(seed))
+
+    mismatches = {name: 0 for name in LEGACY_CONDITIONS}
+
+    def compare_conditions(sm: StateMachine):
+        for name, legacy in LEGACY_CONDITIONS.items():
+            if getattr(sm, name)() != legacy(sm):
+                mismatches[name] += 1
+
+    new = StateMachineSim(params)
+    replay(new, glb_wpnts, ticks, compare_conditions)
+    legacy = StateMachineSim(params, state_machine_cls=LegacyStateMachine)
+    replay(legacy, glb_wpnts, ticks)
+
+    state_mismatches = sum(a != b for a, b in zip(new.states, legacy.states))
+    lat_new = 1e3 * np.array(new.latencies)
+    lat_old = 1e3 * np.array(legacy.latencies)
+    visited = sorted(set(new.states))
+    print(
+        f"  {n_obstacles:4d} obstacles: latency p50/p99 [ms] former {np.median(lat_old):.3f}/"
+        f"{np.percentile(lat_old, 99):.3f}, current {np.median(lat_new):.3f}/{np.percentile(lat_new, 99):.3f}, "
+        f"states {visited}, state mismatches {state_mismatches}/{len(new.states)}, condition mismatches {mismatches}"
+    )
+    return state_mismatches == 0 and not any(mismatches.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the state machine conditions against the former ones.")
+    parser.add_argument("--map", type=str, default="JFR_racingv5", help="Map providing the raceline and sectors")
+    parser.add_argument(
+        "--ot_planner", type=str, nargs="*", default=["spliner", "predictive_spliner"], help="Overtaking planners"
+    )
+    parser.add_argument(
+        "--n_obstacles", type=int, nargs="*", default=[0, 1, 5, 20, 50], help="Numbers of obstacles to replay"
+    )
+    parser.add_argument("--duration", type=float, default=20.0, help="Replayed duration in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the static obstacles")
+    args = parser.parse_args()
+
+    stack_master = rospkg.RosPack().get_path("stack_master")
+    glb_wpnts = load_global_waypoints(stack_master, args.map)
+    failed = []
+    for ot_planner in args.ot_planner:
+        print(ot_planner)
+        params = load_params(args.map, {"ot_planner": ot_planner})
+        for i in range(params["/ot_map_params"]["n_sectors"]):
+            params["/ot_map_params"][f"Overtaking_sector{i}"]["ot_flag"] = True
+        for n_obstacles in args.n_obstacles:
+            if not check(params, glb_wpnts, n_obstacles, args.duration, args.seed):
+                failed.append((ot_planner, n_obstacles))
+    if failed:
+        print(f"FAILED: {failed}")
+        sys.exit(1)
+    print("all sequences passed")
@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 import threading
 import time
+from typing import Dict
 
 import numpy as np
 import rospy
 import tf
 from dynamic_reconfigure.msg import Config
-from f110_msgs.msg import ObstacleArray, OTWpntArray, WpntArray, Wpnt
+from f110_msgs.msg import ObstacleArray, OTWpntArray, WpntArray, WpntStartIdx, Wpnt
 from geometry_msgs.msg import PoseStamped
 from nav_msgs.msg import Odometry
 from scipy.interpolate import InterpolatedUnivariateSpline as Spline
@@ -22,6 +23,32 @@ except:
 import state_transitions
 import states
 from states_types import StateType
+from tick_context import TickContext
+from wpnt_overlay import WpntOverlay
+
+
+class _NullPublisher:
+    """Stand-in for rospy.Publisher in offline mode"""
+
+    def publish(self, *args, **kwargs):
+        pass
+
+    def get_num_connections(self) -> int:
+        return 0
+
+
+def _dict_param_getter(params: Dict):
+    """Returns a function with the signature of rospy.get_param which looks up `params` instead of the parameter server"""
+    unspecified = object()
+
+    def get_param(param_name: str, default=unspecified):
+        if param_name in params:
+            return params[param_name]
+        if default is unspecified:
+            raise KeyError(f"Parameter {param_name} is not set")
+        return default
+
+    return get_param
 
 
 class StateMachine:
@@ -30,35 +57,62 @@ class StateMachine:
     State transistions and state behaviors are described in `state_transistions.py` and `states.py`
     """
 
-    def __init__(self, name) -> None:
+    def __init__(self, name, offline: bool = False, params: Dict = None) -> None:
+        """
+        Args:
+            name: name of the node
+            offline: if True, no ROS master is needed. Parameters are looked up in `params` by their ROS name,
+                nothing is subscribed or published and the loop is not started. Inputs are fed through the callbacks
+                by the caller, see `state_machine_sim.py`.
+            params: parameters used in offline mode
+        """
         self.name = name
-        self.rate_hz = rospy.get_param("state_machine/rate")  # rate of planner in hertz
-        self.n_loc_wpnts = rospy.get_param("state_machine/n_loc_wpnts")  # number of local waypoints published
+        self.offline = offline
+        if offline:
+            rospy.rostime.switch_to_wallclock()
+            get_param = _dict_param_getter(params or {})
+        else:
+            get_param = rospy.get_param
+        self.rate_hz = get_param("state_machine/rate")  # rate of planner in hertz
+        self.n_loc_wpnts = get_param("state_machine/n_loc_wpnts")  # number of local waypoints published
+        # optional lookahead window replacing n_loc_wpnts, in meters and/or seconds at the current speed
+        self.loc_horizon_m = get_param("state_machine/loc_horizon_m", 0.0)
+        self.loc_horizon_sec = get_param("state_machine/loc_horizon_sec", 0.0)
+        self.loc_marker_step = max(1, int(get_param("state_machine/loc_marker_step", 5)))  # publish every n-th marker
+        self.n_horizon_wpnts = self.n_loc_wpnts  # number of local waypoints of the current tick
+        self.loc_start_idx = -1  # global index of the first local waypoint, set by the states, -1 if not global
         self.local_wpnts = WpntArray()
         self.waypoints_dist = 0.1  # [m]
-        self.lock = threading.Lock()  # lock for concurrency on waypoints
-        self.measuring = rospy.get_param("/measure", default=False)
+        # Callbacks only write into `inputs`, replacing whole entries by reference. The loop takes one snapshot of it
+        # per tick, such that all conditions and states of a tick see the inputs of the same moment.
+        self.inputs = {"obstacles": ([], [], [])}
+        self.obstacles_lock = threading.Lock()  # serializes the two obstacle callbacks, never taken by the loop
+        self._applied_avoidance = None
+        self._applied_ot_wpnts = None
+        self._applied_dyn_params = None
+        self._applied_ot_sectors = None
+        self.measuring = get_param("/measure", default=False)
 
 
         # get initial dynamic parameters
-        self.racecar_version = rospy.get_param("/racecar_version")
-        self.sectors_params = rospy.get_param("/map_params")
-        self.timetrials_only = bool(rospy.get_param("state_machine/timetrials_only", "True"))
+        self.racecar_version = get_param("/racecar_version")
+        self.sectors_params = get_param("/map_params")
+        self.timetrials_only = bool(get_param("state_machine/timetrials_only", "True"))
         self.n_sectors = self.sectors_params["n_sectors"]
         # only ftg zones
         self.only_ftg_zones = []
         self.ftg_counter = 0
         # overtaking variables
-        self.ot_sectors_params = rospy.get_param("/ot_map_params")
+        self.ot_sectors_params = get_param("/ot_map_params")
         self.n_ot_sectors = self.ot_sectors_params["n_sectors"]
         self.overtake_wpnts = None
         self.overtake_zones = []
         self.ot_begin_margin = 0.5
         self.cur_volt = 11.69  # default value for sim
-        self.volt_threshold = rospy.get_param("state_machine/volt_threshold", default=10)
+        self.volt_threshold = get_param("state_machine/volt_threshold", default=10)
 
         # Planner parameters
-        self.ot_planner = rospy.get_param("state_machine/ot_planner", default="spliner")
+        self.ot_planner = get_param("state_machine/ot_planner", default="spliner")
 
         # waypoint variables
         self.cur_id_ot = 1
@@ -71,9 +125,9 @@ class StateMachine:
         self.num_glb_wpnts = 0  # number of waypoints on global trajectory
         self.num_ot_points = 0
         self.previous_index = 0
-        self.gb_ego_width_m = rospy.get_param("state_machine/gb_ego_width_m")
-        self.lateral_width_gb_m = rospy.get_param("state_machine/lateral_width_gb_m", 0.75)  # [m] DYNIAMIC PARAMETER
-        self.gb_horizon_m = rospy.get_param("state_machine/gb_horizon_m")
+        self.gb_ego_width_m = get_param("state_machine/gb_ego_width_m")
+        self.lateral_width_gb_m = get_param("state_machine/lateral_width_gb_m", 0.75)  # [m] DYNIAMIC PARAMETER
+        self.gb_horizon_m = get_param("state_machine/gb_horizon_m")
 
         # mincurv spline
         self.mincurv_spline_x = None
@@ -92,15 +146,16 @@ class StateMachine:
         self.side_by_side_threshold = 0.6
         self.merger = None
         self.force_trailing = False
+        self.ctx = None  # per-tick array view of the inputs of the conditions, built in the loop
 
         # spliner variables
-        self.splini_ttl = rospy.get_param("state_machine/splini_ttl", 2.0) if self.ot_planner == "spliner" else rospy.get_param("state_machine/pred_splini_ttl", 0.2)
+        self.splini_ttl = get_param("state_machine/splini_ttl", 2.0) if self.ot_planner == "spliner" else get_param("state_machine/pred_splini_ttl", 0.2)
         self.splini_ttl_counter = int(self.splini_ttl * self.rate_hz)  # convert seconds to counters
         self.avoidance_wpnts = None
         self.last_valid_avoidance_wpnts = None
-        self.overtaking_horizon_m = rospy.get_param("state_machine/overtaking_horizon_m", 6.9)
-        self.lateral_width_ot_m = rospy.get_param("state_machine/lateral_width_ot_m", 0.3)  # [m] DYNIAMIC PARAMETER
-        self.splini_hyst_timer_sec = rospy.get_param("state_machine/splini_hyst_timer_sec", 0.75)
+        self.overtaking_horizon_m = get_param("state_machine/overtaking_horizon_m", 6.9)
+        self.lateral_width_ot_m = get_param("state_machine/lateral_width_ot_m", 0.3)  # [m] DYNIAMIC PARAMETER
+        self.splini_hyst_timer_sec = get_param("state_machine/splini_hyst_timer_sec", 0.75)
         self.emergency_break_horizon = 1.1  # [m]
         self.emergency_break_d = 0.12  # [m]
         
@@ -112,8 +167,8 @@ class StateMachine:
         self.frenet_wpnts = WpntArray()
 
         # FTG params
-        self.ftg_speed_mps = rospy.get_param("state_machine/ftg_speed_mps", 1.0) # [mps] DYNIAMIC PARAMETER
-        self.ftg_timer_sec = rospy.get_param("state_machine/ftg_timer_sec", 3.0) # [s] DYNIAMIC PARAMETER
+        self.ftg_speed_mps = get_param("state_machine/ftg_speed_mps", 1.0) # [mps] DYNIAMIC PARAMETER
+        self.ftg_timer_sec = get_param("state_machine/ftg_timer_sec", 3.0) # [s] DYNIAMIC PARAMETER
         self.ftg_disabled = True
 
         # Force GBTRACK state
@@ -176,6 +231,13 @@ class StateMachine:
             StateType.FTGONLY: states.FTGOnly,
         }
 
+        if offline:
+            self.track_length = get_param("/global_republisher/track_length")
+            self.loc_wpnt_pub = self.loc_start_idx_pub = self.vis_loc_wpnt_pub = _NullPublisher()
+            self.state_pub = self.state_mrk = self.emergency_pub = self.ot_section_check_pub = _NullPublisher()
+            self.latency_pub = _NullPublisher()
+            return
+
         # SUBSCRIPTIONS
         rospy.Subscriber("/car_state/pose", PoseStamped, self.pose_cb)
         rospy.wait_for_message("/car_state/pose", PoseStamped)
@@ -204,14 +266,15 @@ class StateMachine:
             rospy.Subscriber("/planner/graph_based_wpnts", Float32MultiArray, self.graphbased_wpts_cb)
         elif self.ot_planner == "frenet":
             rospy.Subscriber("/planner/waypoints", WpntArray, self.frenet_planner_cb)
-        if not rospy.get_param("/sim"):
+        if not get_param("/sim"):
             rospy.Subscriber("/vesc/sensors/core", VescStateStamped, self.vesc_state_cb) # for reading battery voltage
 
         # Parameters
-        self.track_length = rospy.get_param("/global_republisher/track_length")
+        self.track_length = get_param("/global_republisher/track_length")
 
         # PUBLICATIONS
         self.loc_wpnt_pub = rospy.Publisher("local_waypoints", WpntArray, queue_size=1)
+        self.loc_start_idx_pub = rospy.Publisher("local_waypoints/start_idx", WpntStartIdx, queue_size=1)
         self.vis_loc_wpnt_pub = rospy.Publisher("local_waypoints/markers", MarkerArray, queue_size=10)
         self.state_pub = rospy.Publisher("state_machine", String, queue_size=1)
         self.state_mrk = rospy.Publisher("/state_marker", Marker, queue_size=10)
@@ -231,45 +294,34 @@ class StateMachine:
     #############
     def vesc_state_cb(self, data):
         """vesc state callback, reads the voltage"""
-        self.cur_volt = data.state.voltage_input
+        self.inputs["volt"] = data.state.voltage_input
         
     def frenet_planner_cb(self, data: WpntArray):
         """frenet planner waypoints"""
-        self.frenet_wpnts = data
+        self.inputs["frenet_wpnts"] = data
 
     def avoidance_cb(self, data: OTWpntArray):
-        """spliniboi waypoints"""
+        """spliniboi waypoints, the ttl counter is reset by the loop when it takes the new message"""
         if len(data.wpnts) > 0:
-            self.splini_ttl_counter = int(self.splini_ttl * self.rate_hz)
-            self.avoidance_wpnts = data
+            self.inputs["avoidance"] = data
 
         # Otherwise we don't overwrite the avoidance waypoints
         else:
             pass
 
     def frenet_pose_cb(self, data: Odometry):
-        self.cur_s = data.pose.pose.position.x
-        self.cur_d = data.pose.pose.position.y
-        self.cur_vs = data.twist.twist.linear.x
-        if self.num_ot_points != 0:
-            self.cur_id_ot = int(self._find_nearest_ot_s())
+        self.inputs["pose"] = (data.pose.pose.position.x, data.pose.pose.position.y, data.twist.twist.linear.x)
 
     def overtake_cb(self, data):
         """
-        Callback function of overtake subscriber.
+        Callback function of overtake subscriber, the OT spline is computed by the loop when it takes the new message.
 
         Parameters
         ----------
         data
             Data received from overtake topic
         """
-        self.overtake_wpnts = data.wpnts
-        self.num_ot_points = len(self.overtake_wpnts)
-
-        # compute the OT spline when new spline
-        if self.recompute_ot_spline and self.num_ot_points != 0:
-            self.ot_splinification()
-            self.recompute_ot_spline = False
+        self.inputs["ot_wpnts"] = data.wpnts
 
     def glb_wpnts_cb(self, data: WpntArray):
         """
@@ -280,17 +332,18 @@ class StateMachine:
         data
             Data received from velocity interpolator topic
         """
-        self.glb_wpnts = data.wpnts[:-1]  # exclude last point (because last point == first point)
-        self.num_glb_wpnts = len(self.glb_wpnts)
-        self.max_s = data.wpnts[-1].s_m
+        glb_wpnts = data.wpnts[:-1]  # exclude last point (because last point == first point)
         # Get spacing between wpnts for rough approximations
-        self.wpnt_dist = data.wpnts[1].s_m - data.wpnts[0].s_m
-        self.gb_max_idx = data.wpnts[-1].id
+        wpnt_dist = data.wpnts[1].s_m - data.wpnts[0].s_m
+        gb_wpnts_arr = None
         if self.ot_planner == "graph_based":
-            self.gb_wpnts_arr = np.array([
+            gb_wpnts_arr = np.array([
                 [w.s_m, w.d_m, w.x_m, w.y_m, w.d_right, w.d_left, w.psi_rad,
                 w.kappa_radpm, w.vx_mps, w.ax_mps2] for w in data.wpnts
             ])
+        self.inputs["glb_wpnts"] = (
+            glb_wpnts, len(glb_wpnts), data.wpnts[-1].s_m, wpnt_dist, data.wpnts[-1].id, gb_wpnts_arr
+        )
 
     def glb_wpnts_og_cb(self, data):
         """
@@ -301,31 +354,36 @@ class StateMachine:
         data
             Data received from velocity interpolator topic
         """
-        if self.max_speed == -1:
-            self.max_speed = max([wpnt.vx_mps for wpnt in data.wpnts])
+        if "max_speed" not in self.inputs:
+            self.inputs["max_speed"] = max([wpnt.vx_mps for wpnt in data.wpnts])
         else:
             pass
     
     def graphbased_wpts_cb(self, data):
         arr = np.asarray(data.data)
-        self.graph_based_wpts = arr.reshape(data.layout.dim[0].size, data.layout.dim[1].size)
-        self.graph_based_action = data.layout.dim[0].label
+        self.inputs["graph_based"] = (
+            arr.reshape(data.layout.dim[0].size, data.layout.dim[1].size), data.layout.dim[0].label
+        )
     
     def obstacle_perception_cb(self, data):
-        if len(data.obstacles) != 0:
-            self.obstacles_perception = data.obstacles
-            self.obstacles = data.obstacles
-            self.obstacles = self.obstacles + self.obstacles_prediction
-        else:
-            self.obstacles = []
+        with self.obstacles_lock:
+            obstacles, obstacles_perception, obstacles_prediction = self.inputs["obstacles"]
+            if len(data.obstacles) != 0:
+                obstacles_perception = data.obstacles
+                obstacles = data.obstacles + obstacles_prediction
+            else:
+                obstacles = []
+            self.inputs["obstacles"] = (obstacles, obstacles_perception, obstacles_prediction)
 
     def obstacle_prediction_cb(self, data):
-        if len(data.obstacles) != 0:
-            self.obstacles_prediction = data.obstacles
-            self.obstacles = data.obstacles
-            self.obstacles = self.obstacles + self.obstacles_perception
-        else:
-            self.obstacles_prediction = []
+        with self.obstacles_lock:
+            obstacles, obstacles_perception, obstacles_prediction = self.inputs["obstacles"]
+            if len(data.obstacles) != 0:
+                obstacles_prediction = data.obstacles
+                obstacles = data.obstacles + obstacles_perception
+            else:
+                obstacles_prediction = []
+            self.inputs["obstacles"] = (obstacles, obstacles_perception, obstacles_prediction)
 
     def pose_cb(self, data):
         """
@@ -342,25 +400,27 @@ class StateMachine:
             [data.pose.orientation.x, data.pose.orientation.y, data.pose.orientation.z, data.pose.orientation.w]
         )[2]
 
-        self.current_position = [x, y, theta]
+        self.inputs["position"] = [x, y, theta]
 
     def dyn_param_cb(self, params: Config):
         """
-        Notices the change in the State Machine parameters and sets
+        Notices the change in the State Machine parameters, they and the reset of the splini ttl counter are applied
+        by the loop when it takes the new parameters
         """
-        self.lateral_width_gb_m = rospy.get_param("dynamic_statemachine_server/lateral_width_gb_m", 0.75)
-        self.lateral_width_ot_m = rospy.get_param("dynamic_statemachine_server/lateral_width_ot_m", 0.3)
-        self.splini_ttl = rospy.get_param("dynamic_statemachine_server/splini_ttl") if self.ot_planner == "spliner" else rospy.get_param("dynamic_statemachine_server/pred_splini_ttl")
-        self.splini_ttl_counter = int(self.splini_ttl * self.rate_hz)  # convert seconds to counter
-        self.splini_hyst_timer_sec = rospy.get_param("dynamic_statemachine_server/splini_hyst_timer_sec", 0.75)
-        self.emergency_break_horizon = rospy.get_param("dynamic_statemachine_server/emergency_break_horizon", 1.1)
-        self.ftg_speed_mps = rospy.get_param("dynamic_statemachine_server/ftg_speed_mps", 1.0)
-        self.ftg_timer_sec = rospy.get_param("dynamic_statemachine_server/ftg_timer_sec", 3.0)
-
-        self.ftg_disabled = not rospy.get_param("dynamic_statemachine_server/ftg_active", False)
-        self.force_gbtrack_state = rospy.get_param("dynamic_statemachine_server/force_GBTRACK", False)
-
-        if self.force_gbtrack_state:
+        dyn_params = {
+            "lateral_width_gb_m": rospy.get_param("dynamic_statemachine_server/lateral_width_gb_m", 0.75),
+            "lateral_width_ot_m": rospy.get_param("dynamic_statemachine_server/lateral_width_ot_m", 0.3),
+            "splini_ttl": rospy.get_param("dynamic_statemachine_server/splini_ttl") if self.ot_planner == "spliner" else rospy.get_param("dynamic_statemachine_server/pred_splini_ttl"),
+            "splini_hyst_timer_sec": rospy.get_param("dynamic_statemachine_server/splini_hyst_timer_sec", 0.75),
+            "emergency_break_horizon": rospy.get_param("dynamic_statemachine_server/emergency_break_horizon", 1.1),
+            "ftg_speed_mps": rospy.get_param("dynamic_statemachine_server/ftg_speed_mps", 1.0),
+            "ftg_timer_sec": rospy.get_param("dynamic_statemachine_server/ftg_timer_sec", 3.0),
+            "ftg_disabled": not rospy.get_param("dynamic_statemachine_server/ftg_active", False),
+            "force_gbtrack_state": rospy.get_param("dynamic_statemachine_server/force_GBTRACK", False),
+        }
+        self.inputs["dyn_params"] = dyn_params
+
+        if dyn_params["force_gbtrack_state"]:
             rospy.logwarn(f"[{self.name}] GBTRACK state force activated!!!")
 
         rospy.logdebug(
@@ -368,43 +428,40 @@ class StateMachine:
             "lateral_width_ot_m: {}, splini_ttl: {}, splini_hyst_timer_sec: {}, ftg_speed_mps: {}, "
             "ftg_timer_sec: {}, GBTRACK_force: {}".format(
                 self.name,
-                self.lateral_width_gb_m,
-                self.lateral_width_ot_m,
-                self.splini_ttl,
-                self.splini_hyst_timer_sec,
-                self.ftg_speed_mps,
-                self.ftg_timer_sec,
-                self.force_gbtrack_state
+                dyn_params["lateral_width_gb_m"],
+                dyn_params["lateral_width_ot_m"],
+                dyn_params["splini_ttl"],
+                dyn_params["splini_hyst_timer_sec"],
+                dyn_params["ftg_speed_mps"],
+                dyn_params["ftg_timer_sec"],
+                dyn_params["force_gbtrack_state"]
             )
         )
 
     def sector_dyn_param_cb(self, params: Config):
         """
-        Notices the change in the parameters and sets no/only ftg zones
+        Notices the change in the parameters and sets no/only ftg zones, applied by the loop with the next snapshot
         """
-        # reset ftg zones
-        self.only_ftg_zones = []
-        # update ftg zones
+        only_ftg_zones = []
         for i in range(self.n_sectors):
             self.sectors_params[f"Sector{i}"]["only_FTG"] = params.bools[2 * i].value
             if self.sectors_params[f"Sector{i}"]["only_FTG"]:
-                self.only_ftg_zones.append(
+                only_ftg_zones.append(
                     [self.sectors_params[f"Sector{i}"]["start"], self.sectors_params[f"Sector{i}"]["end"]]
                 )
+        self.inputs["only_ftg_zones"] = only_ftg_zones
 
     def ot_dyn_param_cb(self, params: Config):
         """
-        Notices the change in the parameters and sets overtaking zones
+        Notices the change in the parameters and sets overtaking zones, applied by the loop with the next snapshot
         """
-        # reset overtake zones
-        self.overtake_zones = []
-        # update overtake zones
+        overtake_zones = []
         try:
             for i in range(self.n_ot_sectors):
                 self.ot_sectors_params[f"Overtaking_sector{i}"]["ot_flag"] = params.bools[i].value
                 # add start and end index of the sector
                 if self.ot_sectors_params[f"Overtaking_sector{i}"]["ot_flag"]:
-                    self.overtake_zones.append(
+                    overtake_zones.append(
                         [
                             self.ot_sectors_params[f"Overtaking_sector{i}"]["start"],
                             self.ot_sectors_params[f"Overtaking_sector{i}"]["end"],
@@ -413,16 +470,16 @@ class StateMachine:
         except IndexError as e:
             raise IndexError(f"[State Machine] Error in overtaking sector numbers. \nTry switching map with the script in stack_master/scripts and re-source in every terminal. \nError thrown: {e}")
 
-        self.ot_begin_margin = params.doubles[2].value  # Choose the dyn ot param value
-        rospy.logwarn(f"[{self.name}] Using OT beginning { self.ot_begin_margin}[m] from param: {params.doubles[2].name}"        )
-        # Spline new OT if they exist already
-        self.recompute_ot_spline = True
+        ot_begin_margin = params.doubles[2].value  # Choose the dyn ot param value
+        rospy.logwarn(f"[{self.name}] Using OT beginning {ot_begin_margin}[m] from param: {params.doubles[2].name}")
+        # the OT spline is recomputed with the next overtaking waypoints once the loop applied the new sectors
+        self.inputs["ot_sectors"] = (overtake_zones, ot_begin_margin)
 
     def merger_cb(self, data):
-        self.merger = data.data
+        self.inputs["merger"] = data.data
 
     def force_trailing_cb(self, data):
-        self.force_trailing = data.data
+        self.inputs["force_trailing"] = data.data
 
     ######################################
     # ATTRIBUTES/CONDITIONS CALCULATIONS #
@@ -463,24 +520,17 @@ class StateMachine:
             if not self.timetrials_only and self.last_valid_avoidance_wpnts is not None:
                 horizon = self.overtaking_horizon_m  # Horizon in front of cur_s [m]
 
-                # Use frenet conversion service to convert (s, d) wrt min curv trajectory to (x, y) in map
-                for obs in self.obstacles:
-                    if self.ot_planner == "spliner" or (self.ot_planner == "predictive_spliner" and obs.is_static == True):
-                        obs_s = obs.s_center
-                        # Wrapping madness to check if infront
-                        dist_to_obj = (obs_s - self.cur_s) % self.max_s
-                        if dist_to_obj < horizon and len(self.last_valid_avoidance_wpnts):
-                            obs_d = obs.d_center
-                            # Get d wrt to mincurv from the overtaking line
-                            avoid_wpnt_idx = np.argmin(
-                                np.array([abs(avoid_s.s_m - obs_s) for avoid_s in self.last_valid_avoidance_wpnts])
-                            )
-                            ot_d = self.last_valid_avoidance_wpnts[avoid_wpnt_idx].d_m
-                            ot_obs_dist = ot_d - obs_d
-                            if abs(ot_obs_dist) < self.lateral_width_ot_m:
-                                o_free = False
-                                rospy.loginfo("[State Machine] O_FREE False, obs dist to ot lane: {} m".format(ot_obs_dist))
-                                break
+                obstacles = self.ctx.obstacles
+                # Wrapping madness to check if infront
+                in_horizon = obstacles.gap_center_max_s < horizon
+                if self.ot_planner == "predictive_spliner":
+                    in_horizon &= obstacles.is_static
+                ot_obs_dist = self._first_obs_on_line(
+                    "avoidance", self.last_valid_avoidance_wpnts, obstacles, in_horizon, self.lateral_width_ot_m
+                )
+                if ot_obs_dist is not None:
+                    o_free = False
+                    rospy.loginfo("[State Machine] O_FREE False, obs dist to ot lane: {} m".format(ot_obs_dist))
             else:
                 o_free = True
             return o_free
@@ -490,23 +540,15 @@ class StateMachine:
             if not self.timetrials_only and self.overtake_wpnts is not None:
                 horizon = self.overtaking_horizon_m  # Horizon in front of cur_s [m]
 
-                # Use frenet conversion service to convert (s, d) wrt min curv trajectory to (x, y) in map
-                for obs in self.obstacles:
-                    obs_s = obs.s_center
-                    # Wrapping madness to check if infront
-                    dist_to_obj = (obs_s - self.cur_s) % self.max_s
-                    if dist_to_obj < horizon and len(self.frenet_wpnts.wpnts):
-                        obs_d = obs.d_center
-                        # Get d wrt to mincurv from the overtaking line
-                        avoid_wpnt_idx = np.argmin(
-                            np.array([abs(avoid_s.s_m - obs_s) for avoid_s in self.frenet_wpnts.wpnts])
-                        )
-                        ot_d = self.frenet_wpnts.wpnts[avoid_wpnt_idx].d_m
-                        ot_obs_dist = ot_d - obs_d
-                        if abs(ot_obs_dist) < self.lateral_width_ot_m:
-                            o_free = False
-                            rospy.loginfo("[State Machine] O_FREE False, obs dist to ot lane: {} m".format(ot_obs_dist))
-                            break
+                obstacles = self.ctx.obstacles
+                # Wrapping madness to check if infront
+                in_horizon = obstacles.gap_center_max_s < horizon
+                ot_obs_dist = self._first_obs_on_line(
+                    "frenet", self.frenet_wpnts.wpnts, obstacles, in_horizon, self.lateral_width_ot_m
+                )
+                if ot_obs_dist is not None:
+                    o_free = False
+                    rospy.loginfo("[State Machine] O_FREE False, obs dist to ot lane: {} m".format(ot_obs_dist))
             else:
                 o_free = True
             return o_free
@@ -521,17 +563,16 @@ class StateMachine:
         if not self.timetrials_only:
             horizon = self.gb_horizon_m  # Horizon in front of cur_s [m]
 
-            for obs in self.obstacles:
-                obs_s = (obs.s_start + obs.s_end) / 2
-                obs_s = obs.s_center
-                gap = (obs_s - self.cur_s) % self.track_length
-                if gap < horizon:
-                    obs_d = obs.d_center
-                    # Get d wrt to mincurv from the overtaking line
-                    if abs(obs_d) < self.lateral_width_gb_m:
-                        gb_free = False
-                        rospy.loginfo(f"[{self.name}] GB_FREE False, obs dist to ot lane: {obs_d} m")
-                        break
+            obstacles = self.ctx.obstacles
+            if obstacles.n > 0:
+                blocking = (
+                    (obstacles.gap_center < horizon) & (np.abs(obstacles.d_center) < self.lateral_width_gb_m)
+                ).nonzero()[0]
+                if blocking.size > 0:
+                    gb_free = False
+                    rospy.loginfo(
+                        f"[{self.name}] GB_FREE False, obs dist to ot lane: {obstacles.d_center[blocking[0]]} m"
+                    )
         else:
             gb_free = True
 
@@ -541,12 +582,9 @@ class StateMachine:
         if not self.timetrials_only:
             horizon = 10  # Horizon in front of cur_s [m]
 
-            # Use frenet conversion service to convert (s, d) wrt min curv trajectory to (x, y) in map
-            for obs in self.obstacles_prediction:
-                obs_s = obs.s_start
-                gap = (obs_s - self.cur_s) % self.track_length
-                if gap < horizon:
-                    return False
+            prediction = self.ctx.prediction
+            if prediction.n > 0 and (prediction.gap_start < horizon).any():
+                return False
         return True
 
     def _check_availability_graph_wpts(self) -> bool:
@@ -561,11 +599,8 @@ class StateMachine:
         # If we are in time trial only mode -> return free overtake i.e. GB_FREE True
         if not self.timetrials_only:
             horizon = self.gb_horizon_m  # Horizon in front of cur_s [m]
-            for obs in self.obstacles:
-                gap = (obs.s_start - self.cur_s) % self.track_length
-                if gap < horizon:
-                    return True
-            return False
+            obstacles = self.ctx.obstacles
+            return obstacles.n > 0 and bool((obstacles.gap_start < horizon).any())
 
     def _check_availability_splini_wpts(self) -> bool:
         if self.avoidance_wpnts is None:
@@ -605,26 +640,19 @@ class StateMachine:
         emergency_break = False
         if self.ot_planner == "predictive_spliner":
             if not self.timetrials_only:
-                obstacles = self.obstacles_perception.copy()
-                if obstacles != []:
+                obstacles = self.ctx.perception
+                if obstacles.n > 0:
                     horizon = self.emergency_break_horizon # Horizon in front of cur_s [m]
 
-                    for obs in obstacles:
-                        # Only use opponent for emergency break
-                        # Wrapping madness to check if infront
-                        dist_to_obj = (obs.s_start - self.cur_s) % self.max_s
-                        # Check if opponent is closer than emegerncy
-                        if dist_to_obj < horizon:
-                    
-                            # Get estimated d from local waypoints
-                            local_wpnt_idx = np.argmin(
-                                np.array([abs(avoid_s.s_m - obs.s_center) for avoid_s in self.local_wpnts.wpnts])
-                            )
-                            ot_d = self.local_wpnts.wpnts[local_wpnt_idx].d_m
-                            ot_obs_dist = ot_d - obs.d_center
-                            if abs(ot_obs_dist) < self.emergency_break_d:
-                                emergency_break = True
-                                rospy.logwarn("[State Machine] emergency break")
+                    # Only use opponent for emergency break
+                    # Wrapping madness to check if infront, and if opponent is closer than emegerncy
+                    in_horizon = obstacles.gap_start_max_s < horizon
+                    # Get estimated d from local waypoints
+                    if self._first_obs_on_line(
+                        "local", self.local_wpnts.wpnts, obstacles, in_horizon, self.emergency_break_d
+                    ) is not None:
+                        emergency_break = True
+                        rospy.logwarn("[State Machine] emergency break")
             else:
                 emergency_break = False
             return emergency_break
@@ -661,6 +689,104 @@ class StateMachine:
     # HELPER FUNCS #
     ################
 
+    def _n_horizon_wpnts(self) -> int:
+        """Number of local waypoints for the current tick.
+
+        Without a lookahead window `n_loc_wpnts` is used. Otherwise the window
+        is the larger of `loc_horizon_m` and the distance covered in
+        `loc_horizon_sec` at the current speed.
+        """
+        if self.loc_horizon_m <= 0 and self.loc_horizon_sec <= 0:
+            return self.n_loc_wpnts
+        horizon = max(self.loc_horizon_m, self.loc_horizon_sec * abs(self.cur_vs))  # [m]
+        return int(np.clip(np.ceil(horizon / self.waypoints_dist), 1, self.num_glb_wpnts))
+
+    def take_input_snapshot(self):
+        """Copies one consistent snapshot of the inputs written by the callbacks
+        into the attributes read by the conditions and the states.
+
+        Every entry of `inputs` is replaced as a whole by the callbacks, and
+        copying the dict is atomic under the GIL, so no lock is needed here.
+        Messages which reset state of the loop (avoidance and overtaking
+        waypoints, dynamic parameters, overtaking sectors) are applied once,
+        when they are new.
+        """
+        inputs = self.inputs.copy()
+        self.current_position = inputs.get("position", self.current_position)
+        self.max_speed = inputs.get("max_speed", self.max_speed)
+        self.only_ftg_zones = inputs.get("only_ftg_zones", self.only_ftg_zones)
+        ot_sectors = inputs.get("ot_sectors")
+        if ot_sectors is not None and ot_sectors is not self._applied_ot_sectors:
+            self._applied_ot_sectors = ot_sectors
+            self.overtake_zones, self.ot_begin_margin = ot_sectors
+            # Spline new OT if they exist already
+            self.recompute_ot_spline = True
+        dyn_params = inputs.get("dyn_params")
+        if dyn_params is not None and dyn_params is not self._applied_dyn_params:
+            self._applied_dyn_params = dyn_params
+            for param_name, value in dyn_params.items():
+                setattr(self, param_name, value)
+            self.splini_ttl_counter = int(self.splini_ttl * self.rate_hz)  # convert seconds to counter
+        self.cur_volt = inputs.get("volt", self.cur_volt)
+        ot_wpnts = inputs.get("ot_wpnts")
+        if ot_wpnts is not None and ot_wpnts is not self._applied_ot_wpnts:
+            self._applied_ot_wpnts = ot_wpnts
+            self.overtake_wpnts = ot_wpnts
+            self.num_ot_points = len(ot_wpnts)
+            # compute the OT spline when new spline
+            if self.recompute_ot_spline and self.num_ot_points != 0:
+                self.ot_splinification()
+                self.recompute_ot_spline = False
+        if "glb_wpnts" in inputs:
+            (
+                self.glb_wpnts, self.num_glb_wpnts, self.max_s, self.wpnt_dist, self.gb_max_idx, self.gb_wpnts_arr
+            ) = inputs["glb_wpnts"]
+        if "pose" in inputs:
+            self.cur_s, self.cur_d, self.cur_vs = inputs["pose"]
+            if self.num_ot_points != 0:
+                self.cur_id_ot = int(self._find_nearest_ot_s())
+        self.obstacles, self.obstacles_perception, self.obstacles_prediction = inputs["obstacles"]
+
+        avoidance = inputs.get("avoidance")
+        if avoidance is not None and avoidance is not self._applied_avoidance:
+            self._applied_avoidance = avoidance
+            self.splini_ttl_counter = int(self.splini_ttl * self.rate_hz)
+            self.avoidance_wpnts = avoidance
+        self.merger = inputs.get("merger", self.merger)
+        self.force_trailing = inputs.get("force_trailing", self.force_trailing)
+        self.frenet_wpnts = inputs.get("frenet_wpnts", self.frenet_wpnts)
+        if "graph_based" in inputs:
+            self.graph_based_wpts, self.graph_based_action = inputs["graph_based"]
+
+    def update_tick_context(self):
+        """Builds the array view of the obstacles used by the conditions of this tick."""
+        self.ctx = TickContext(
+            cur_s=self.cur_s,
+            track_length=self.track_length,
+            max_s=self.max_s,
+            obstacles=self.obstacles,
+            obstacles_perception=self.obstacles_perception,
+            obstacles_prediction=self.obstacles_prediction,
+        )
+
+    def _first_obs_on_line(self, name: str, wpnts, obstacles, considered: np.ndarray, width: float):
+        """
+        Lateral distance between the line `wpnts` and the first considered obstacle closer than `width` to it, where
+        the line's d is taken at the waypoint closest in s to the obstacle center. The line is only converted to
+        arrays (cached as `name` in the tick context) if an obstacle is considered.
+
+        Returns None if no such obstacle exists or the line is empty.
+        """
+        idx = considered.nonzero()[0]
+        if idx.size == 0 or wpnts is None or len(wpnts) == 0:
+            return None
+        line = self.ctx.line(name, wpnts)
+        line_obs_dist = line.d[line.nearest(obstacles.s_center[idx])] - obstacles.d_center[idx]
+        close = np.flatnonzero(np.abs(line_obs_dist) < width)
+        if close.size == 0:
+            return None
+        return line_obs_dist[close[0]]
+
     def mincurv_splinification(self):
         coords = np.empty((len(self.glb_wpnts), 4))
         for i, wpnt in enumerate(self.glb_wpnts):
@@ -707,40 +833,28 @@ class StateMachine:
 
         return s_ot
 
-    def get_splini_wpts(self) -> WpntArray:
+    def get_splini_wpts(self) -> WpntOverlay:
         """Obtain the waypoints by fusing those obtained by spliner with the
-        global ones.
+        global ones. The global waypoints are not copied, the returned overlay
+        only materializes the requested horizon.
         """
-        splini_glob = self.glb_wpnts.copy()
-
         # Handle wrapping
         if self.last_valid_avoidance_wpnts is not None:
+            start = int(self.last_valid_avoidance_wpnts[0].s_m / self.waypoints_dist + 0.5)
             if self.last_valid_avoidance_wpnts[-1].s_m > self.last_valid_avoidance_wpnts[0].s_m:
-                splini_idxs = [
-                    s
-                    for s in range(
-                        int(self.last_valid_avoidance_wpnts[0].s_m / self.waypoints_dist + 0.5),
-                        int(self.last_valid_avoidance_wpnts[-1].s_m / self.waypoints_dist + 0.5),
-                    )
-                ]
+                end = int(self.last_valid_avoidance_wpnts[-1].s_m / self.waypoints_dist + 0.5)
+                splini_idxs = np.arange(start, end)
             else:
-                splini_idxs = [
-                    int(s % (self.max_s / self.waypoints_dist) + 0.5)
-                    for s in range(
-                        int(self.last_valid_avoidance_wpnts[0].s_m / self.waypoints_dist + 0.5),
-                        int((self.max_s + self.last_valid_avoidance_wpnts[-1].s_m) / self.waypoints_dist + 0.5),
-                    )
-                ]
+                end = int((self.max_s + self.last_valid_avoidance_wpnts[-1].s_m) / self.waypoints_dist + 0.5)
+                splini_idxs = (np.arange(start, end) % (self.max_s / self.waypoints_dist) + 0.5).astype(int)
 
-            with self.lock:  # to avoid crash when the waypoints are updated but we're looping here
-                for i, s in enumerate(splini_idxs):
-                    # splini_glob[s] = self.last_valid_avoidance_wpnts[i]
-                    splini_glob[s] = self.last_valid_avoidance_wpnts[min(i, len(self.last_valid_avoidance_wpnts) - 1)]
+            # the global waypoints only change between ticks, see take_input_snapshot
+            splini_glob = WpntOverlay(self.glb_wpnts, self.last_valid_avoidance_wpnts, splini_idxs)
 
         # If the last valid points have been reset, then we just pass the global waypoints
         else:
             rospy.logwarn(f"[{self.name}] No valid avoidance waypoints, passing global waypoints")
-            pass
+            splini_glob = WpntOverlay(self.glb_wpnts)
 
         return splini_glob
 
@@ -749,12 +863,22 @@ class StateMachine:
     #######
 
     def _pub_local_wpnts(self, wpts: WpntArray):
-        loc_markers = MarkerArray()
         loc_wpnts = wpts
         loc_wpnts.header.stamp = rospy.Time.now()
         loc_wpnts.header.frame_id = "map"
 
-        for i, wpnt in enumerate(loc_wpnts.wpnts):
+        if len(loc_wpnts.wpnts) == 0:
+            rospy.logwarn(f"[{self.name}] No local waypoints published...")
+        else:
+            # same header as the waypoints, such that the index can be matched to its window by the stamp
+            self.loc_start_idx_pub.publish(WpntStartIdx(header=loc_wpnts.header, start_idx=self.loc_start_idx))
+            self.loc_wpnt_pub.publish(loc_wpnts)
+
+        # only build the markers if somebody is listening, and only every loc_marker_step-th waypoint
+        if self.vis_loc_wpnt_pub.get_num_connections() == 0:
+            return
+        loc_markers = MarkerArray()
+        for wpnt in loc_wpnts.wpnts[::self.loc_marker_step]:
             mrk = Marker()
             mrk.header.frame_id = "map"
             mrk.type = mrk.SPHERE
@@ -764,18 +888,13 @@ class StateMachine:
             mrk.color.a = 1.0
             mrk.color.g = 1.0
 
-            mrk.id = i
+            mrk.id = len(loc_markers.markers)
             mrk.pose.position.x = wpnt.x_m
             mrk.pose.position.y = wpnt.y_m
             mrk.pose.position.z = wpnt.vx_mps / self.max_speed  # Visualise speed in z dimension
             mrk.pose.orientation.w = 1
             loc_markers.markers.append(mrk)
 
-        if len(loc_wpnts.wpnts) == 0:
-            rospy.logwarn(f"[{self.name}] No local waypoints published...")
-        else:
-            self.loc_wpnt_pub.publish(loc_wpnts)
-
         self.vis_loc_wpnt_pub.publish(loc_markers)
 
     def get_graph_based_wpts(self) -> WpntArray:
@@ -890,6 +1009,7 @@ class StateMachine:
         """Main loop of the state machine. It is called at a fixed rate by the
         ROS node.
         """
+        self.take_input_snapshot()
 
         # safety check
         if self.cur_volt < self.volt_threshold:
@@ -901,6 +1021,7 @@ class StateMachine:
         # do state transition (unless we want to force it into GB_TRACK via dynamic reconfigure)
         if self.measuring:
             start = time.perf_counter()
+        self.update_tick_context()
         if not self.force_gbtrack_state:
             self.cur_state = self.state_transitions[self.cur_state](self)
         else:
@@ -944,6 +1065,8 @@ class StateMachine:
 
 
         # get the proper local waypoints based on the new state
+        self.n_horizon_wpnts = self._n_horizon_wpnts()
+        self.loc_start_idx = -1
         self.local_wpnts.wpnts = self.states[self.cur_state](self)
         self._pub_local_wpnts(self.local_wpnts)
 
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Headless fast-time replay of the state machine.
+
+Recorded (rosbag) or synthetic sequences of frenet pose, obstacles and avoidance waypoints are fed through the
+callbacks of an offline `StateMachine` and its `loop` is ticked on the recorded clock at `state_machine/rate`, as fast
+as the CPU allows. The output is the state sequence, the transition counts, the dwell times per state and the latency
+per tick.
+
+Usage:
+    python3 state_machine_sim.py --bag <path/to/bag> --map JFR_racingv5 --ot_planner predictive_spliner
+    python3 state_machine_sim.py --bag <path/to/bag> --map JFR_racingv5 --sweep overtaking_horizon_m=4,5,6,7
+"""
+import argparse
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple, Type
+
+import numpy as np
+import rosbag
+import rospkg
+import yaml
+from f110_msgs.msg import ObstacleArray, OTWpntArray, WpntArray
+from nav_msgs.msg import Odometry
+
+from state_machine_node import StateMachine
+
+
+def load_params(map_name: str, overrides: Dict = None) -> Dict:
+    """
+    Loads the state machine parameters as they are set by `headtohead.launch`.
+
+    Args:
+        map_name (str): map in `stack_master/maps` providing the sector parameters
+        overrides (Dict): parameters overriding the ones of `state_machine_params.yaml`, without namespace
+
+    Returns:
+        params (Dict): parameters keyed by their ROS name
+    """
+    stack_master = rospkg.RosPack().get_path("stack_master")
+    with open(f"{stack_master}/config/state_machine_params.yaml") as f:
+        sm_params = yaml.safe_load(f)
+    sm_params["timetrials_only"] = False
+    sm_params.update(overrides or {})
+    params = {f"state_machine/{key}": value for key, value in sm_params.items()}
+
+    with open(f"{stack_master}/maps/{map_name}/speed_scaling.yaml") as f:
+        params["/map_params"] = yaml.safe_load(f)
+    with open(f"{stack_master}/maps/{map_name}/ot_sectors.yaml") as f:
+        params["/ot_map_params"] = yaml.safe_load(f)
+    params["/racecar_version"] = "SIM"
+    params["/measure"] = False
+    return params
+
+
+class StateMachineSim:
+    """
+    Runs an offline `StateMachine` in fast time.
+
+    Usage with synthetic inputs:
+        sim = StateMachineSim(params)
+        sim.set_global_waypoints(glb_wpnts)
+        for s, d, vs, obstacles in sequence:
+            sim.set_pose(s, d, vs)
+            sim.set_obstacles(obstacles)
+            sim.tick()
+        print(sim.format_summary())
+    """
+
+    def __init__(self, params: Dict, state_machine_cls: Type[StateMachine] = StateMachine):
+        """
+        Args:
+            params (Dict): parameters keyed by their ROS name, e.g. from `load_params`
+            state_machine_cls (Type[StateMachine]): class of the replayed state machine, e.g. a subclass with other
+                conditions
+        """
+        self.params = dict(params)
+        self.state_machine_cls = state_machine_cls
+        self.state_machine = None
+        self.rate_hz = self.params["state_machine/rate"]
+        self.states: List[str] = []
+        self.latencies: List[float] = []
+
+    @property
+    def ready(self) -> bool:
+        return self.state_machine is not None and "pose" in self.state_machine.inputs
+
+    def set_global_waypoints(self, glb_wpnts: WpntArray, ot_wpnts: WpntArray = None):
+        """
+        Creates the state machine for the given global (scaled) waypoints. The overtaking and ftg zones are set from
+        the sector parameters, as the sector servers would do.
+        """
+        self.params["/global_republisher/track_length"] = glb_wpnts.wpnts[-1].s_m
+        sm = self.state_machine_cls("state_machine_sim", offline=True, params=self.params)
+        sm.glb_wpnts_cb(glb_wpnts)
+        sm.glb_wpnts_og_cb(glb_wpnts)
+        sm.overtake_cb(ot_wpnts if ot_wpnts is not None else glb_wpnts)
+
+        sectors = sm.sectors_params
+        sm.only_ftg_zones = [
+            [sectors[f"Sector{i}"]["start"], sectors[f"Sector{i}"]["end"]]
+            for i in range(sm.n_sectors)
+            if sectors[f"Sector{i}"].get("only_FTG", False)
+        ]
+        ot_sectors = sm.ot_sectors_params
+        sm.overtake_zones = [
+            [ot_sectors[f"Overtaking_sector{i}"]["start"], ot_sectors[f"Overtaking_sector{i}"]["end"]]
+            for i in range(sm.n_ot_sectors)
+            if ot_sectors[f"Overtaking_sector{i}"].get("ot_flag", False)
+        ]
+        sm.ot_begin_margin = ot_sectors.get("ot_sector_begin", sm.ot_begin_margin)
+        self.state_machine = sm
+
+    def set_pose(self, s: float, d: float, vs: float):
+        odom = Odometry()
+        odom.pose.pose.position.x = s
+        odom.pose.pose.position.y = d
+        odom.twist.twist.linear.x = vs
+        self.state_machine.frenet_pose_cb(odom)
+
+    def set_obstacles(self, obstacles: List, prediction: List = None):
+        """
+        Sets the perceived and optionally the predicted obstacles (lists of `f110_msgs.Obstacle`).
+        """
+        self.state_machine.obstacle_perception_cb(ObstacleArray(obstacles=list(obstacles)))
+        if prediction is not None:
+            self.state_machine.obstacle_prediction_cb(ObstacleArray(obstacles=list(prediction)))
+
+    def set_avoidance(self, avoidance: OTWpntArray):
+        self.state_machine.avoidance_cb(avoidance)
+
+    def tick(self):
+        """
+        Runs one iteration of the state machine loop and records the state and the latency.
+        """
+        start = time.perf_counter()
+        self.state_machine.loop()
+        self.latencies.append(time.perf_counter() - start)
+        self.states.append(self.state_machine.cur_state.value)
+
+    def run_bag(self, bag_path: str):
+        """
+        Replays a bag. Messages are fed to the callbacks in recorded order, and the loop is ticked at the state
+        machine rate on the recorded clock.
+        """
+        callbacks = {
+            "/car_state/odom_frenet": "frenet_pose_cb",
+            "/perception/obstacles": "obstacle_perception_cb",
+            "/collision_prediction/obstacles": "obstacle_prediction_cb",
+            "/planner/avoidance/otwpnts": "avoidance_cb",
+            "/planner/avoidance/merger": "merger_cb",
+            "/collision_prediction/force_trailing": "force_trailing_cb",
+            "/global_waypoints/overtaking": "overtake_cb",
+        }
+        period = 1.0 / self.rate_hz
+        next_tick = None
+        with rosbag.Bag(bag_path) as bag:
+            for topic, msg, t in bag.read_messages(topics=list(callbacks) + ["/global_waypoints_scaled"]):
+                if topic == "/global_waypoints_scaled":
+                    if self.state_machine is None:
+                        self.set_global_waypoints(msg)
+                    else:
+                        self.state_machine.glb_wpnts_cb(msg)
+                    continue
+                if self.state_machine is None:
+                    continue
+
+                # tick on the recorded clock, starting with the first message once the pose is known
+                if self.ready:
+                    t = t.to_sec()
+                    if next_tick is None:
+                        next_tick = t
+                    while t >= next_tick:
+                        self.tick()
+                        next_tick += period
+                getattr(self.state_machine, callbacks[topic])(msg)
+
+    def transitions(self) -> Counter:
+        """
+        Number of transitions between every pair of states.
+        """
+        return Counter((a, b) for a, b in zip(self.states[:-1], self.states[1:]) if a != b)
+
+    def dwell_times(self) -> Dict[str, np.ndarray]:
+        """
+        Durations in seconds of the uninterrupted stays in every state.
+        """
+        segments: List[Tuple[str, int]] = []
+        for state in self.states:
+            if segments and segments[-1][0] == state:
+                segments[-1] = (state, segments[-1][1] + 1)
+            else:
+                segments.append((state, 1))
+        dwell = {}
+        for state, n_ticks in segments:
+            dwell.setdefault(state, []).append(n_ticks / self.rate_hz)
+        return {state: np.array(durations) for state, durations in dwell.items()}
+
+    def format_summary(self) -> str:
+        lines = [f"ticks: {len(self.states)} ({len(self.states) / self.rate_hz:.1f} s of driving)"]
+        if self.latencies:
+            lat = 1e3 * np.array(self.latencies)
+            lines.append(
+                "latency [ms]: p50 {:.3f}, p90 {:.3f}, p99 {:.3f}, max {:.3f}".format(
+                    *np.percentile(lat, [50, 90, 99]), lat.max()
+                )
+            )
+        lines.append("dwell times [s]:")
+        for state, durations in self.dwell_times().items():
+            lines.append(
+                f"  {state:<10} total {durations.sum():8.2f}, visits {durations.shape[0]:5d}, "
+                f"mean {durations.mean():6.2f}, min {durations.min():6.2f}"
+            )
+        lines.append("transitions:")
+        for (a, b), count in sorted(self.transitions().items()):
+            lines.append(f"  {a:>10} -> {b:<10} {count:5d}")
+        return "\n".join(lines)
+
+
+def sweep(bag_path: str, map_name: str, overrides: Dict, name: str, values: Iterable) -> Dict:
+    """
+    Replays the bag once for every value of the parameter `name`.
+
+    Returns:
+        sims (Dict): maps the value to the finished `StateMachineSim`
+    """
+    sims = {}
+    for value in values:
+        sim = StateMachineSim(load_params(map_name, {**overrides, name: value}))
+        sim.run_bag(bag_path)
+        sims[value] = sim
+    return sims
+
+
+def _parse_value(value: str):
+    try:
+        return yaml.safe_load(value)
+    except yaml.YAMLError:
+        return value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a bag through the state machine in fast time.")
+    parser.add_argument("--bag", type=str, required=True, help="Path to the bag file")
+    parser.add_argument("--map", type=str, required=True, help="Map providing the sector parameters")
+    parser.add_argument("--ot_planner", type=str, default="predictive_spliner", help="Overtaking planner")
+    parser.add_argument("--set", type=str, nargs="*", default=[], help="Parameter overrides as name=value")
+    parser.add_argument("--sweep", type=str, default=None, help="Parameter sweep as name=value1,value2,...")
+    args = parser.parse_args()
+
+    overrides = {"ot_planner": args.ot_planner}
+    for item in args.set:
+        key, value = item.split("=", 1)
+        overrides[key] = _parse_value(value)
+
+    if args.sweep is None:
+        sim = StateMachineSim(load_params(args.map, overrides))
+        sim.run_bag(args.bag)
+        print(sim.format_summary())
+    else:
+        key, values = args.sweep.split("=", 1)
+        sims = sweep(args.bag, args.map, overrides, key, [_parse_value(v) for v in values.split(",")])
+        for value, sim in sims.items():
+            print(f"##### {key} = {value} #####")
+            print(sim.format_summary())
@@ -0,0 +1,148 @@
+from functools import cached_property
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class ObstacleArrays:
+    """
+    Array view of a list of `f110_msgs.Obstacle`. The gaps from the ego position are wrapped when first read.
+    """
+
+    def __init__(self, obstacles: List, cur_s: float, track_length: float, max_s: float):
+        """
+        Args:
+            obstacles (List): list of `f110_msgs.Obstacle`
+            cur_s (float): s coordinate of the ego
+            track_length (float): track length from the global republisher
+            max_s (float): s of the last global waypoint
+        """
+        # a flat list converts noticeably faster than a nested one
+        flat = []
+        for obs in obstacles:
+            flat += (obs.s_start, obs.s_center, obs.d_center, obs.is_static)
+        arr = np.array(flat, dtype=float).reshape(-1, 4)
+        self.n = arr.shape[0]
+        self.s_start = arr[:, 0]
+        self.s_center = arr[:, 1]
+        self.d_center = arr[:, 2]
+        self.is_static = arr[:, 3].astype(bool)
+        self._cur_s = cur_s
+        self._track_length = track_length
+        self._max_s = max_s
+
+    # the checks historically wrap either with the track length or with the s of the last waypoint
+    @cached_property
+    def gap_start(self) -> np.ndarray:
+        return (self.s_start - self._cur_s) % self._track_length
+
+    @cached_property
+    def gap_center(self) -> np.ndarray:
+        return (self.s_center - self._cur_s) % self._track_length
+
+    @cached_property
+    def gap_start_max_s(self) -> np.ndarray:
+        return (self.s_start - self._cur_s) % self._max_s
+
+    @cached_property
+    def gap_center_max_s(self) -> np.ndarray:
+        return (self.s_center - self._cur_s) % self._max_s
+
+
+class LineArrays:
+    """
+    Sorted array view of a list of `f110_msgs.Wpnt` for nearest-s queries.
+    """
+
+    def __init__(self, wpnts: List):
+        arr = np.array([[wpnt.s_m, wpnt.d_m] for wpnt in wpnts], dtype=float).reshape(-1, 2)
+        self.n = arr.shape[0]
+        self.s = arr[:, 0]
+        self.d = arr[:, 1]
+        self.order = np.argsort(self.s, kind="stable")
+        self.s_sorted = self.s[self.order]
+
+    def nearest(self, s: np.ndarray) -> np.ndarray:
+        """
+        Index of the waypoint closest in s to every query, ties resolved towards the lowest index like `np.argmin`.
+
+        Args:
+            s (np.ndarray): query s coordinates
+
+        Returns:
+            idx (np.ndarray): indices into the original waypoint list
+        """
+        s = np.asarray(s, dtype=float)
+        pos = np.searchsorted(self.s_sorted, s, side="left")
+        right = np.minimum(pos, self.n - 1)
+        left = np.maximum(pos - 1, 0)
+        # move the left candidate to the first of its group of equal s, such that both candidates are the lowest
+        # original index among waypoints with the same s
+        left = np.searchsorted(self.s_sorted, self.s_sorted[left], side="left")
+        dist_left = np.abs(self.s_sorted[left] - s)
+        dist_right = np.abs(self.s_sorted[right] - s)
+        # stable sorting keeps equal s in original order, so the group start holds the lowest original index
+        idx_left = self.order[left]
+        idx_right = self.order[right]
+        take_left = (dist_left < dist_right) | ((dist_left == dist_right) & (idx_left < idx_right))
+        return np.where(take_left, idx_left, idx_right)
+
+
+class TickContext:
+    """
+    Per-tick view of the state machine inputs used by the `_check_*` conditions.
+
+    It is built once at the top of `StateMachine.loop`, so that all conditions of a transition are vectorized queries
+    on the same arrays instead of walking the obstacle lists again. The obstacle arrays are only converted when a
+    condition of the transition first asks for them. Waypoint lines (avoidance, frenet and local waypoints) are
+    converted lazily as well and cached by identity, since the avoidance line can be updated by
+    `_check_availability_splini_wpts` during the transition.
+    """
+
+    def __init__(
+        self,
+        cur_s: float,
+        track_length: float,
+        max_s: float,
+        obstacles: List,
+        obstacles_perception: List,
+        obstacles_prediction: List,
+    ):
+        self.cur_s = cur_s
+        self._track_length = track_length
+        self._max_s = max_s
+        self._obstacles = obstacles
+        self._obstacles_perception = obstacles_perception
+        self._obstacles_prediction = obstacles_prediction
+        self._lines = {}
+
+    @cached_property
+    def obstacles(self) -> ObstacleArrays:
+        return ObstacleArrays(self._obstacles, self.cur_s, self._track_length, self._max_s)
+
+    @cached_property
+    def perception(self) -> ObstacleArrays:
+        return ObstacleArrays(self._obstacles_perception, self.cur_s, self._track_length, self._max_s)
+
+    @cached_property
+    def prediction(self) -> ObstacleArrays:
+        return ObstacleArrays(self._obstacles_prediction, self.cur_s, self._track_length, self._max_s)
+
+    def line(self, name: str, wpnts: Optional[List]) -> Optional[LineArrays]:
+        """
+        Array view of the waypoint list `wpnts`, converted once per tick and per list object.
+
+        Args:
+            name (str): cache key of the line, e.g. "avoidance"
+            wpnts (Optional[List]): list of `f110_msgs.Wpnt`
+
+        Returns:
+            line (Optional[LineArrays]): None if `wpnts` is None
+        """
+        if wpnts is None:
+            return None
+        cached: Optional[Tuple[List, LineArrays]] = self._lines.get(name)
+        if cached is None or cached[0] is not wpnts:
+            cached = (wpnts, LineArrays(wpnts))
+            self._lines[name] = cached
+        return cached[1]
@@ -0,0 +1,42 @@
+from typing import Dict, List
+
+import numpy as np
+
+
+class WpntOverlay:
+    """
+    Read-only view of the global waypoints with the avoidance waypoints spliced in.
+
+    Instead of copying the full global waypoint list every tick, only the mapping from the patched global indices to
+    the avoidance waypoints is stored. Messages are materialized for the requested horizon only, such that the cost
+    depends on the number of local waypoints and on the length of the avoidance patch, not on the track length.
+    """
+
+    def __init__(self, glb_wpnts: List, avoidance_wpnts: List = None, patch_idxs: np.ndarray = None):
+        """
+        Args:
+            glb_wpnts (List): global waypoints, which are not modified
+            avoidance_wpnts (List): avoidance waypoints spliced into the global waypoints
+            patch_idxs (np.ndarray): global index overwritten by the i-th patch entry. Entries beyond the avoidance
+                waypoints repeat the last avoidance waypoint and later entries win over earlier ones, like sequential
+                assignment into a copied list.
+        """
+        self.glb_wpnts = glb_wpnts
+        self.patch: Dict[int, object] = {}
+        if avoidance_wpnts is not None and patch_idxs is not None and len(avoidance_wpnts) > 0:
+            avoid_idxs = np.minimum(np.arange(len(patch_idxs)), len(avoidance_wpnts) - 1)
+            self.patch = {int(g): avoidance_wpnts[i] for g, i in zip(patch_idxs, avoid_idxs)}
+
+    def __len__(self) -> int:
+        return len(self.glb_wpnts)
+
+    def __getitem__(self, idx: int):
+        wpnt = self.patch.get(idx)
+        return wpnt if wpnt is not None else self.glb_wpnts[idx]
+
+    def horizon(self, start: int, n: int) -> List:
+        """
+        Materializes `n` waypoints starting at global index `start`, wrapping around the track.
+        """
+        n_glb = len(self.glb_wpnts)
+        return [self[(start + i) % n_glb] for i in range(n)]
@@ -1,35 +1,26 @@
 import numpy as np
 import rospkg
 
-def find_nearest(array, value):
-    # array = np.asarray(array)
-    idx = (np.abs(array - value)).argmin()
-    return array[idx], idx
-
-def find_closest_neighbors(array, value):
-    # index of first nan
-    is_nan_array = np.argwhere(np.isnan(array))
-    if len(is_nan_array) > 0:
-      first_nan = is_nan_array[0][0]
-      array = array[0:first_nan]
-    closest, closest_idx = find_nearest(array, value)
-    if closest_idx == 0:
-        return array[0], 0, array[0], 0
-    elif closest_idx == (len(array) - 1):
-        return array[closest_idx], closest_idx, array[closest_idx], closest_idx
-    else:
-      second_closest, second_idx = \
-        find_nearest(array[[max(closest_idx-1, 0), 
-        min(closest_idx+1, len(array)-1)]], value)
-      second_idx = -1 + closest_idx + 2 * second_idx
-      return closest, closest_idx, second_closest, second_idx
-
 
 class LookupSteerAngle:
     """
     LookupSteerAngle:
+
+    The lookup table csv holds the lateral acceleration for every steering angle (first column) and velocity (first
+    row). It is inverted once at load time into a regular grid of steering angles over the lateral acceleration and the
+    velocity, such that a lookup is constant time index arithmetic with bilinear interpolation.
+
+    The acceleration axis of every velocity column is normalized by the saturation acceleration of the column, i.e. the
+    highest acceleration before the NaN entries of the csv. Accelerations beyond the saturation are filled with the
+    saturation steering angle.
     """
-    def __init__(self, model_name, logger):
+    def __init__(self, model_name, logger, n_accel=2048):
+      """
+      Args:
+          model_name (str): name of the lookup table without "_lookup_table.csv"
+          logger: logging function
+          n_accel (int): number of grid points along the normalized acceleration axis
+      """
       rospack = rospkg.RosPack()
       path = rospack.get_path('steering_lookup')
       file_path = path + '/cfg/' + model_name + '_lookup_table.csv'
@@ -38,10 +29,47 @@ class LookupSteerAngle:
       except IOError:
         raise IOError("Lookup table not found at " + file_path + ". Please check the file path.")
       self.logger = logger
+      self._build_grid(n_accel)
+
+    def _build_grid(self, n_accel):
+      """
+      Inverts the lookup table into the grid `steer_grid[velocity idx, normalized acceleration idx]`.
+      """
+      lu_vs = self.lu[0, 1:]
+      lu_steers = self.lu[1:, 0]
+      lu_accels = self.lu[1:, 1:]
+      if lu_vs.shape[0] < 2 or not np.allclose(np.diff(lu_vs), lu_vs[1] - lu_vs[0]):
+        raise ValueError("Velocities of the lookup table must be equally spaced.")
+
+      self.n_vs = lu_vs.shape[0]
+      self.n_accel = n_accel
+      self.v_min = lu_vs[0]
+      self.dv = lu_vs[1] - lu_vs[0]
+      # saturation acceleration of every velocity column, entries after it are NaN
+      self.accel_max = np.maximum(np.nanmax(lu_accels, axis=0), np.finfo(float).eps)
+
+      accel_axis = np.linspace(0.0, 1.0, n_accel)
+      self.steer_grid = np.empty((self.n_vs, n_accel))
+      for j in range(self.n_vs):
+        valid = ~np.isnan(lu_accels[:, j])
+        self.steer_grid[j] = np.interp(accel_axis * self.accel_max[j], lu_accels[valid, j], lu_steers[valid])
+
+    def _column_steer(self, accel, v_idx):
+      u = min(accel / self.accel_max[v_idx], 1.0) * (self.n_accel - 1)
+      a_idx = min(int(u), self.n_accel - 2)
+      w = u - a_idx
+      return self.steer_grid[v_idx, a_idx] * (1.0 - w) + self.steer_grid[v_idx, a_idx + 1] * w
 
     def lookup_steer_angle(self, accel, vel):
         """
         lookup_steer_angle:
+
+        Args:
+            accel (float): lateral acceleration, the sign is applied to the steering angle
+            vel (float): velocity, clipped to the velocities of the lookup table
+
+        Returns:
+            steer_angle (float): steering angle
         """
         if accel > 0.0:
           sign_accel = 1.0
@@ -49,26 +77,45 @@ class LookupSteerAngle:
           sign_accel = -1.0
         # lookup only for positive accelerations
         accel = abs(accel)
-        lu_vs = self.lu[0, 1:]
-        lu_steers = self.lu[1:, 0]
-        
+
         #if (vel > lu_vs[-1]):
         # self.logger(5, "Velocity exceeds lookup table, generating steering angle for v :" + str(lu_vs[-1]))
 
-        # find closest velocities to vel
-        c_v, c_v_idx = find_nearest(lu_vs, vel)
+        t = min(max((vel - self.v_min) / self.dv, 0.0), self.n_vs - 1.0)
+        v_idx = min(int(t), self.n_vs - 2)
+        w = t - v_idx
+        steer_angle = self._column_steer(accel, v_idx) * (1.0 - w) + self._column_steer(accel, v_idx + 1) * w
+        return float(steer_angle) * sign_accel
+
+    def lookup_steer_angles(self, accels, vels):
+        """
+        Vectorized `lookup_steer_angle`, e.g. for the steering angles over a whole prediction horizon.
+
+        Args:
+            accels (np.ndarray): lateral accelerations
+            vels (np.ndarray): velocities, broadcast against `accels`
+
+        Returns:
+            steer_angles (np.ndarray): steering angles
+        """
+        accels, vels = np.broadcast_arrays(np.asarray(accels, dtype=float), np.asarray(vels, dtype=float))
+        sign_accel = np.where(accels > 0.0, 1.0, -1.0)
+        accels = np.abs(accels)
+
+        t = np.clip((vels - self.v_min) / self.dv, 0.0, self.n_vs - 1.0)
+        v_idx = np.minimum(t.astype(int), self.n_vs - 2)
+        w = t - v_idx
 
-        # find two closest accelerations to accel
-        c_a, c_a_idx, s_a, s_a_idx = find_closest_neighbors(self.lu[1:, c_v_idx + 1], accel)
-        if c_a_idx == s_a_idx:
-          steer_angle = lu_steers[c_a_idx]
-        else :
-          # interpolate between two closest accelerations to find steering angle
-          steer_angle = np.interp(accel, [c_a, s_a], [lu_steers[c_a_idx], lu_steers[s_a_idx]])
-        return steer_angle * sign_accel
+        steer_angles = np.zeros(accels.shape)
+        for col, col_w in ((v_idx, 1.0 - w), (v_idx + 1, w)):
+          u = np.minimum(accels / self.accel_max[col], 1.0) * (self.n_accel - 1)
+          a_idx = np.minimum(u.astype(int), self.n_accel - 2)
+          a_w = u - a_idx
+          steer_angles += col_w * (self.steer_grid[col, a_idx] * (1.0 - a_w) + self.steer_grid[col, a_idx + 1] * a_w)
+        return steer_angles * sign_accel
 
 # test case
 if __name__ == "__main__":
   detective =  LookupSteerAngle("NUC1_pacejka", print)
   steer_angle = detective.lookup_steer_angle(9, 7)
-  print(steer_angle)
\ No newline at end of file
+  print(steer_angle)